@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.inotify
+@file mi/core/inotify.py
+@author agent
+@brief Minimal ctypes binding to the Linux inotify API
+
+Used by the directory harvesters to be told when files are created or
+written instead of listing the directory on every polling interval.  Only
+the calls the harvesters need are wrapped.  On systems without inotify
+Inotify() raises InotifyUnavailable and callers fall back to polling.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from mi.core.log import get_logger ; log = get_logger()
+
+# event masks from <sys/inotify.h>
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event header: wd, mask, cookie, len
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 65536
+
+_libc = None
+
+
+class InotifyUnavailable(Exception):
+    """
+    inotify is not supported on this system or could not be initialized
+    """
+    pass
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError as e:
+            raise InotifyUnavailable("unable to load libc: %s" % e)
+        if not hasattr(libc, 'inotify_init1'):
+            raise InotifyUnavailable("libc does not provide inotify")
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+def inotify_available():
+    """
+    @retval True if an inotify instance can be created on this system
+    """
+    try:
+        Inotify().close()
+    except InotifyUnavailable:
+        return False
+    return True
+
+
+class InotifyEvent(object):
+    """
+    One event read from an inotify instance.  name is the file name relative
+    to the watched directory, or '' for events on the watch itself.
+    """
+    __slots__ = ('wd', 'mask', 'cookie', 'name')
+
+    def __init__(self, wd, mask, cookie, name):
+        self.wd = wd
+        self.mask = mask
+        self.cookie = cookie
+        self.name = name
+
+    def __repr__(self):
+        return "InotifyEvent(wd=%d, mask=0x%x, cookie=%d, name=%r)" % (
+            self.wd, self.mask, self.cookie, self.name)
+
+
+class Inotify(object):
+    """
+    A non blocking inotify instance.
+    """
+    def __init__(self):
+        libc = _get_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise InotifyUnavailable("inotify_init1 failed: %s" % os.strerror(err))
+        self._fd = fd
+        self._libc = libc
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """
+        Watch a path for the given events.
+        @param path The file or directory to watch
+        @param mask The IN_* events to report
+        @retval The watch descriptor
+        @throws OSError if the watch could not be added
+        """
+        wd = self._libc.inotify_add_watch(self._fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self, timeout=None):
+        """
+        Wait for events and read all that are queued.
+        @param timeout Maximum seconds to wait for an event, None to block
+        @retval A list of InotifyEvent, empty if the timeout expired
+        """
+        try:
+            (readable, writable, errored) = select.select([self._fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        events = []
+        offset = 0
+        header_size = EVENT_HEADER.size
+        while offset + header_size <= len(data):
+            (wd, mask, cookie, length) = EVENT_HEADER.unpack_from(data, offset)
+            offset += header_size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -11,6 +11,8 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+from collections import deque
+
 from mi.core.log import get_logger ; log = get_logger()
 
 from mi.core.exceptions import SampleException
@@ -38,9 +40,16 @@ class Chunker(object):
             buffer[start_index:end_index] to properly describe the data block.
             If no data is present, return and empty list. If multiple data
             blocks are found, the returned list will contain multiple tuples,
-            IN SEQUENTIAL ORDER and WITHOUT OVERLAP.
+            IN SEQUENTIAL ORDER and WITHOUT OVERLAP. A resumable sieve (see
+            IncrementalSieve) also reports how far it has scanned so the
+            next pass can start there.
         """
         self.sieve = data_sieve_fn
+
+        # Buffer index before which no data chunk can start, as reported
+        # by a resumable sieve. Sieving resumes from here or from the end
+        # of the last data chunk, whichever is later.
+        self._scan_index = 0
         
         self.raw_chunk_list = []
         self.data_chunk_list = []
@@ -133,7 +142,10 @@ class Chunker(object):
         """
         log.debug("Generating data lists with start index %s", start_index)
         return_list = {'data_chunk_list':[], 'non_data_chunk_list':[]}
-        result = self.sieve(self.buffer[start_index:])
+        scan_index = max(start_index, self._scan_index)
+        (result, scanned) = self._run_sieve(self.buffer[scan_index:])
+        if scanned:
+            self._scan_index = scan_index + scanned
         # assert no overlap!
         if (self.overlaps(result)):
             raise SampleException("Overlapping blocks in sieve list: %s" % result)
@@ -141,7 +153,8 @@ class Chunker(object):
         result.sort()
 
         # rebase to buffer coordinates
-        return_list['data_chunk_list'] = [(s+start_index, e+start_index) for (s, e) in result]
+        result = [(s+scan_index, e+scan_index) for (s, e) in result]
+        return_list['data_chunk_list'] = list(result)
         return_list['data_chunk_list'] = self.add_timestamps(return_list['data_chunk_list'])
         # Look up the timestamps from the old list - could be made more efficient
         
@@ -151,9 +164,6 @@ class Chunker(object):
                                                        timestamp))
         previous_end = start_index
         for (s, e) in result:
-            # rebase to buffer as long as we are walking through
-            s += start_index
-            e += start_index
             assert(s >= previous_end)
             if (s == previous_end):
                 previous_end = e
@@ -164,6 +174,21 @@ class Chunker(object):
         return_list['non_data_chunk_list'] = self.add_timestamps(return_list['non_data_chunk_list'])
         log.debug("Generated return list: %s", return_list)
         return return_list    
+
+    def _run_sieve(self, raw_data):
+        """
+        Run the sieve over a section of the buffer.
+
+        @param raw_data The section of the buffer to sieve
+        @retval A tuple of (chunk_list, scanned). scanned is the index in
+            raw_data before which no data chunk can start; it is always 0
+            for a plain sieve function, which is re-run from the end of the
+            last data chunk each time.
+        """
+        resume = getattr(self.sieve, 'resume', None)
+        if resume is None:
+            return (self.sieve(raw_data), 0)
+        return resume(raw_data)
     
     def add_timestamps(self, start_end_list):
         """
@@ -183,21 +208,31 @@ class Chunker(object):
             # simple case if it already has a timestamp
             if (len(item) == 3):
                 result_list.append(item)
-                break
+                continue
             elif (len(item) == 2):
                 (s, e) = (item[0], item[1])
             else:
                 raise SampleException("Invalid pair encountered!")
-                
-            for (raw_s, raw_e, raw_t) in self.raw_chunk_list:
-                if (s >= raw_e):
-                    continue
-                else:
-                    result_list.append((s, e, raw_t))
-                    break
+
+            timestamp = self._timestamp_for(s)
+            if timestamp is not None:
+                result_list.append((s, e, timestamp))
                     
         log.trace("add_timestamp returning result_list: %s", result_list)
         return result_list
+
+    def _timestamp_for(self, index):
+        """
+        Find the timestamp of the first raw chunk that ends after a buffer
+        index, i.e. the raw chunk the index falls in.
+
+        @param index A buffer index
+        @retval The raw chunk timestamp, None if the index is past the end
+        """
+        for (raw_s, raw_e, raw_t) in self.raw_chunk_list:
+            if index < raw_e:
+                return raw_t
+        return None
     
     @staticmethod
     def overlaps(data_list):
@@ -305,6 +340,9 @@ class Chunker(object):
         """
         new_nondata_list = []
 
+        # data chunks go back to being non-data, so they must be sieved again
+        self._scan_index = 0
+
         log.debug("Cleaning data chunk, data_chunk_list: %s, nondata_chunk_list: %s",
                   self.data_chunk_list, self.nondata_chunk_list)
 
@@ -335,6 +373,8 @@ class Chunker(object):
             self.buffer = self.buffer[end_index:]
         else:
             self.buffer[0:end_index] = []
+
+        self._scan_index = max(self._scan_index - end_index, 0)
         
     def get_next_non_data_with_index(self, clean=True):
         """
@@ -454,6 +494,54 @@ class Chunker(object):
     
         return return_list
 
+
+
+class IncrementalSieve(object):
+    """
+    Wraps a sieve function in the resumable sieve protocol used by the
+    chunkers. A resumable sieve has a resume(raw_data) method returning a
+    tuple of (chunk_list, scanned), where scanned is the index in raw_data
+    before which no data chunk can start, no matter what data arrives
+    later. The chunker remembers that point and starts the next pass there,
+    so a long stretch of non-data or a partial record is not re-scanned
+    every time a packet comes in.
+
+    A plain sieve function only guarantees that for the end of the last
+    chunk it found. When the largest record it can match is known, every
+    position that still leaves room for a whole record has been ruled out
+    as well. Calling the wrapper directly behaves like the wrapped function,
+    so it can be used anywhere a sieve function is expected:
+    StringChunker(IncrementalSieve(Protocol.sieve_function, max_record_size=128))
+    """
+    def __init__(self, sieve_fn, max_record_size=None):
+        """
+        @param sieve_fn A sieve function as described in Chunker.__init__
+        @param max_record_size The length of the longest data chunk the sieve
+            function can return. If None, only the data chunks found are
+            skipped on the next pass.
+        """
+        self.sieve_fn = sieve_fn
+        self.max_record_size = max_record_size
+
+    def __call__(self, raw_data):
+        return self.sieve_fn(raw_data)
+
+    def resume(self, raw_data):
+        """
+        @param raw_data The section of the buffer to sieve
+        @retval A tuple of (chunk_list, scanned)
+        """
+        result = self.sieve_fn(raw_data)
+
+        scanned = 0
+        for (s, e) in result:
+            scanned = max(scanned, e)
+
+        if self.max_record_size is not None:
+            scanned = max(scanned, len(raw_data) - self.max_record_size + 1)
+
+        return (result, scanned)
+
     
 class StringChunker(Chunker):
     """
@@ -473,4 +561,329 @@ class BinaryChunker(Chunker):
     def __init__(self, data_sieve_fn):
         Chunker.__init__(self, data_sieve_fn)
         self.buffer = []
-    
\ No newline at end of file
+    
+
+def _relative_chunk_list(attr):
+    """
+    Build a property that exposes one of the RingBufferChunker index deques
+    as a list of (start, end, timestamp) tuples relative to the live buffer,
+    the way the list based chunkers store them.
+    @param attr The name of the deque attribute holding absolute indices
+    """
+    def getter(self):
+        return self._relative(getattr(self, attr))
+
+    def setter(self, chunk_list):
+        setattr(self, attr, self._absolute(chunk_list))
+
+    return property(getter, setter)
+
+
+class RingBufferChunker(Chunker):
+    """
+    A version of the string chunker that stores its data in a growable
+    bytearray with a moving base offset instead of an immutable string.
+    Chunk indices are kept in deques in absolute stream coordinates, so
+    adding data never re-copies the buffer and consuming a chunk only moves
+    the base offset forward and pops finished entries off the index deques.
+
+    It produces exactly the same chunks and timestamps as StringChunker, so
+    a protocol or parser selects it simply by constructing it instead:
+    self._chunker = RingBufferChunker(Protocol.sieve_function)
+    """
+    # Consumed bytes in front of the live window are only released once
+    # there are at least this many of them and they make up at least half of
+    # the backing array, which keeps compaction amortized O(1) per byte.
+    COMPACT_SIZE = 65536
+
+    def __init__(self, data_sieve_fn):
+        self._ring = bytearray()
+        self._head = 0
+        self._base = 0
+        self._raw_chunks = deque()
+        self._data_chunks = deque()
+        self._nondata_chunks = deque()
+        Chunker.__init__(self, data_sieve_fn)
+
+    def _get_buffer(self):
+        return str(self._ring[self._head:])
+
+    def _set_buffer(self, value):
+        self._ring = bytearray(value or "")
+        self._head = 0
+        self._scan_index = self._base
+
+    buffer = property(_get_buffer, _set_buffer)
+    raw_chunk_list = _relative_chunk_list('_raw_chunks')
+    data_chunk_list = _relative_chunk_list('_data_chunks')
+    nondata_chunk_list = _relative_chunk_list('_nondata_chunks')
+
+    def _relative(self, chunks):
+        base = self._base
+        return [(s - base, e - base, t) for (s, e, t) in chunks]
+
+    def _absolute(self, chunk_list):
+        base = self._base
+        return deque([(s + base, e + base, t) for (s, e, t) in chunk_list])
+
+    def _end(self):
+        """
+        @retval The absolute stream offset one past the last buffered byte
+        """
+        return self._base + len(self._ring) - self._head
+
+    def _slice(self, start, end):
+        """
+        @retval The buffered data between two absolute offsets as a string
+        """
+        head = self._head - self._base
+        return str(self._ring[head + max(start, self._base):head + end])
+
+    def add_chunk(self, raw_data, timestamp):
+        """
+        Adds a chunk of data to the end of the buffer and sieves everything
+        after the last known data chunk. See Chunker.add_chunk.
+
+        @param raw_data The raw data as a string
+        @param timestamp The time (in NTP4 float format) that the data was
+            collected at the port agent
+        """
+        assert isinstance(timestamp, float)
+        start_index = self._end()
+
+        if self._data_chunks:
+            last_data_index = self._data_chunks[-1][1]
+        else:
+            last_data_index = self._base
+
+        self._ring.extend(raw_data)
+        self._raw_chunks.append((start_index, start_index + len(raw_data), timestamp))
+
+        (data_chunks, nondata_chunks) = self._sieve_from(timestamp, last_data_index)
+
+        for (s, e, t) in data_chunks:
+            self._data_chunks.append((s, e, t))
+            # remove first fragment part from non-data if we completed a fragment
+            self._remove_nondata_starting_at(s)
+
+        if nondata_chunks:
+            self._splice_nondata(nondata_chunks)
+
+        log.debug("Added chunk, data chunks: %s, nondata chunks: %s",
+                  self._data_chunks, self._nondata_chunks)
+
+    def _remove_nondata_starting_at(self, start):
+        """
+        Drop the non-data entry that starts at an absolute offset, if any.
+        Entries are in order, so only the tail of the deque is examined.
+        """
+        for index in xrange(len(self._nondata_chunks) - 1, -1, -1):
+            nd_start = self._nondata_chunks[index][0]
+            if nd_start == start:
+                del self._nondata_chunks[index]
+                return
+            if nd_start < start:
+                return
+
+    def _splice_nondata(self, nondata_chunks):
+        """
+        Splice newly found non-data blocks onto the non-data deque. The
+        first new block is merged into the existing block it touches, which
+        keeps its start and timestamp, exactly as Chunker.add_chunk does.
+        """
+        if not self._nondata_chunks:
+            self._nondata_chunks.extend(nondata_chunks)
+            return
+
+        (first_new_s, first_new_e, first_new_t) = nondata_chunks[0]
+        merged = None
+        while self._nondata_chunks and self._nondata_chunks[-1][1] >= first_new_s:
+            merged = self._nondata_chunks.pop()
+
+        if merged is not None:
+            self._nondata_chunks.append((merged[0], first_new_e, merged[2]))
+            nondata_chunks = nondata_chunks[1:]
+
+        self._nondata_chunks.extend(nondata_chunks)
+
+    def _sieve_from(self, timestamp, start_index):
+        """
+        Sieve the buffer from an absolute offset, or from where a resumable
+        sieve left off if that is later, to the end.
+
+        @param timestamp The timestamp to use for a non-data chunk that is
+            being entered for the first time
+        @param start_index The absolute offset to start sieving from
+        @retval A tuple of (data_chunks, nondata_chunks), each a list of
+            (start, end, timestamp) tuples in absolute offsets
+        """
+        scan_index = max(start_index, self._scan_index)
+        (result, scanned) = self._run_sieve(self._slice(scan_index, self._end()))
+        if scanned:
+            self._scan_index = scan_index + scanned
+        # assert no overlap!
+        if (self.overlaps(result)):
+            raise SampleException("Overlapping blocks in sieve list: %s" % result)
+        # sort to protect us from some sloppy sieve code
+        result.sort()
+
+        if result == []:
+            return ([], [(start_index, self._end(), timestamp)])
+
+        data_chunks = []
+        nondata_chunks = []
+        previous_end = start_index
+        for (s, e) in result:
+            s += scan_index
+            e += scan_index
+            assert(s >= previous_end)
+            if (s > previous_end):
+                self._append_with_timestamp(nondata_chunks, previous_end, s)
+            self._append_with_timestamp(data_chunks, s, e)
+            previous_end = e
+
+        return (data_chunks, nondata_chunks)
+
+    def _append_with_timestamp(self, chunk_list, start, end):
+        """
+        Append (start, end, timestamp) to a list, taking the timestamp of
+        the raw chunk that holds the start offset.
+        """
+        timestamp = self._raw_timestamp(start)
+        if timestamp is not None:
+            chunk_list.append((start, end, timestamp))
+
+    def _raw_timestamp(self, offset):
+        """
+        @param offset An absolute offset
+        @retval The timestamp of the raw chunk holding the offset, None if
+            the offset is past the end of the buffer
+        """
+        for (raw_s, raw_e, raw_t) in self._raw_chunks:
+            if offset < raw_e:
+                return raw_t
+        return None
+
+    def _timestamp_for(self, index):
+        return self._raw_timestamp(self._base + index)
+
+    def _generate_data_lists(self, timestamp, start_index=0):
+        """
+        List based view of the sieve results. See Chunker._generate_data_lists.
+        """
+        (data_chunks, nondata_chunks) = self._sieve_from(timestamp,
+                                                         self._base + start_index)
+        return {'data_chunk_list': self._relative(data_chunks),
+                'non_data_chunk_list': self._relative(nondata_chunks)}
+
+    @staticmethod
+    def _trim_chunks(chunks, end_index):
+        """
+        Drop or shorten the entries at the front of a chunk deque that lie
+        before an absolute offset. Same result as Chunker._clean_chunk_list,
+        without touching the entries that are still whole.
+        """
+        while chunks and chunks[0][0] < end_index:
+            (s, e, t) = chunks[0]
+            if e > end_index:
+                chunks[0] = (end_index, e, t)
+                return
+            chunks.popleft()
+
+    def _consume(self, end_index):
+        """
+        Release the buffer up to an absolute offset by moving the base
+        offset, compacting the backing array only occasionally.
+        """
+        self._head += end_index - self._base
+        self._base = end_index
+        if self._head >= self.COMPACT_SIZE and self._head * 2 >= len(self._ring):
+            del self._ring[:self._head]
+            self._head = 0
+
+    def _consume_through(self, end_index):
+        self._trim_chunks(self._raw_chunks, end_index)
+        self._trim_chunks(self._data_chunks, end_index)
+        self._trim_chunks(self._nondata_chunks, end_index)
+        self._consume(end_index)
+
+    def get_next_data_with_index(self, clean=True):
+        """
+        See Chunker.get_next_data_with_index
+        """
+        if not self._data_chunks:
+            return (None, None, None, None)
+
+        if clean:
+            (next_start, next_end, timestamp) = self._data_chunks.popleft()
+        else:
+            (next_start, next_end, timestamp) = self._data_chunks[0]
+
+        base = self._base
+        next_block = self._slice(next_start, next_end)
+
+        if clean:
+            self._consume_through(next_end)
+
+        return (timestamp, next_block, next_start - base, next_end - base)
+
+    def get_next_non_data_with_index(self, clean=True):
+        """
+        See Chunker.get_next_non_data_with_index
+        """
+        if not self._nondata_chunks:
+            return (None, None, None, None)
+
+        if clean:
+            (next_start, next_end, next_time) = self._nondata_chunks.popleft()
+        else:
+            (next_start, next_end, next_time) = self._nondata_chunks[0]
+
+        base = self._base
+        next_block = self._slice(next_start, next_end)
+
+        if clean:
+            self._consume_through(next_end)
+
+        return (next_time, next_block, next_start - base, next_end - base)
+
+    def get_next_raw(self, clean=True):
+        """
+        See Chunker.get_next_raw. Consuming raw data hands data fragments back
+        to the non-data list (Chunker._clean_data_list); that is rarely used,
+        so it is done by replaying the StringChunker bookkeeping on a copy of
+        the index lists.
+        """
+        if not self._raw_chunks:
+            return (None, None)
+
+        if not clean:
+            (next_start, next_end, next_time) = self._raw_chunks[0]
+            return (next_time, self._slice(next_start, next_end))
+
+        shadow = StringChunker(self.sieve)
+        shadow.buffer = self.buffer
+        shadow.raw_chunk_list = self.raw_chunk_list
+        shadow.data_chunk_list = self.data_chunk_list
+        shadow.nondata_chunk_list = self.nondata_chunk_list
+
+        result = shadow.get_next_raw(clean)
+        self._consume(self._end() - len(shadow.buffer))
+
+        self.raw_chunk_list = shadow.raw_chunk_list
+        self.data_chunk_list = shadow.data_chunk_list
+        self.nondata_chunk_list = shadow.nondata_chunk_list
+        self._scan_index = self._base
+        return result
+
+    def _clean_buffer(self, end_index):
+        """
+        Clean up the buffer only, leaving the chunk lists where they are
+        relative to the buffer. See Chunker._clean_buffer.
+        @param end_index the last index used...clean up to here
+        """
+        chunk_lists = (self.raw_chunk_list, self.data_chunk_list,
+                       self.nondata_chunk_list)
+        self._consume(min(self._base + end_index, self._end()))
+        (self.raw_chunk_list, self.data_chunk_list,
+         self.nondata_chunk_list) = chunk_lists
@@ -14,7 +14,7 @@ __license__ = 'Apache 2.0'
 import time
 import copy
 import ntplib
-import base64
+import binascii
 import logging
 from warnings import warn
 try:
@@ -58,6 +58,147 @@ class DataParticleValue(BaseEnum):
     INVALID = "invalid"
     QUESTIONABLE = "questionable"
     
+def _encode_float(value):
+    """
+    Encode a float as json.dumps does
+    """
+    if value - value == 0.0:
+        return repr(value)
+    if value != value:
+        return 'NaN'
+    if value > 0:
+        return 'Infinity'
+    return '-Infinity'
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+# JSON encoders for the value types particles normally carry; anything else
+# goes through json.dumps.
+_VALUE_ENCODERS = {
+    float: _encode_float,
+    int: int.__repr__,
+    long: str,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    str: _encode_string,
+    unicode: _encode_string,
+}
+
+_OPTIONAL_TIMESTAMPS = frozenset([DataParticleKey.PORT_TIMESTAMP,
+                                  DataParticleKey.INTERNAL_TIMESTAMP])
+
+
+class ParticleTemplate(object):
+    """
+    Writes the particles of one class straight to JSON. Each distinct set of
+    header keys and list of value ids a class produces is compiled once into
+    a format string with the keys, value ids and punctuation already
+    encoded, so a particle is written by encoding its header and data values
+    and filling in the format. The output decodes to the same structure as
+    generate_dict().
+
+    Particles whose values carry keys other than value_id, value and binary,
+    or value ids that aren't strings, are written with json.dumps instead,
+    as are particles with a new
+    signature once MAX_FORMATS formats have been compiled, so a class whose
+    value ids vary from particle to particle can't grow the cache without
+    bound.
+    """
+    MAX_FORMATS = 64
+
+    def __init__(self, particle_class):
+        self.particle_class = particle_class
+        self._formats = {}
+
+    def _compile(self, signature):
+        """
+        @param signature (header keys, value ids) where a value id is a
+        (value id, binary flag) tuple for values with a binary flag
+        @retval Format string taking the encoded header values, the encoded
+        stream name and the encoded data values
+        """
+        (header_keys, value_ids) = signature
+        header = ['%s: %%s' % _encode_string(key).replace('%', '%%')
+                  for key in header_keys + (DataParticleKey.STREAM_NAME,)]
+
+        items = []
+        for value_id in value_ids:
+            binary = None
+            if isinstance(value_id, tuple):
+                (value_id, binary) = value_id
+            item = '{"%s": %s, "%s": %%s' % (DataParticleKey.VALUE_ID,
+                                             _encode_string(value_id).replace('%', '%%'),
+                                             DataParticleKey.VALUE)
+            if binary is not None:
+                item += ', "%s": %s' % (DataParticleKey.BINARY, json.dumps(binary))
+            items.append(item + '}')
+
+        return '{%s, "%s": [%s]}' % (', '.join(header), DataParticleKey.VALUES,
+                                     ', '.join(items))
+
+    def serialize(self, particle):
+        """
+        @param particle A particle of this template's class
+        @retval The particle as a JSON string
+        @throws SampleException as generate_dict
+        """
+        if not particle._check_preferred_timestamps():
+            raise SampleException("Preferred timestamp not in particle!")
+
+        particle._encoding_errors = []
+        values = particle._build_parsed_values()
+        encoders = _VALUE_ENCODERS
+
+        header_keys = []
+        encoded = []
+        for (key, value) in particle.contents.iteritems():
+            # Optional timestamps are left out when not set, as
+            # _build_base_structure does
+            if not value and key in _OPTIONAL_TIMESTAMPS:
+                continue
+            header_keys.append(key)
+            encoder = encoders.get(value.__class__)
+            encoded.append(encoder(value) if encoder else json.dumps(value))
+        encoded.append(_encode_string(particle.data_particle_type()))
+
+        value_ids = []
+        try:
+            for item in values:
+                value = item[DataParticleKey.VALUE]
+                value_id = item[DataParticleKey.VALUE_ID]
+                if not isinstance(value_id, basestring):
+                    return self._dumps(particle, values)
+                if len(item) == 2:
+                    value_ids.append(value_id)
+                elif len(item) == 3:
+                    value_ids.append((value_id, item[DataParticleKey.BINARY]))
+                else:
+                    return self._dumps(particle, values)
+                encoder = encoders.get(value.__class__)
+                encoded.append(encoder(value) if encoder else json.dumps(value))
+        except KeyError:
+            return self._dumps(particle, values)
+
+        signature = (tuple(header_keys), tuple(value_ids))
+        try:
+            value_format = self._formats[signature]
+        except KeyError:
+            if len(self._formats) >= self.MAX_FORMATS:
+                return self._dumps(particle, values)
+            value_format = self._formats[signature] = self._compile(signature)
+        except TypeError:
+            # Unhashable binary flag
+            return self._dumps(particle, values)
+
+        return value_format % tuple(encoded)
+
+    def _dumps(self, particle, values):
+        result = particle._build_base_structure()
+        result[DataParticleKey.STREAM_NAME] = particle.data_particle_type()
+        result[DataParticleKey.VALUES] = values
+        return json.dumps(result)
+
+
 class DataParticle(object):
     """
     This class is responsible for storing and ultimately generating data
@@ -75,6 +216,9 @@ class DataParticle(object):
     # data_particle_type()
     _data_particle_type = None
 
+    # ParticleTemplate for each particle class, compiled on first use
+    _templates = {}
+
     def __init__(self, raw_data,
                  port_timestamp=None,
                  internal_timestamp=None,
@@ -229,9 +373,30 @@ class DataParticle(object):
            and driver timestamp
         @throws InstrumentDriverException If there is a problem with the inputs
         """
+        template = self._get_template()
+        if template and not sorted:
+            return template.serialize(self)
+
         result = self.generate_dict()
         json_result = json.dumps(result, sort_keys=sorted)
         return json_result
+
+    @classmethod
+    def _get_template(cls):
+        """
+        @retval The ParticleTemplate for this class, or None if the class
+        changes how the particle dictionary is built and has to go through
+        generate_dict.
+        """
+        try:
+            return DataParticle._templates[cls]
+        except KeyError:
+            template = None
+            if cls.generate_dict.__func__ is DataParticle.generate_dict.__func__ and \
+               cls._build_base_structure.__func__ is DataParticle._build_base_structure.__func__:
+                template = ParticleTemplate(cls)
+            DataParticle._templates[cls] = template
+            return template
         
     def _build_parsed_values(self):
         """
@@ -346,7 +511,7 @@ class RawDataParticle(DataParticle):
             raise SampleException("raw data not a dictionary")
 
         for param in ["raw", "length", "type", "checksum"]:
-             if(not param in port_agent_packet.keys()):
+             if(not param in port_agent_packet):
                   raise SampleException("raw data not a complete port agent packet. missing %s" % param)
 
 
@@ -357,7 +522,7 @@ class RawDataParticle(DataParticle):
 
         # Attempt to convert values
         try: 
-            payload = base64.b64encode(port_agent_packet.get("raw"))
+            payload = binascii.b2a_base64(port_agent_packet.get("raw"))[:-1]
         except TypeError:
             pass
 
@@ -24,6 +24,7 @@ from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import InstrumentConnectionException
 from mi.core.instrument.instrument_fsm import InstrumentFSM, ThreadSafeFSM
 from mi.core.instrument.port_agent_client import PortAgentClient
+from mi.core.instrument.port_agent_client import PortAgentReactor
 
 from mi.core.log import get_logger,LoggerManager
 log = get_logger()
@@ -1053,8 +1054,14 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
             port = config['port']
             cmd_port = config.get('cmd_port')
 
+            # Share one reactor thread between all of the port agent
+            # connections in this process rather than a listener thread each.
+            reactor = None
+            if config.get('reactor'):
+                reactor = PortAgentReactor.instance()
+
             if isinstance(addr, str) and isinstance(port, int) and len(addr)>0:
-                return PortAgentClient(addr, port, cmd_port)
+                return PortAgentClient(addr, port, cmd_port, reactor=reactor)
             else:
                 raise InstrumentParameterException('Invalid comms config dict.')
 
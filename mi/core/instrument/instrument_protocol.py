@@ -21,6 +21,7 @@ from functools import partial
 from mi.core.log import get_logger ; log = get_logger()
 
 from threading import Thread
+from threading import Condition
 
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.common import BaseEnum, InstErrorCode
@@ -38,6 +39,7 @@ from mi.core.instrument.instrument_driver import ResourceAgentEvent
 from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
 from mi.core.instrument.protocol_cmd_dict import ProtocolCommandDict
 from mi.core.instrument.driver_dict import DriverDict
+from mi.core.instrument.ring_buffer import RingBuffer
 from mi.core.exceptions import InstrumentTimeoutException
 from mi.core.exceptions import InstrumentProtocolException
 from mi.core.exceptions import InstrumentParameterException
@@ -49,6 +51,10 @@ DEFAULT_CMD_TIMEOUT=20
 DEFAULT_WRITE_DELAY=0
 RE_PATTERN = type(re.compile(""))
 
+# Longest wait between response checks when no data arrives; covers drivers
+# that append to the buffers without add_to_buffer.
+BUFFER_POLL_INTERVAL=.1
+
 class InterfaceType(BaseEnum):
     """The methods of connecting to a device"""
     ETHERNET = 'ethernet'
@@ -786,6 +792,75 @@ class InstrumentProtocol(object):
         else:
             return param_list
 
+class PromptMatcher(object):
+    """
+    Finds the first of an ordered list of prompts in a buffer in one regex
+    pass. The prompts are compiled into a single alternation inside a zero
+    width lookahead, so every position reports the first prompt in list
+    order that starts there, overlapping matches included. The result is
+    the same as trying each prompt in turn with str.find: the earliest
+    occurrence of the first prompt in the list that occurs at all.
+    """
+    def __init__(self, prompts):
+        """
+        @param prompts Prompts in order of preference
+        """
+        self.prompts = list(prompts)
+        self._longest = max([len(prompt) for prompt in self.prompts] or [0])
+        self._rank = {}
+        for (rank, prompt) in enumerate(self.prompts):
+            self._rank.setdefault(prompt, rank)
+
+        self._regex = None
+        if self.prompts:
+            self._regex = re.compile('(?=(%s))' % '|'.join(
+                [re.escape(prompt) for prompt in self.prompts]))
+        self._stripped = {}
+
+    def search(self, buf, start=0):
+        """
+        Search a buffer from an offset.
+        @param buf The string to search
+        @param start Offset to start searching from
+        @retval (prompt, index of the prompt in buf) or None
+        """
+        if self._regex is None:
+            return None
+
+        best = None
+        for match in self._regex.finditer(buf, start):
+            rank = self._rank[match.group(1)]
+            if best is None or rank < best[0]:
+                best = (rank, match.group(1), match.start())
+                if rank == 0:
+                    break
+
+        if best:
+            return best[1:]
+
+    def match_end(self, buf, strip_chars):
+        """
+        Find the first prompt that ends the buffer, ignoring trailing
+        strip_chars on both the buffer and the prompts.
+        @param buf The string to check
+        @param strip_chars Characters to ignore at the end
+        @retval The prompt or None
+        """
+        stripped = self._stripped.get(strip_chars)
+        if stripped is None:
+            stripped = [(prompt, prompt.rstrip(strip_chars)) for prompt in self.prompts]
+            self._stripped[strip_chars] = stripped
+
+        end = len(buf)
+        while end and buf[end-1] in strip_chars:
+            end -= 1
+        tail = buf[max(0, end - self._longest):end]
+
+        for (prompt, stripped_prompt) in stripped:
+            if tail.endswith(stripped_prompt):
+                return prompt
+
+
 class CommandResponseInstrumentProtocol(InstrumentProtocol):
     """
     Base class for text-based command-response instruments.
@@ -827,6 +902,50 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
 
         self._last_data_receive_timestamp = None
 
+        # Notified when data is added to the buffers. The count of bytes
+        # added lets response waiters search only what is new.
+        self._buffer_condition = Condition()
+        self._buffer_received = 0
+
+        # Sorted prompts and compiled matchers, built on first use.
+        self._sorted_prompts = (None, None)
+        self._prompt_matchers = {}
+
+    def _get_ring_buffer(self, name):
+        """
+        @retval The RingBuffer attribute of the given name, created on first
+        use so the buffers can be set before the constructor has run.
+        """
+        ring = self.__dict__.get(name)
+        if ring is None:
+            ring = RingBuffer(self._max_buffer_size())
+            self.__dict__[name] = ring
+        return ring
+
+    @property
+    def _linebuf(self):
+        """
+        The line buffer as a string, for drivers that read and assign it
+        directly.
+        """
+        return self._get_ring_buffer('_linebuf_ring').getvalue()
+
+    @_linebuf.setter
+    def _linebuf(self, value):
+        self._get_ring_buffer('_linebuf_ring').set(value)
+
+    @property
+    def _promptbuf(self):
+        """
+        The prompt buffer as a string, for drivers that read and assign it
+        directly.
+        """
+        return self._get_ring_buffer('_promptbuf_ring').getvalue()
+
+    @_promptbuf.setter
+    def _promptbuf(self, value):
+        self._get_ring_buffer('_promptbuf_ring').set(value)
+
     def _get_prompts(self):
         """
         Return a list of prompts order from longest to shortest.  The
@@ -834,13 +953,36 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         @return: list of prompts orders by length.
         """
         if isinstance(self._prompts, list):
-            prompts = self._prompts
+            key = tuple(self._prompts)
         else:
-            prompts = self._prompts.list()
+            key = self._prompts
+
+        (sorted_key, prompts) = self._sorted_prompts
+        if prompts is None or sorted_key != key:
+            if isinstance(self._prompts, list):
+                prompts = list(self._prompts)
+            else:
+                prompts = self._prompts.list()
+            prompts.sort(key=len, reverse=True)
+            self._sorted_prompts = (key, prompts)
 
-        prompts.sort(lambda x, y: cmp(len(y), len(x)))
+        return list(prompts)
+
+    def _get_prompt_matcher(self, prompt_list=None):
+        """
+        @param prompt_list Prompts in order of preference; the protocol's
+        prompts if None.
+        @retval A PromptMatcher for the prompts, compiled once per list.
+        """
+        if prompt_list is None:
+            prompt_list = self._get_prompts()
 
-        return prompts
+        key = tuple(prompt_list)
+        matcher = self._prompt_matchers.get(key)
+        if matcher is None:
+            matcher = PromptMatcher(prompt_list)
+            self._prompt_matchers[key] = matcher
+        return matcher
 
     def _get_response(self, timeout=10, expected_prompt=None, response_regex=None):
         """
@@ -888,23 +1030,18 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             pattern = response_regex.pattern
 
         log.debug('_get_response: timeout=%s, prompt_list=%s, expected_prompt=%s, response_regex=%r, promptbuf=%s',
-                  timeout, prompt_list, expected_prompt, pattern, self._promptbuf)
-        while True:
-            if response_regex:
-                match = response_regex.search(self._linebuf)
+                  timeout, prompt_list, expected_prompt, pattern, self._promptbuf_ring)
+
+        if response_regex:
+            def find_response():
+                match = self._linebuf_ring.search(response_regex)
                 if match:
                     return match.groups()
-            else:
-                for item in prompt_list:
-                    index = self._promptbuf.find(item)
-                    if index >= 0:
-                        result = self._promptbuf[0:index+len(item)]
-                        return item, result
-
-            time.sleep(.1)
+        else:
+            find_response = self._prompt_finder(prompt_list)
 
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
+        return self._wait_for_buffer(find_response, starttime + timeout,
+                                     "in InstrumentProtocol._get_response()")
 
     def _get_raw_response(self, timeout=10, expected_prompt=None):
         """
@@ -928,15 +1065,79 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             else:
                 prompt_list = expected_prompt
 
-        while True:
-            for item in prompt_list:
-                if self._promptbuf.rstrip(strip_chars).endswith(item.rstrip(strip_chars)):
-                    return (item, self._linebuf)
-                else:
-                    time.sleep(.1)
+        matcher = self._get_prompt_matcher(prompt_list)
+
+        def find_response():
+            item = matcher.match_end(self._promptbuf_ring.view(), strip_chars)
+            if item is not None:
+                return (item, self._linebuf)
+
+        return self._wait_for_buffer(find_response, starttime + timeout,
+                                     "in InstrumentProtocol._get_raw_response()")
+
+    def _prompt_finder(self, prompt_list):
+        """
+        Build a search for the first of a list of prompts in the prompt
+        buffer for _wait_for_buffer. After the first call each call only
+        searches the data added since the previous one, less enough to catch
+        a prompt split across the two.
+        @param prompt_list Prompts in order of preference
+        @retval Function returning (prompt, response through the prompt) or
+        None if no prompt has been seen.
+        """
+        matcher = self._get_prompt_matcher(prompt_list)
+        overlap = max([len(item) for item in prompt_list] or [1]) - 1
+        # (bytes received, buffer length) as of the last search
+        searched = []
+
+        def find_prompt():
+            promptbuf = self._promptbuf_ring
+            start = 0
+            if searched:
+                (received, length) = searched[0]
+                added = max(self._buffer_received - received, len(promptbuf) - length)
+                start = max(0, len(promptbuf) - added - overlap)
+            searched[:] = [(self._buffer_received, len(promptbuf))]
+
+            found = matcher.search(promptbuf.view(), start)
+            if found:
+                (item, index) = found
+                return (item, promptbuf[0:index+len(item)])
+
+        return find_prompt
+
+    def _wait_for_buffer(self, find_response, deadline, timeout_message):
+        """
+        Call find_response each time data is added to the buffers until it
+        returns something other than None or the deadline passes.
+        @param find_response Function to search the buffers
+        @param deadline Time by which a response is needed
+        @param timeout_message Message for the timeout exception
+        @retval The value returned by find_response
+        @throw InstrumentTimeoutException on timeout
+        """
+        with self._buffer_condition:
+            while True:
+                result = find_response()
+                if result is not None:
+                    return result
 
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise InstrumentTimeoutException(timeout_message)
+
+                self._buffer_condition.wait(min(remaining, BUFFER_POLL_INTERVAL))
+
+    def _buffer_updated(self, data):
+        """
+        Wake anything waiting on a response. Called by add_to_buffer;
+        protocols that add to the buffers directly should call it too, and
+        hold _buffer_condition while changing the buffers.
+        @param data The bytes added
+        """
+        with self._buffer_condition:
+            self._buffer_received += len(data)
+            self._buffer_condition.notify_all()
 
     def _do_cmd_resp(self, cmd, *args, **kwargs):
         """
@@ -1126,23 +1327,21 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         buffers implemented as lifo ring buffer
         @param data: bytes to add to the buffer
         '''
-        # Update the line and prompt buffers.
-        self._linebuf += data
-        self._promptbuf += data
-        self._last_data_timestamp = time.time()
-
-        # If our buffer exceeds the max allowable size then drop the leading
-        # characters on the floor.
-        if(len(self._linebuf) > self._max_buffer_size()):
-            self._linebuf = self._linebuf[self._max_buffer_size()*-1:]
-
-        # If our buffer exceeds the max allowable size then drop the leading
-        # characters on the floor.
-        if(len(self._promptbuf) > self._max_buffer_size()):
-            self._promptbuf = self._linebuf[self._max_buffer_size()*-1:]
-
-        log.debug("LINE BUF: %s", self._linebuf)
-        log.debug("PROMPT BUF: %s", self._promptbuf)
+        # Update the line and prompt buffers. If our buffer exceeds the max
+        # allowable size then drop the leading characters on the floor.
+        # The buffers are searched in place, so they only change while
+        # holding the lock the searches hold.
+        max_size = self._max_buffer_size()
+        with self._buffer_condition:
+            self._get_ring_buffer('_linebuf_ring').append(data, max_size)
+            self._get_ring_buffer('_promptbuf_ring').append(data, max_size)
+            self._last_data_timestamp = time.time()
+
+            # The buffers are only turned into strings if these are logged
+            log.debug("LINE BUF: %s", self._linebuf_ring)
+            log.debug("PROMPT BUF: %s", self._promptbuf_ring)
+
+            self._buffer_updated(data)
 
     def _max_buffer_size(self):
         return MAX_BUFFER_SIZE
@@ -1166,8 +1365,9 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         @throw InstrumentTimeoutException if the device could not be woken.
         """
         # Clear the prompt buffer.
-        log.debug("clearing promptbuf: %s", self._promptbuf)
-        self._promptbuf = ''
+        log.debug("clearing promptbuf: %s", self._promptbuf_ring)
+        with self._buffer_condition:
+            self._promptbuf_ring.clear()
         
         # Grab time for timeout.
         starttime = time.time()
@@ -1178,16 +1378,18 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             self._send_wakeup()
             time.sleep(delay)
 
-            log.debug("Prompts: %s", self._get_prompts())
-
-            for item in self._get_prompts():
-                log.debug("buffer: %s", self._promptbuf)
-                log.debug("find prompt: %s", item)
-                index = self._promptbuf.find(item)
-                log.debug("Got prompt (index: %s): %s ", index, repr(self._promptbuf))
-                if index >= 0:
-                    log.trace('wakeup got prompt: %s', repr(item))
-                    return item
+            matcher = self._get_prompt_matcher()
+            log.debug("Prompts: %s", matcher.prompts)
+            log.debug("buffer: %s", self._promptbuf_ring)
+
+            # search under the lock add_to_buffer appends under
+            with self._buffer_condition:
+                found = matcher.search(self._promptbuf_ring.view())
+            if found:
+                (item, index) = found
+                log.debug("Got prompt (index: %s): %r ", index, self._promptbuf_ring)
+                log.trace('wakeup got prompt: %s', repr(item))
+                return item
             log.debug("Searched for all prompts")
 
             if time.time() > starttime + timeout:
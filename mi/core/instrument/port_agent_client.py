@@ -11,8 +11,13 @@ and logging.
 __author__ = 'David Everett'
 __license__ = 'Apache 2.0'
 
+import os
 import socket
+import select
 import errno
+import fcntl
+import heapq
+import itertools
 import threading
 import time
 import datetime
@@ -21,13 +26,16 @@ import array
 import binascii
 import ctypes
 import subprocess
+import numpy as np
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentConnectionException
 
 HEADER_SIZE = 16 # BBBBHHLL = 1 + 1 + 1 + 1 + 2 + 2 + 4 + 4 = 16
+SYNC_BYTES = '\xa3\x9d\x7a' # Start of every packet header
 
 
+OFFSET_P_LENGTH = 4
 OFFSET_P_CHECKSUM_LOW = 6
 OFFSET_P_CHECKSUM_HIGH = 7
 
@@ -58,10 +66,49 @@ MIN_RETRY_WINDOW = 2 # 2 seconds
 
 MAX_SEND_ATTEMPTS = 15              # Max number of times we can get EAGAIN
 
+RECV_BLOCK_SIZE = 262144            # Receive buffer block; holds several max size packets
+MIN_RECV_SIZE = 4096                # Start a new block when less than this is free
+
 
 class SocketClosed(Exception): pass
 
 
+def xor_checksum(data, length=None):
+    """
+    XOR all of the bytes of a buffer together. The buffer is reduced as
+    64 bit words in one numpy pass and the word is folded down to a byte,
+    so there is no per byte Python work.
+    @param data A str, bytearray, memoryview or anything else supporting
+    the buffer interface.
+    @param length The number of bytes to use from the start of the buffer;
+    all of them if None.
+    @retval The 8 bit XOR of the bytes.
+    """
+    if length is None:
+        length = len(data)
+    if length <= 0:
+        return 0
+
+    if isinstance(data, memoryview):
+        byte_array = np.asarray(data)[:length]
+    else:
+        byte_array = np.frombuffer(data, dtype=np.uint8, count=length)
+    word_bytes = length - (length % 8)
+    checksum = 0
+
+    if word_bytes:
+        word = int(np.bitwise_xor.reduce(byte_array[:word_bytes].view(np.uint64)))
+        word ^= word >> 32
+        word ^= word >> 16
+        word ^= word >> 8
+        checksum = word & 0xff
+
+    if word_bytes < length:
+        checksum ^= int(np.bitwise_xor.reduce(byte_array[word_bytes:]))
+
+    return checksum
+
+
 class PortAgentPacket():
     """
     An object that encapsulates the details packets that are sent to and
@@ -165,25 +212,17 @@ class PortAgentPacket():
         self.__data = data
 
     def calculate_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum ^= struct.unpack_from('B', str(self.__header[i]))[0]
-                
-        for i in range(self.__length):
-            checksum ^= struct.unpack_from('B', str(self.__data[i]))[0]
-            
-        return checksum
+        """
+        XOR of the header, less the checksum field, and the data
+        """
+        header = self.__header
+        return xor_checksum(header[:OFFSET_P_CHECKSUM_LOW]) ^ \
+               xor_checksum(header[OFFSET_P_CHECKSUM_HIGH + 1:HEADER_SIZE]) ^ \
+               xor_checksum(self.__data, self.__length)
             
                                 
     def verify_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum ^= struct.unpack_from('B', self.__header[i])[0]
-                
-        for i in range(self.__length):
-            checksum ^= struct.unpack_from('B', self.__data[i])[0]
+        checksum = self.calculate_checksum()
             
         if checksum == self.__recv_checksum:
             self.__isValid = True
@@ -193,6 +232,8 @@ class PortAgentPacket():
         #log.debug('checksum: %i.' %(checksum))
 
     def get_header(self):
+        if isinstance(self.__header, memoryview):
+            self.__header = self.__header.tobytes()
         return self.__header
 
     
@@ -204,8 +245,23 @@ class PortAgentPacket():
         self.__header = header
 
     def get_data(self):
+        """
+        Data received by the listener is attached as a view into its receive
+        buffer; it is only copied into a string the first time it is asked
+        for this way.
+        """
+        if isinstance(self.__data, memoryview):
+            self.__data = self.__data.tobytes()
         return self.__data
 
+    def get_data_view(self):
+        """
+        Get the data as a memoryview, without copying it.
+        """
+        if self.__data is None or isinstance(self.__data, memoryview):
+            return self.__data
+        return memoryview(self.__data)
+
     def get_timestamp(self):
         return self.__port_agent_timestamp
 
@@ -238,7 +294,7 @@ class PortAgentPacket():
             'type': self.__type,
             'length': self.__length,
             'checksum': self.__checksum,
-            'raw': self.__data
+            'raw': self.get_data()
         }
 
     def is_valid(self):
@@ -257,13 +313,16 @@ class PortAgentClient(object):
     HEARTBEAT_INTERVAL_COMMAND = "heartbeat_interval "
     BREAK_COMMAND = "break "
     
-    def __init__(self, host, port, cmd_port, delim=None):
+    def __init__(self, host, port, cmd_port, delim=None, reactor=None):
         """
         PortAgentClient constructor.
+        @param reactor A PortAgentReactor to service this client's data
+        socket; if None the client starts its own listener thread.
         """
         self.host = host
         self.port = port
         self.cmd_port = cmd_port
+        self.reactor = reactor
         self.sock = None
         self.listener_thread = None
         self.stop_event = None
@@ -302,15 +361,19 @@ class PortAgentClient(object):
             # start the listener thread if instructed to
             ###
             if self.start_listener:
-                self.listener_thread = Listener(self.sock,  
-                                                self.recovery_attempts,
-                                                self.delim, self.heartbeat, 
-                                                self.max_missed_heartbeats, 
-                                                self.callback_data,
-                                                self.callback_raw,
-                                                self.listener_callback_error,
-                                                self.callback_error,
-                                                self.user_callback_error)
+                listener_args = (self.sock,
+                                 self.recovery_attempts,
+                                 self.delim, self.heartbeat,
+                                 self.max_missed_heartbeats,
+                                 self.callback_data,
+                                 self.callback_raw,
+                                 self.listener_callback_error,
+                                 self.callback_error,
+                                 self.user_callback_error)
+                if self.reactor:
+                    self.listener_thread = ReactorListener(self.reactor, *listener_args)
+                else:
+                    self.listener_thread = Listener(*listener_args)
                 self.listener_thread.start()
 
             ###
@@ -339,6 +402,14 @@ class PortAgentClient(object):
             errorString = "_init_comms(): Exception initializing comms for " +  \
                       str(self.host) + ": " + str(self.port) + ": " + repr(e)
             log.error(errorString, exc_info = True)
+            if self.reactor and self.reactor.is_worker_thread():
+                """
+                Recovering for a reactor client: retry from a reactor timer
+                rather than sleeping.  The outcome is reported through the
+                error callbacks, so there is no result to return yet.
+                """
+                self.reactor.call_later(self.RECOVERY_SLEEP_TIME, self._recover, errorString)
+                return None
             time.sleep(self.RECOVERY_SLEEP_TIME)
             returnCode = self.callback_error(errorString)
             if returnCode == True:
@@ -460,10 +531,24 @@ class PortAgentClient(object):
             returnValue = self._init_comms()
             if True == returnValue:
                 log.info("_init_comms recovery succeeded.")
+            elif returnValue is None:
+                log.info("_init_comms recovery will be retried.")
             else:
                 log.error("_init_comms recovery failed.")
             
         return returnValue
+
+    def _recover(self, errorString = "No error string passed."):
+        """
+        Connection recovery for a client on a reactor, run on a reactor
+        worker thread so connecting never holds up the reactor. If recovery
+        fails for good the user error callback is called.
+        @param errorString: reason for the recovery
+        """
+        if False == self.callback_error(errorString):
+            log.error("Connection recovery failed: %s", errorString)
+            if self.user_callback_error:
+                self.user_callback_error(errorString)
             
     def send_config_parameter(self, parameter, value):
         """
@@ -569,6 +654,14 @@ class PortAgentClient(object):
         recover, invoke the user_error_callback and raise an exception  
         @param error_string: error description.
         """
+        if self.reactor and threading.current_thread() is self.reactor:
+            """
+            A send from a callback on the reactor thread; recover on a
+            worker thread and report the failed send.
+            """
+            self.reactor.call_later(0, self._recover, error_string)
+            raise InstrumentConnectionException(error_string)
+
         log.debug('port_agent_client listen thread calling local_callback_error.')
         if False == self.callback_error(error_string):
             log.debug('port_agent_client calling user_callback_error and raising exception.')
@@ -577,6 +670,122 @@ class PortAgentClient(object):
         else:
             log.debug('port_agent_client listen thread: recovery succeeded.')
 
+class PacketReassembler(object):
+    """
+    Splits the port agent data stream into packets. Each recv reads as much
+    as the socket has into one large block, and every complete packet in the
+    block is handed out as a PortAgentPacket whose header and data are
+    memoryview slices of it, so a burst of packets costs one recv and no
+    per packet buffers or copies.
+
+    A block is filled front to back and never rewritten, so views handed
+    out stay valid. Once it is nearly full the partial packet at its end is
+    carried over into a new block; the old one is freed when the last packet
+    referring to it goes away.
+
+    If a header is corrupt the stream is resynchronized by scanning forward
+    to the next sync bytes.
+    """
+    def __init__(self, block_size=RECV_BLOCK_SIZE):
+        self._block_size = block_size
+        self._block = bytearray(block_size)
+        self._view = memoryview(self._block)
+        self._read = 0
+        self._write = 0
+        # bytes skipped since the last good packet while resynchronizing
+        self._skipped = 0
+
+    def _packet_size(self):
+        """
+        @retval The size of the packet at the read position including the
+        header, or just the header size if the header is incomplete.
+        """
+        if self._write - self._read < HEADER_SIZE:
+            return HEADER_SIZE
+        return struct.unpack_from('>H', self._view, self._read + OFFSET_P_LENGTH)[0]
+
+    def _make_room(self):
+        """
+        Start a new block if the current one cannot take a reasonable read
+        or cannot hold the rest of the pending packet.
+        """
+        needed = max(self._packet_size(), HEADER_SIZE)
+        free = len(self._block) - self._write
+        if free >= MIN_RECV_SIZE and self._read + needed <= len(self._block):
+            return
+
+        pending = self._write - self._read
+        block = bytearray(max(self._block_size, needed + MIN_RECV_SIZE))
+        block[:pending] = self._view[self._read:self._write]
+        self._block = block
+        self._view = memoryview(block)
+        self._read = 0
+        self._write = pending
+
+    def recv(self, sock):
+        """
+        Read whatever the socket has available into the current block.
+        @param sock The port agent data socket
+        @retval The number of bytes read
+        @raise SocketClosed if the port agent closed the connection
+        @raise socket.error from the socket, including EWOULDBLOCK
+        """
+        self._make_room()
+        bytesrx = sock.recv_into(self._view[self._write:],
+                                 len(self._block) - self._write)
+        if bytesrx <= 0:
+            raise SocketClosed()
+        self._write += bytesrx
+        return bytesrx
+
+    def _resync(self):
+        """
+        Skip forward to the next sync bytes after the read position. If
+        there are none yet, keep only the bytes at the end that could be
+        the start of them.
+        @retval The number of bytes skipped
+        """
+        found = self._block.find(SYNC_BYTES, self._read + 1, self._write)
+        if found < 0:
+            found = max(self._read + 1, self._write - (len(SYNC_BYTES) - 1))
+        skipped = found - self._read
+        self._read = found
+        return skipped
+
+    def next_packet(self):
+        """
+        @retval The next complete packet, or None if there is none yet.
+        @raise InstrumentConnectionException when a header without the sync
+        bytes or with an invalid length is found; the stream is skipped
+        forward to the next sync bytes. Raised once per corrupt stretch of
+        the stream.
+        """
+        while self._write - self._read >= HEADER_SIZE:
+            start = self._read
+            size = self._packet_size()
+            if self._block.startswith(SYNC_BYTES, start) and size >= HEADER_SIZE:
+                if self._write - start < size:
+                    return None
+                if self._skipped:
+                    log.warning("Resynchronized port agent stream after skipping %d bytes", self._skipped)
+                    self._skipped = 0
+
+                paPacket = PortAgentPacket()
+                paPacket.unpack_header(self._view[start:start + HEADER_SIZE])
+                paPacket.attach_data(self._view[start + HEADER_SIZE:start + size])
+                self._read += size
+                return paPacket
+
+            skipped = self._resync()
+            if not self._skipped:
+                self._skipped = skipped
+                raise InstrumentConnectionException(
+                    "Invalid port agent packet header (length %d), skipping to the next sync bytes" % size)
+            self._skipped += skipped
+
+        return None
+
+
 class Listener(threading.Thread):
 
     MAX_HEARTBEAT_INTERVAL = 20 # Max, for range checking parameter
@@ -614,6 +823,10 @@ class Listener(threading.Thread):
         self.sock = sock
         self.recovery_attempt = recovery_attempt
         self._done = False
+        # (read fd, write fd) of a pipe used by done() to wake the thread
+        # while it waits for data, open while the thread runs
+        self._wake_pipe = None
+        self._wake_lock = threading.Lock()
         self.linebuf = ''
         self.delim = delim
         self.heartbeat_timer = None
@@ -737,6 +950,9 @@ class Listener(threading.Thread):
         conclude.
         """
         self._done = True
+        with self._wake_lock:
+            if self._wake_pipe:
+                os.write(self._wake_pipe[1], 'x')
 
     def handle_packet(self, paPacket):
         packet_type = paPacket.get_header_type()
@@ -773,10 +989,9 @@ class Listener(threading.Thread):
 
     def run(self):
         """
-        Listener thread processing loop. Block on receive from port agent.
-        Receive HEADER_SIZE bytes to receive the entire header.  From that,
-        get the length of the whole packet (including header); compute the
-        length of the remaining data and read that.  
+        Listener thread processing loop. Receive from the port agent in
+        large blocks and hand each complete packet in the block to
+        handle_packet.
         """
         self.thread_name = str(threading.current_thread().name)
         log.info('PortAgentClient listener thread: %s started.', self.thread_name)
@@ -784,60 +999,33 @@ class Listener(threading.Thread):
         if self.heartbeat:
             self.start_heartbeat_timer()
 
+        reassembler = PacketReassembler()
+        with self._wake_lock:
+            self._wake_pipe = os.pipe()
+
         while not self._done:
             try:
-                log.debug('RX NEW PACKET')
-                header = bytearray(HEADER_SIZE)
-                headerview = memoryview(header)
-                bytes_left = HEADER_SIZE
-                while bytes_left and not self._done:
-                    try:
-                        bytesrx = self.sock.recv_into(headerview[HEADER_SIZE - bytes_left:], bytes_left)
-                        log.debug('RX HEADER BYTES %d LEFT %d SOCK %r' % (
-                                                    bytesrx, bytes_left, self.sock,))
-                        if bytesrx <= 0:
-                            raise SocketClosed()
-                        bytes_left -= bytesrx
-                    except socket.error as e:
-                        if e.errno == errno.EWOULDBLOCK:
-                            time.sleep(.1)
-                        else:
-                            raise
-
                 """
-                Only do this if we've received the whole header, otherwise (ex. during shutdown)
-                we can have a completely invalid header, resulting in negative count exceptions.
+                Hand out every complete packet we already have before
+                reading more; a single read can hold many packets.
                 """
-                if (bytes_left == 0):
-                    paPacket = PortAgentPacket()
-                    paPacket.unpack_header(str(header))
-                    data_size = paPacket.get_data_length()
-                    bytes_left = data_size
-                    data = bytearray(data_size)
-                    dataview = memoryview(data)
-                    log.debug('Expecting DATA BYTES %d' % data_size)
-                    
-                while bytes_left and not self._done:
-                    try:
-                        bytesrx = self.sock.recv_into(dataview[data_size - bytes_left:], bytes_left)
-                        log.debug('RX DATA BYTES %d LEFT %d SOCK %r' % (
-                                                    bytesrx, bytes_left, self.sock,))
-                        if bytesrx <= 0:
-                            raise SocketClosed()
-                        bytes_left -= bytesrx
-                    except socket.error as e:
-                        if e.errno == errno.EWOULDBLOCK:
-                            time.sleep(.1)
-                        else:
-                            raise
-
-                if not self._done:
-                    """
-                    Should have complete port agent packet.
-                    """
-                    paPacket.attach_data(str(data))
-                    log.debug("HANDLE PACKET")
+                paPacket = reassembler.next_packet()
+                if paPacket:
                     self.handle_packet(paPacket)
+                    continue
+
+                try:
+                    bytesrx = reassembler.recv(self.sock)
+                    log.debug('RX BYTES %d SOCK %r', bytesrx, self.sock)
+                except socket.error as e:
+                    if e.errno == errno.EWOULDBLOCK:
+                        """
+                        Block until the port agent sends more, or done()
+                        wakes us.
+                        """
+                        select.select([self.sock, self._wake_pipe[0]], [], [])
+                    else:
+                        raise
 
             except SocketClosed:
                 errorString = 'Listener thread: %s SocketClosed exception from port_agent socket' \
@@ -868,6 +1056,11 @@ class Listener(threading.Thread):
             except Exception as e:
                 self.default_callback_error(e)
 
+        with self._wake_lock:
+            for fd in self._wake_pipe:
+                os.close(fd)
+            self._wake_pipe = None
+
         log.info('Port_agent_client thread done listening; going away.')
 
     def _invoke_error_callback(self, recovery_attempt, error_string = "No error string passed."):
@@ -884,8 +1077,424 @@ class Listener(threading.Thread):
             if (False == recovery):
                 log.debug('port_agent_client listen thread calling user_callback_error.')
                 self.user_callback_error(error_string)
+            elif recovery is None:
+                log.debug('port_agent_client listen thread: recovery will be retried.')
             else:
                 log.debug('port_agent_client listen thread: recovery succeeded.')
         else:
             log.debug('port_agent_client listen thread calling user_callback_error.')
             self.user_callback_error(error_string)
+
+
+class ReactorListener(Listener):
+    """
+    A Listener serviced by a PortAgentReactor rather than by a thread of its
+    own. Packets are read when the reactor finds the socket readable and
+    the heartbeat deadline is kept in the reactor's timer heap, so neither
+    a listener thread nor a heartbeat timer thread is needed. Data callbacks
+    are made on the reactor thread; connection recovery runs on a reactor
+    worker thread.
+    """
+    def __init__(self, reactor, *args, **kwargs):
+        """
+        @param reactor The PortAgentReactor to register with.
+        The remaining parameters are those of Listener.
+        """
+        Listener.__init__(self, *args, **kwargs)
+        self.reactor = reactor
+        self.reassembler = PacketReassembler()
+        self.heartbeat_deadline = None
+        self._registered = False
+        self._detached = threading.Event()
+
+    def start(self):
+        """
+        Register with the reactor in place of starting a thread.
+        """
+        self.thread_name = self.reactor.name
+        log.info('PortAgentClient listener registered with %s.', self.thread_name)
+        self._registered = True
+        self.reactor.register(self)
+
+        if self.heartbeat:
+            self.start_heartbeat_timer()
+
+    def done(self):
+        """
+        Unregister from the reactor. Once this returns the reactor will make
+        no more callbacks for this listener.
+        """
+        self._done = True
+        self.reactor.unregister(self)
+        self._detached.set()
+
+    def join(self, timeout=None):
+        if self._registered:
+            self._detached.wait(timeout)
+
+    def is_alive(self):
+        return self._registered and not self._detached.is_set()
+
+    def start_heartbeat_timer(self):
+        """
+        Push the heartbeat deadline out by one interval.
+        """
+        self.heartbeat_deadline = time.time() + self.heartbeat
+        self.reactor.schedule(self)
+
+    def handle_read(self):
+        """
+        Called by the reactor when the socket is readable. Receive what is
+        available and dispatch every complete packet.
+        """
+        try:
+            self.reassembler.recv(self.sock)
+        except socket.error as e:
+            if e.errno != errno.EWOULDBLOCK:
+                errorString = 'Listener: %s Socket error while receiving from port agent: %r' \
+                    % (self.thread_name, e)
+                log.error(errorString)
+                self._invoke_error_callback(self.recovery_attempt, errorString)
+            return
+        except SocketClosed:
+            errorString = 'Listener: %s SocketClosed exception from port_agent socket' \
+                % (self.thread_name)
+            log.error(errorString)
+            self._invoke_error_callback(self.recovery_attempt, errorString)
+            return
+
+        while not self._done:
+            try:
+                paPacket = self.reassembler.next_packet()
+                if not paPacket:
+                    break
+                self.handle_packet(paPacket)
+            except Exception as e:
+                self.default_callback_error(e)
+
+    def _invoke_error_callback(self, recovery_attempt, error_string = "No error string passed."):
+        """
+        Leave the reactor before reporting a connection error; recovery
+        closes this socket and registers a new listener, which may reuse
+        the file descriptor. Recovery connects to the port agent, so it is
+        handed to a worker thread rather than run on the reactor thread.
+        """
+        self.done()
+        self.reactor.call_later(0, Listener._invoke_error_callback, self,
+                                recovery_attempt, error_string)
+
+
+class _Poller(object):
+    """
+    Readability polling over select.epoll where available, then select.poll,
+    then select.select, which is all that is left when gevent has patched
+    the select module.
+    """
+    def __init__(self):
+        self._fds = set()
+        self._timeout_scale = None
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._events = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
+        elif hasattr(select, 'poll'):
+            self._poller = select.poll()
+            self._events = select.POLLIN | select.POLLERR | select.POLLHUP
+            self._timeout_scale = 1000
+        else:
+            self._poller = None
+
+    def register(self, fd):
+        if self._poller:
+            self._poller.register(fd, self._events)
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.discard(fd)
+        if self._poller:
+            self._poller.unregister(fd)
+
+    def fds(self):
+        """
+        @retval The registered file descriptors.
+        """
+        return list(self._fds)
+
+    def poll(self, timeout):
+        """
+        @param timeout Seconds to wait, or None to wait indefinitely.
+        @retval List of readable file descriptors.
+        """
+        if not self._poller:
+            return select.select(list(self._fds), [], [], timeout)[0]
+
+        if timeout is None:
+            timeout = -1
+        elif self._timeout_scale:
+            timeout = int(timeout * self._timeout_scale) + 1
+        return [fd for (fd, event) in self._poller.poll(timeout)]
+
+
+class _ReactorWorker(threading.Thread):
+    """
+    A thread running one call handed off by a PortAgentReactor, for work
+    that may block, such as reconnecting to a port agent.
+    """
+    def __init__(self, reactor, function, args):
+        threading.Thread.__init__(self, name='%s-worker' % reactor.name)
+        self.daemon = True
+        self.reactor = reactor
+        self.function = function
+        self.args = args
+
+    def run(self):
+        try:
+            self.function(*self.args)
+        except Exception as e:
+            log.error('PortAgentReactor: worker call failed: %r', e, exc_info=True)
+
+
+class PortAgentReactor(threading.Thread):
+    """
+    Services the data sockets of any number of port agent clients from a
+    single thread. Readable sockets are found with epoll (poll where epoll
+    is not available) and dispatched to their ReactorListener; heartbeat
+    deadlines are kept in a heap ordered by deadline, so the poll timeout
+    is always the time to the earliest one.
+
+    Heartbeats only move a listener's deadline; its heap entry is checked
+    against the current deadline when it comes due and pushed back if the
+    deadline has moved, so a heartbeat costs no heap operation.
+
+    Data and heartbeat callbacks run on the reactor thread, outside the
+    reactor lock, so they may register, unregister and schedule. A callback
+    must not block for long, since that holds up every client; anything
+    that might, such as connection recovery, is handed to a worker thread
+    with call_later.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, name='PortAgentReactor'):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self._done = False
+        self._lock = threading.RLock()
+        self._listeners = {}
+        self._timers = []
+        self._scheduled = set()
+        self._calls = []
+        self._sequence = itertools.count()
+        self._poller = _Poller()
+
+        """
+        The listener whose callback is running on the reactor thread, and a
+        condition notified when it returns, so unregister can wait for it.
+        """
+        self._dispatching = None
+        self._dispatch_done = threading.Condition(self._lock)
+
+        """
+        A pipe to wake the reactor when a listener is added or a deadline
+        is scheduled while it is waiting.
+        """
+        (self._wake_read, self._wake_write) = os.pipe()
+        for fd in (self._wake_read, self._wake_write):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._poller.register(self._wake_read)
+
+    @classmethod
+    def instance(cls):
+        """
+        @retval The process wide reactor, started on first use.
+        """
+        with cls._instance_lock:
+            if cls._instance is None or not cls._instance.is_alive():
+                cls._instance = cls()
+                cls._instance.start()
+            return cls._instance
+
+    def register(self, listener):
+        with self._lock:
+            listener.reactor_fd = listener.sock.fileno()
+            self._listeners[listener.reactor_fd] = listener
+            self._poller.register(listener.reactor_fd)
+        self._wake()
+
+    def unregister(self, listener):
+        """
+        Stop servicing a listener. Unless called from the reactor thread,
+        this waits for a callback already running for the listener to
+        return, so no callbacks are made for it once this returns.
+        """
+        with self._lock:
+            fd = getattr(listener, 'reactor_fd', None)
+            if self._listeners.get(fd) is listener:
+                del self._listeners[fd]
+                try:
+                    self._poller.unregister(fd)
+                except (IOError, OSError, ValueError, KeyError):
+                    # Already closed, which removes it from the poller
+                    pass
+            self._scheduled.discard(listener)
+
+            if threading.current_thread() is not self:
+                while self._dispatching is listener:
+                    self._dispatch_done.wait()
+
+    def schedule(self, listener):
+        """
+        Make sure a listener's heartbeat deadline is in the timer heap.
+        """
+        with self._lock:
+            if listener in self._scheduled:
+                return
+            self._scheduled.add(listener)
+            heapq.heappush(self._timers, (listener.heartbeat_deadline,
+                                          next(self._sequence), listener))
+        self._wake()
+
+    def call_later(self, delay, function, *args):
+        """
+        Call a function after a delay on a worker thread of its own, never
+        on the reactor thread, so it may block.
+        @param delay Seconds to wait before the call
+        @param function The function to call, with the remaining arguments
+        """
+        with self._lock:
+            heapq.heappush(self._calls, (time.time() + delay, next(self._sequence),
+                                         function, args))
+        self._wake()
+
+    def is_worker_thread(self):
+        """
+        @retval True if called from a worker thread started by call_later
+        """
+        return getattr(threading.current_thread(), 'reactor', None) is self
+
+    def stop(self):
+        """
+        Stop the reactor thread. Registered listeners are not notified.
+        """
+        self._done = True
+        self._wake()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_write, 'x')
+        except OSError as e:
+            # Pipe full; the reactor is already due to wake
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _next_timeout(self):
+        with self._lock:
+            deadlines = [heap[0][0] for heap in (self._timers, self._calls) if heap]
+            if not deadlines:
+                return None
+            return max(0, min(deadlines) - time.time())
+
+    def _dispatch(self, listener, method, *args):
+        """
+        Call a listener method on the reactor thread without holding the
+        lock, unless the listener has been unregistered.
+        """
+        with self._lock:
+            if self._listeners.get(getattr(listener, 'reactor_fd', None)) is not listener:
+                return
+            self._dispatching = listener
+
+        try:
+            method(*args)
+        except Exception as e:
+            log.error('PortAgentReactor: listener failed: %r', e, exc_info=True)
+        finally:
+            with self._lock:
+                self._dispatching = None
+                self._dispatch_done.notify_all()
+
+    def _run_timers(self):
+        """
+        Handle deadlines that have come due. Entries for listeners that
+        have left, or whose deadline has since moved, are dropped or pushed
+        back.
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                (deadline, sequence, listener) = heapq.heappop(self._timers)
+                if listener not in self._scheduled:
+                    continue
+                self._scheduled.discard(listener)
+
+                if listener.heartbeat_deadline > now:
+                    self.schedule(listener)
+                else:
+                    expired.append(listener)
+
+            calls = []
+            while self._calls and self._calls[0][0] <= now:
+                calls.append(heapq.heappop(self._calls))
+
+        for listener in expired:
+            self._dispatch(listener, listener.heartbeat_timeout)
+
+        for (deadline, sequence, function, args) in calls:
+            _ReactorWorker(self, function, args).start()
+
+    def _drop_bad_fds(self):
+        """
+        Drop file descriptors that were closed without being unregistered,
+        so one bad descriptor doesn't stop the reactor servicing the rest.
+        """
+        with self._lock:
+            for fd in self._poller.fds():
+                try:
+                    os.fstat(fd)
+                except OSError:
+                    listener = self._listeners.pop(fd, None)
+                    log.error('PortAgentReactor: dropping closed file descriptor %d (%r)', fd, listener)
+                    try:
+                        self._poller.unregister(fd)
+                    except (IOError, OSError, ValueError, KeyError):
+                        pass
+                    self._scheduled.discard(listener)
+
+    def run(self):
+        log.info('PortAgentReactor %s started.', self.name)
+
+        while not self._done:
+            try:
+                readable = self._poller.poll(self._next_timeout())
+            except (IOError, OSError, select.error) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] == errno.EBADF:
+                    self._drop_bad_fds()
+                    continue
+                log.error('PortAgentReactor %s poll failed: %r', self.name, e, exc_info=True)
+                raise
+
+            for fd in readable:
+                if fd == self._wake_read:
+                    self._drain_wake()
+                    continue
+
+                with self._lock:
+                    listener = self._listeners.get(fd)
+                if listener:
+                    self._dispatch(listener, listener.handle_read)
+
+            self._run_timers()
+
+        log.info('PortAgentReactor %s stopped.', self.name)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.ring_buffer Bounded byte buffer for MI work
+@file mi/core/instrument/ring_buffer.py
+@author agent
+@brief A bounded buffer of the most recent bytes received from an instrument,
+    used by protocols for the line and prompt buffers.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+
+class RingBuffer(object):
+    """
+    Holds the last max_size bytes appended to it. Appending only extends a
+    bytearray and moves the start of the live window forward; the dropped
+    bytes are reclaimed in one move once there are as many of them as live
+    bytes, so an append costs time proportional to its own length rather
+    than to the size of the buffer.
+
+    The live window can be searched in place with find and search, indexed
+    and sliced like a string. The string value is built when asked for and
+    kept until the buffer next changes.
+    """
+    def __init__(self, max_size, data=''):
+        """
+        @param max_size The number of bytes to keep
+        @param data Initial contents
+        """
+        self.max_size = max_size
+        self.set(data)
+
+    def set(self, data):
+        """
+        Replace the contents of the buffer.
+        @param data The new contents; not truncated until the next append
+        """
+        self._data = bytearray(data)
+        self._start = 0
+        self._value = None
+
+    def clear(self):
+        self.set('')
+
+    def append(self, data, max_size=None):
+        """
+        Add bytes to the end of the buffer, dropping the oldest bytes beyond
+        max_size.
+        @param data The bytes to add
+        @param max_size The number of bytes to keep, if not the size given
+        at construction
+        """
+        if max_size is None:
+            max_size = self.max_size
+
+        buf = self._data
+        buf.extend(data)
+        self._value = None
+
+        start = len(buf) - max_size
+        if start > self._start:
+            self._start = start
+            if start * 2 >= len(buf):
+                del buf[:start]
+                self._start = 0
+
+    def view(self):
+        """
+        @retval A buffer over the live window, without copying. Only valid
+        until the ring buffer next changes, so a buffer appended to by another
+        thread must only be changed and searched under a shared lock.
+        """
+        return buffer(self._data, self._start)
+
+    def getvalue(self):
+        """
+        @retval The contents of the buffer as a string
+        """
+        if self._value is None:
+            self._value = str(self.view())
+        return self._value
+
+    def find(self, sub, start=0, end=None):
+        """
+        Find a string in the buffer, as str.find.
+        @retval The index of sub in the buffer or -1
+        """
+        (start, end, step) = slice(start, end).indices(len(self))
+        index = self._data.find(sub, self._start + start, self._start + end)
+        if index < 0:
+            return -1
+        return index - self._start
+
+    def search(self, regex, pos=0):
+        """
+        Search the buffer with a compiled regex. Match offsets are relative
+        to the start of the buffer and '^' matches there.
+        @retval The match object or None
+        """
+        return regex.search(self.view(), pos)
+
+    def __len__(self):
+        return len(self._data) - self._start
+
+    def __getitem__(self, key):
+        return self.view()[key]
+
+    def __str__(self):
+        return self.getvalue()
+
+    def __repr__(self):
+        return repr(self.getvalue())
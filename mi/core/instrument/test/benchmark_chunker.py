@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.benchmark_chunker
+@file mi/core/instrument/test/benchmark_chunker.py
+@author agent
+@brief Microbenchmark for the chunkers. A synthetic stream
+    of samples separated by long runs of non-data is fed through the chunkers
+    one byte per packet, the way the port agent delivers a slow serial
+    instrument, and the data chunks are drained after every packet the way
+    InstrumentProtocol.got_data does.
+
+Usage:
+    python -m mi.core.instrument.test.benchmark_chunker [size [gap]]
+
+    size  Bytes of synthetic stream to feed, default 10 MB
+    gap   Bytes of non-data between samples, default 4096
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import re
+import sys
+import time
+import zlib
+from functools import partial
+
+from mi.core.instrument.chunker import Chunker
+from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RingBufferChunker
+from mi.core.instrument.chunker import IncrementalSieve
+
+SAMPLE = "SATPAR0229,10.01,2206748111,111\r\n"
+SAMPLE_REGEX = re.compile(r'SATPAR\d{4},\d{1,7}\.\d\d,\d{10},\d{1,3}')
+START_TIME = 3569168821.0
+
+DEFAULT_SIZE = 10 * 1024 * 1024
+DEFAULT_GAP = 4096
+
+
+def sieve():
+    """
+    Regex sieve for the synthetic samples. It is resumable so the sieve
+    does not re-scan the non-data runs and the timing is dominated by
+    buffer handling.
+    """
+    return IncrementalSieve(partial(Chunker.regex_sieve_function,
+                                    regex_list=[SAMPLE_REGEX]),
+                            max_record_size=len(SAMPLE))
+
+
+def stream(size, gap):
+    """
+    @retval A string of samples each preceded by gap bytes of non-data
+    """
+    block = ("x" * gap) + SAMPLE
+    return (block * (size / len(block) + 1))[:size]
+
+
+def feed(chunker, data):
+    """
+    Feed a stream through a chunker one byte per packet
+    @retval (seconds, chunk count, crc of all chunks and timestamps)
+    """
+    count = 0
+    crc = 0
+
+    start = time.time()
+    for index in xrange(len(data)):
+        chunker.add_chunk(data[index], START_TIME + index)
+        (timestamp, chunk) = chunker.get_next_data()
+        while chunk:
+            count += 1
+            crc = zlib.crc32("%s%r" % (chunk, timestamp), crc)
+            (timestamp, chunk) = chunker.get_next_data()
+
+    return (time.time() - start, count, crc)
+
+
+def run():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE
+    gap = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_GAP
+    data = stream(size, gap)
+
+    print "Feeding %d bytes in 1 byte packets, %d bytes between samples" % (size, gap)
+
+    results = []
+    for chunker_class in [StringChunker, RingBufferChunker]:
+        (elapsed, count, crc) = feed(chunker_class(sieve()), data)
+        results.append((count, crc))
+        print "%-20s %8.2f s %10.0f packets/s %8d chunks" % (
+            chunker_class.__name__, elapsed, size / elapsed, count)
+
+    if len(set(results)) != 1:
+        print "MISMATCH: chunkers produced different chunks or timestamps"
+        sys.exit(1)
+
+    print "All chunkers produced the same chunks and timestamps"
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.benchmark_data_particle
+@file mi/core/instrument/test/benchmark_data_particle.py
+@author agent
+@brief Benchmark for data particle generation. Compares building the
+    particle dictionary and passing it to json.dumps, as generate() used to,
+    with the compiled ParticleTemplate path, for the raw particle published
+    for every port agent packet and for a couple of instrument particles.
+
+Usage:
+    python -m mi.core.instrument.test.benchmark_data_particle [seconds]
+
+    seconds  Minimum time to spend on each measurement, default 1
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import time
+
+from mi.core.instrument.data_particle import json
+from mi.core.instrument.data_particle import RawDataParticle
+from mi.core.instrument.port_agent_client import PortAgentPacket
+from mi.instrument.satlantic.par_ser_600m.driver import SatlanticPARDataParticle
+from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+
+DEFAULT_SECONDS = 1.0
+PORT_TIMESTAMP = 3569168821.0
+
+
+def raw_particle():
+    packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+    packet.attach_data(os.urandom(64))
+    packet.pack_header()
+    return RawDataParticle(packet.get_as_dict(), port_timestamp=PORT_TIMESTAMP)
+
+
+def par_particle():
+    return SatlanticPARDataParticle("SATPAR0229,0010.01,2206748544,234\r\n",
+                                    port_timestamp=PORT_TIMESTAMP)
+
+
+def sbe37_particle():
+    return SBE37DataParticle("#55.9044,41.40609, 572.170, 34.2583, 1505.948, 05 Feb 2013, 19:16:59",
+                             port_timestamp=PORT_TIMESTAMP)
+
+
+def dict_generate(particle):
+    """
+    DataParticle.generate before the compiled template
+    """
+    return json.dumps(particle.generate_dict())
+
+
+def measure(function, seconds):
+    """
+    Call a function repeatedly for at least the given time
+    @retval calls per second
+    """
+    calls = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < seconds:
+        for i in xrange(100):
+            function()
+        calls += 100
+        elapsed = time.time() - start
+    return calls / elapsed
+
+
+def run():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SECONDS
+
+    print "json module: %s" % json.__name__
+    print "%-28s %14s %14s %10s" % ("particle", "dict/s", "template/s", "speedup")
+
+    for factory in [raw_particle, par_particle, sbe37_particle]:
+        particle = factory()
+
+        if json.loads(particle.generate()) != json.loads(dict_generate(particle)):
+            print "MISMATCH: %s output differs" % particle.__class__.__name__
+            sys.exit(1)
+
+        dict_rate = measure(lambda: dict_generate(particle), seconds)
+        template_rate = measure(particle.generate, seconds)
+
+        print "%-28s %14.0f %14.0f %9.2fx" % (
+            particle.__class__.__name__, dict_rate, template_rate,
+            template_rate / dict_rate)
+
+
+if __name__ == '__main__':
+    run()
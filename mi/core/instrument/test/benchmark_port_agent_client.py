@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.benchmark_port_agent_client
+@file mi/core/instrument/test/benchmark_port_agent_client.py
+@author agent
+@brief Benchmark for port agent packet checksum verification. Compares the
+    byte at a time XOR loop PortAgentPacket used to run on the listener
+    thread with the bulk xor_checksum path, for packet sizes from 16 B to
+    64 KB.
+
+Usage:
+    python -m mi.core.instrument.test.benchmark_port_agent_client [seconds]
+
+    seconds  Minimum time to spend on each measurement, default 0.5
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import time
+import struct
+
+from mi.core.instrument.port_agent_client import PortAgentPacket
+from mi.core.instrument.port_agent_client import HEADER_SIZE
+from mi.core.instrument.port_agent_client import OFFSET_P_CHECKSUM_LOW
+from mi.core.instrument.port_agent_client import OFFSET_P_CHECKSUM_HIGH
+
+# Port agent packet lengths include the header; the largest fits in the
+# 16 bit length field.
+PACKET_SIZES = [16, 64, 256, 1024, 4096, 16384, 65535]
+DEFAULT_SECONDS = 0.5
+
+
+def loop_checksum(header, data, length):
+    """
+    The original PortAgentPacket.verify_checksum loop
+    """
+    checksum = 0
+    for i in range(HEADER_SIZE):
+        if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
+            checksum ^= struct.unpack_from('B', header[i])[0]
+
+    for i in range(length):
+        checksum ^= struct.unpack_from('B', data[i])[0]
+
+    return checksum
+
+
+def make_packet(packet_size):
+    packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+    packet.attach_data(os.urandom(packet_size - HEADER_SIZE))
+    packet.pack_header()
+    return packet
+
+
+def measure(function, seconds):
+    """
+    Call a function repeatedly for at least the given time
+    @retval calls per second
+    """
+    calls = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < seconds:
+        function()
+        calls += 1
+        elapsed = time.time() - start
+    return calls / elapsed
+
+
+def run():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SECONDS
+
+    print "%10s %14s %14s %10s" % ("packet", "loop MB/s", "bulk MB/s", "speedup")
+
+    for packet_size in PACKET_SIZES:
+        packet = make_packet(packet_size)
+        header = packet.get_header()
+        data = packet.get_data()
+        length = packet.get_data_length()
+
+        if loop_checksum(header, data, length) != packet.calculate_checksum():
+            print "MISMATCH: checksums differ for %d byte packets" % packet_size
+            sys.exit(1)
+
+        loop_rate = measure(lambda: loop_checksum(header, data, length), seconds)
+        bulk_rate = measure(packet.verify_checksum, seconds)
+
+        print "%10d %14.2f %14.2f %9.1fx" % (
+            packet_size,
+            loop_rate * packet_size / 1e6,
+            bulk_rate * packet_size / 1e6,
+            bulk_rate / loop_rate)
+
+
+if __name__ == '__main__':
+    run()
@@ -11,6 +11,7 @@ __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
 import unittest
+import random
 import re
 from functools import partial
 from mi.core.unit_test import MiUnitTest, MiUnitTestCase
@@ -20,6 +21,8 @@ from ooi.logging import log
 
 from mi.core.exceptions import SampleException
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RingBufferChunker
+from mi.core.instrument.chunker import IncrementalSieve
 
 @attr('UNIT', group='mi')
 class UnitTestStringChunker(MiUnitTestCase):
@@ -72,6 +75,27 @@ class UnitTestStringChunker(MiUnitTestCase):
             data_list.append(data[s:e])
         return data_list
     
+    def _random_stream(self, seed, count=300):
+        """ Build a stream of samples and noise, randomly packetized """
+        rand = random.Random(seed)
+        samples = [self.SAMPLE_1, self.SAMPLE_2, self.SAMPLE_3, "Foo", "\r\n",
+                   self.FRAGMENT_1, "Bar"]
+        stream = "".join([rand.choice(samples) for i in range(count)])
+
+        packets = []
+        index = 0
+        while index < len(stream):
+            size = rand.randint(1, 80)
+            packets.append((stream[index:index+size], 3569168821.0 + index))
+            index += size
+        return (rand, packets)
+
+    def _assert_same_state(self, expected, actual):
+        self.assertEquals(expected.buffer, actual.buffer)
+        self.assertEquals(expected.raw_chunk_list, actual.raw_chunk_list)
+        self.assertEquals(expected.data_chunk_list, actual.data_chunk_list)
+        self.assertEquals(expected.nondata_chunk_list, actual.nondata_chunk_list)
+
     def test_sieve(self):
         """
         Do a quick test of the sieve to make sure it does what we want.
@@ -132,6 +156,30 @@ class UnitTestStringChunker(MiUnitTestCase):
         self.assertEquals(result, [(0, 2, self.TIMESTAMP_2),
                                    (10, 15, self.TIMESTAMP_3)])        
     
+    def test_add_timestamps(self):
+        """
+        Verify chunks get the timestamp of the raw chunk they start in
+        """
+        self._chunker.add_chunk("Foo", self.TIMESTAMP_1)
+        self._chunker.add_chunk("Bar", self.TIMESTAMP_2)
+        self._chunker.add_chunk("Bat", self.TIMESTAMP_3)
+
+        result = self._chunker.add_timestamps([(0, 1), (2, 4, 123.456),
+                                               (3, 5), (5, 9), (9, 10)])
+        self.assertEquals(result, [(0, 1, self.TIMESTAMP_1),
+                                   (2, 4, 123.456),
+                                   (3, 5, self.TIMESTAMP_2),
+                                   (5, 9, self.TIMESTAMP_2)])
+
+        # lookups are relative to what is left after cleaning
+        (time, result) = self._chunker.get_next_non_data()
+        self.assertEquals(result, "FooBarBat")
+        self._chunker.add_chunk("Baz", self.TIMESTAMP_2)
+        self._chunker.add_chunk("Bad", self.TIMESTAMP_3)
+        result = self._chunker.add_timestamps([(1, 3), (3, 6)])
+        self.assertEquals(result, [(1, 3, self.TIMESTAMP_2),
+                                   (3, 6, self.TIMESTAMP_3)])
+
     def test_add_get_simple(self):
         """
         Add a simple string of data to the buffer, get the next chunk out
@@ -331,6 +379,123 @@ class UnitTestStringChunker(MiUnitTestCase):
         self.assertRaises(SampleException,
                           self._chunker.add_chunk, "foobar", self.TIMESTAMP_1)
 
+    def test_incremental_sieve(self):
+        """
+        Verify a resumable sieve finds the same chunks as the plain sieve
+        """
+        for seed in range(3):
+            (rand, packets) = self._random_stream(seed)
+            expected = self._chunker.__class__(UnitTestStringChunker.sieve_function)
+            actual = self._chunker.__class__(
+                IncrementalSieve(UnitTestStringChunker.sieve_function,
+                                 max_record_size=40))
+
+            for (packet, timestamp) in packets:
+                expected.add_chunk(packet, timestamp)
+                actual.add_chunk(packet, timestamp)
+                self._assert_same_state(expected, actual)
+
+                result = expected.get_next_data_with_index()
+                self.assertEquals(result, actual.get_next_data_with_index())
+                while result[1] is not None:
+                    result = expected.get_next_data_with_index()
+                    self.assertEquals(result, actual.get_next_data_with_index())
+
+    def test_incremental_sieve_scan_length(self):
+        """
+        Verify non-data is not re-scanned on every packet
+        """
+        scanned = []
+        def counting_sieve(raw_data):
+            scanned.append(len(raw_data))
+            return UnitTestStringChunker.sieve_function(raw_data)
+
+        self._chunker = self._chunker.__class__(
+            IncrementalSieve(counting_sieve, max_record_size=40))
+
+        for i in range(1000):
+            self._chunker.add_chunk("Foo Bar\r\n", self.TIMESTAMP_1)
+        self._chunker.add_chunk(self.SAMPLE_1, self.TIMESTAMP_2)
+
+        self.assertTrue(sum(scanned) < 1001 * 50)
+        (time, result) = self._chunker.get_next_non_data()
+        self.assertTrue(result == "Foo Bar\r\n" * 1000)
+        self.assertEquals(time, self.TIMESTAMP_1)
+        (time, result) = self._chunker.get_next_data()
+        self.assertEquals(result, self.SAMPLE_1)
+        self.assertEquals(time, self.TIMESTAMP_2)
+
+@attr('UNIT', group='mi')
+class UnitTestRingBufferChunker(UnitTestStringChunker):
+    """
+    Run the string chunker tests against the ring buffer chunker and verify
+    both engines produce the same results for the same stream
+    """
+    def setUp(self):
+        """ Setup a chunker for use in tests """
+        self._chunker = RingBufferChunker(UnitTestStringChunker.sieve_function)
+
+    def test_matches_string_chunker(self):
+        """
+        Feed the same packets to both engines with data and non-data
+        consumption interleaved, and compare every result
+        """
+        for seed in range(5):
+            (rand, packets) = self._random_stream(seed)
+            expected = StringChunker(UnitTestStringChunker.sieve_function)
+            actual = RingBufferChunker(UnitTestStringChunker.sieve_function)
+            actual.COMPACT_SIZE = 64
+
+            for (packet, timestamp) in packets:
+                expected.add_chunk(packet, timestamp)
+                actual.add_chunk(packet, timestamp)
+                self._assert_same_state(expected, actual)
+
+                if rand.random() < 0.1:
+                    self.assertEquals(expected.get_next_non_data_with_index(),
+                                      actual.get_next_non_data_with_index())
+
+                result = expected.get_next_data_with_index()
+                self.assertEquals(result, actual.get_next_data_with_index())
+                while result[1] is not None:
+                    result = expected.get_next_data_with_index()
+                    self.assertEquals(result, actual.get_next_data_with_index())
+                self._assert_same_state(expected, actual)
+
+    def test_raw_matches_string_chunker(self):
+        """
+        Consume raw chunks from both engines and compare the results
+        """
+        (rand, packets) = self._random_stream(42, count=40)
+        expected = StringChunker(UnitTestStringChunker.sieve_function)
+        actual = RingBufferChunker(UnitTestStringChunker.sieve_function)
+
+        for (packet, timestamp) in packets:
+            expected.add_chunk(packet, timestamp)
+            actual.add_chunk(packet, timestamp)
+
+        self.assertEquals(expected.get_next_raw(clean=False),
+                          actual.get_next_raw(clean=False))
+        result = expected.get_next_raw()
+        self.assertEquals(result, actual.get_next_raw())
+        while result[1] is not None:
+            self._assert_same_state(expected, actual)
+            result = expected.get_next_raw()
+            self.assertEquals(result, actual.get_next_raw())
+
+    def test_buffer_compaction(self):
+        """
+        Verify consumed data is released from the backing array
+        """
+        self._chunker.COMPACT_SIZE = 64
+        for i in range(100):
+            self._chunker.add_chunk(self.SAMPLE_1, self.TIMESTAMP_1)
+            (time, result) = self._chunker.get_next_data()
+            self.assertEquals(result, self.SAMPLE_1)
+
+        self.assertEquals(self._chunker.buffer, "")
+        self.assertTrue(len(self._chunker._ring) < 128)
+
 @unittest.skip("Write this when a binary chunker is needed")
 @attr('UNIT', group='mi')
 class UnitTestBinaryChunker(MiUnitTestCase):
@@ -22,7 +22,7 @@ from mi.core.unit_test import MiUnitTestCase
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException, InstrumentParameterException
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
-from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType
+from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType, ParticleTemplate
 from mi.core.instrument.port_agent_client import PortAgentPacket
 
 TEST_PARTICLE_VERSION = 1
@@ -212,6 +212,94 @@ class TestUnitDataParticle(MiUnitTestCase):
 
         self.assertEqual(raw_result, standard)
         
+    def test_template_generate(self):
+        """
+        Particles written through the compiled template decode to the same
+        structure as generate_dict, including values json.dumps treats
+        specially and values the template cannot handle.
+        """
+        class TypedDataParticle(DataParticle):
+            _data_particle_type = TEST_PARTICLE_TYPE
+
+            def _build_parsed_values(self):
+                return [{DataParticleKey.VALUE_ID: "float", DataParticleKey.VALUE: 1.1},
+                        {DataParticleKey.VALUE_ID: "int", DataParticleKey.VALUE: 7},
+                        {DataParticleKey.VALUE_ID: "long", DataParticleKey.VALUE: 2**70},
+                        {DataParticleKey.VALUE_ID: "bool", DataParticleKey.VALUE: False},
+                        {DataParticleKey.VALUE_ID: "none", DataParticleKey.VALUE: None},
+                        {DataParticleKey.VALUE_ID: "100%", DataParticleKey.VALUE: u"\u00b0C \"x\""},
+                        {DataParticleKey.VALUE_ID: "list", DataParticleKey.VALUE: [1, 2.5, "a"]},
+                        {DataParticleKey.VALUE_ID: "nan", DataParticleKey.VALUE: float('nan')}]
+
+        class ExtraKeyDataParticle(DataParticle):
+            _data_particle_type = TEST_PARTICLE_TYPE
+
+            def _build_parsed_values(self):
+                return [{DataParticleKey.VALUE_ID: "temp",
+                         DataParticleKey.VALUE: 1.5,
+                         "units": "C"}]
+
+        particles = [self.parsed_test_particle,
+                     self.raw_test_particle,
+                     TypedDataParticle(self.sample_raw_data, internal_timestamp=self.sample_internal_timestamp,
+                                       new_sequence=True),
+                     ExtraKeyDataParticle(self.sample_raw_data, port_timestamp=0)]
+
+        for particle in particles:
+            for i in range(2):
+                decoded = json.loads(particle.generate())
+                expected = json.loads(json.dumps(particle.generate_dict()))
+                # NaN never compares equal
+                if particle.__class__ is TypedDataParticle:
+                    self.assertNotEqual(decoded[DataParticleKey.VALUES][-1][DataParticleKey.VALUE],
+                                        decoded[DataParticleKey.VALUES][-1][DataParticleKey.VALUE])
+                    del decoded[DataParticleKey.VALUES][-1]
+                    del expected[DataParticleKey.VALUES][-1]
+                self.assertEqual(decoded, expected)
+
+        self.assertIsNotNone(DataParticle._templates[TypedDataParticle])
+
+    def test_template_value_id_not_string(self):
+        """
+        Value ids that aren't strings are written with json.dumps, as before
+        the template, and nothing is compiled for them.
+        """
+        class NumberValueIdDataParticle(DataParticle):
+            _data_particle_type = TEST_PARTICLE_TYPE
+
+            def _build_parsed_values(self):
+                return [{DataParticleKey.VALUE_ID: 1, DataParticleKey.VALUE: 1.5},
+                        {DataParticleKey.VALUE_ID: None, DataParticleKey.VALUE: 2},
+                        {DataParticleKey.VALUE_ID: 2.5, DataParticleKey.VALUE: "a"}]
+
+        particle = NumberValueIdDataParticle(self.sample_raw_data, port_timestamp=0)
+        for i in range(2):
+            self.assertEqual(json.loads(particle.generate()),
+                             json.loads(json.dumps(particle.generate_dict())))
+
+        self.assertEqual(DataParticle._templates[NumberValueIdDataParticle]._formats, {})
+
+    def test_template_format_limit(self):
+        """
+        Once a template has compiled MAX_FORMATS formats, particles with new
+        signatures are written with json.dumps and the cache stops growing.
+        """
+        class VaryingDataParticle(DataParticle):
+            _data_particle_type = TEST_PARTICLE_TYPE
+
+            def _build_parsed_values(self):
+                return [{DataParticleKey.VALUE_ID: "value_%s" % self.raw_data,
+                         DataParticleKey.VALUE: 1}]
+
+        count = ParticleTemplate.MAX_FORMATS + 10
+        for i in range(count):
+            particle = VaryingDataParticle(str(i), port_timestamp=0)
+            decoded = json.loads(particle.generate())
+            self.assertEqual(decoded, json.loads(json.dumps(particle.generate_dict())))
+
+        template = DataParticle._templates[VaryingDataParticle]
+        self.assertEqual(len(template._formats), ParticleTemplate.MAX_FORMATS)
+
     def test_timestamps(self):
         """
         Test bad timestamp configurations
@@ -12,8 +12,10 @@ __license__ = 'Apache 2.0'
 
 import re
 import time
+import random
 import ntplib
 import datetime
+from threading import Thread
 from mock import Mock
 from nose.plugins.attrib import attr
 from mi.core.log import get_logger ; log = get_logger()
@@ -22,6 +24,7 @@ from mi.core.instrument.instrument_driver import DriverParameter
 from mi.core.instrument.instrument_protocol import InstrumentProtocol
 from mi.core.instrument.instrument_protocol import MenuInstrumentProtocol
 from mi.core.instrument.instrument_protocol import CommandResponseInstrumentProtocol
+from mi.core.instrument.instrument_protocol import PromptMatcher
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.instrument_driver import ConfigMetadataKey
 from mi.instrument.satlantic.par_ser_600m.driver import SAMPLE_REGEX
@@ -609,6 +612,119 @@ class TestUnitCommandInstrumentProtocol(MiUnitTestCase):
                           self.TestEvent.TEST, expected_prompt=">", response_regex=regex1)
 
 
+    def test_get_response_wakeup(self):
+        """
+        Data added by another thread wakes a waiting _get_response, including
+        a prompt split across two additions.
+        """
+        self.protocol._get_prompts = lambda: ["S>", ">"]
+
+        def respond():
+            time.sleep(.2)
+            self.protocol.add_to_buffer("response line\r\nS")
+            time.sleep(.2)
+            self.protocol.add_to_buffer(">")
+
+        thread = Thread(target=respond)
+        thread.start()
+        (prompt, result) = self.protocol._get_response(timeout=5)
+        thread.join()
+
+        self.assertEqual(prompt, "S>")
+        self.assertEqual(result, "response line\r\nS>")
+
+        # Only new data is searched, but a prompt already in the buffer is
+        # still found first
+        self.protocol._promptbuf = "one > two S>"
+        self.assertEqual(self.protocol._get_response(timeout=1), ("S>", "one > two S>"))
+        self.assertEqual(self.protocol._get_response(timeout=1, expected_prompt=">"), (">", "one >"))
+
+        # Data added without add_to_buffer is still found
+        def append():
+            time.sleep(.2)
+            self.protocol._promptbuf += "S>"
+
+        self.protocol._promptbuf = ""
+        thread = Thread(target=append)
+        thread.start()
+        self.assertEqual(self.protocol._get_response(timeout=5), ("S>", "S>"))
+        thread.join()
+
+        self.protocol._promptbuf = ""
+        self.assertRaises(InstrumentTimeoutException, self.protocol._get_response, timeout=.5)
+        self.assertRaises(InstrumentTimeoutException, self.protocol._get_raw_response, timeout=.5)
+
+
+    def test_search_while_appending(self):
+        """
+        Data added by another thread while a prompt search is running waits
+        for the search, so the buffer searched in place doesn't change under
+        it.
+        """
+        self.protocol._get_prompts = lambda: ["S>", ">"]
+        self.protocol._send_wakeup = lambda: self.protocol.add_to_buffer("S>")
+        searched = []
+
+        class AppendingMatcher(PromptMatcher):
+            """
+            Matcher adding data from another thread mid search
+            """
+            def search(matcher, buf, start=0):
+                before = str(buf)
+                thread = Thread(target=self.protocol.add_to_buffer, args=("more",))
+                thread.start()
+                thread.join(.2)
+                searched.append((before, str(buf), thread))
+                return PromptMatcher.search(matcher, buf, start)
+
+        matcher = AppendingMatcher(["S>", ">"])
+        self.protocol._get_prompt_matcher = lambda prompt_list=None: matcher
+
+        self.assertEqual(self.protocol._wakeup(timeout=5, delay=0), "S>")
+        self.assertEqual(self.protocol._get_response(timeout=5), ("S>", "S>"))
+
+        self.assertEqual(len(searched), 2)
+        for (before, after, thread) in searched:
+            self.assertEqual(before, after)
+            thread.join()
+        self.assertEqual(self.protocol._promptbuf, "S>moremore")
+
+    def test_prompt_matcher(self):
+        """
+        The matcher finds the same prompt as trying each prompt in turn with
+        str.find, including prompts overlapping each other.
+        """
+        def find_each(prompts, buf, start):
+            for prompt in prompts:
+                index = buf.find(prompt, start)
+                if index >= 0:
+                    return (prompt, index)
+
+        random.seed(8)
+        for i in range(500):
+            prompts = ["".join([random.choice("ab>") for j in range(random.randint(1, 4))])
+                       for k in range(random.randint(1, 4))]
+            buf = "".join([random.choice("ab>\r\n") for j in range(random.randint(0, 40))])
+            start = random.randint(0, len(buf))
+
+            matcher = PromptMatcher(prompts)
+            self.assertEqual(matcher.search(buf, start), find_each(prompts, buf, start))
+            self.assertEqual(matcher.search(buf), find_each(prompts, buf, 0))
+
+        matcher = PromptMatcher(["S>", ">"])
+        self.assertEqual(matcher.search("ABCD", 0), None)
+        self.assertEqual(PromptMatcher(["BCD", "AB"]).search("ABCD"), ("BCD", 1))
+        self.assertEqual(PromptMatcher([]).search("ABCD"), None)
+
+        self.assertEqual(matcher.match_end("data S> \t", " \t"), "S>")
+        self.assertEqual(matcher.match_end("data > ", " \t"), ">")
+        self.assertEqual(matcher.match_end("data >x", " \t"), None)
+
+        # Matchers are compiled once per prompt list
+        self.assertIs(self.protocol._get_prompt_matcher(),
+                      self.protocol._get_prompt_matcher([">"]))
+
+
 @attr('UNIT', group='mi')
 class TestUnitMenuInstrumentProtocol(MiUnitTestCase):
     """
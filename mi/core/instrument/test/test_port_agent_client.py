@@ -22,6 +22,8 @@ import datetime
 import array
 import struct
 import ctypes
+import socket
+import threading
 from nose.plugins.attrib import attr
 from mock import Mock
 
@@ -40,6 +42,11 @@ from mi.idk.unit_test import InstrumentDriverIntegrationTestCase
 
 from mi.core.instrument.port_agent_client import PortAgentClient, PortAgentPacket, Listener
 from mi.core.instrument.port_agent_client import HEADER_SIZE
+from mi.core.instrument.port_agent_client import xor_checksum
+from mi.core.instrument.port_agent_client import PacketReassembler
+from mi.core.instrument.port_agent_client import SocketClosed
+from mi.core.instrument.port_agent_client import PortAgentReactor
+from mi.core.instrument.port_agent_client import ReactorListener
 from mi.core.instrument.instrument_driver import DriverConnectionState
 from mi.core.instrument.instrument_driver import DriverProtocolState
 
@@ -408,6 +415,124 @@ class PAClientTestPortAgentPacket(MiUnitTest):
         checksum = self.pap.calculate_checksum()
         self.assertEqual(checksum, 2)
 
+    def test_xor_checksum(self):
+        """
+        Verify the bulk checksum matches a byte at a time XOR for buffers
+        that do and do not fill whole 64 bit words.
+        """
+        for length in [0, 1, 7, 8, 9, 16, 33, 4096, 4099]:
+            test_data = "".join([chr((i * 37 + length) % 256) for i in range(length)])
+            expected = 0
+            for byte in test_data:
+                expected ^= ord(byte)
+
+            self.assertEqual(xor_checksum(test_data), expected)
+            self.assertEqual(xor_checksum(bytearray(test_data)), expected)
+
+        self.assertEqual(xor_checksum("\x01\x02\x04\x08", 2), 3)
+
+    def test_packet_reassembler(self):
+        """
+        Feed a stream of packets through the reassembler in reads of various
+        sizes, including reads that split headers and reads spanning several
+        packets, with a block small enough that partial packets must be
+        carried over to new blocks.
+        """
+        class FakeSocket(object):
+            def __init__(self, data, read_size):
+                self.data = data
+                self.read_size = read_size
+                self.pos = 0
+
+            def recv_into(self, buf, nbytes):
+                nbytes = min(nbytes, self.read_size, len(self.data) - self.pos)
+                buf[:nbytes] = self.data[self.pos:self.pos + nbytes]
+                self.pos += nbytes
+                return nbytes
+
+        packets = []
+        for i in range(50):
+            packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+            packet.attach_data("".join([chr((i + j) % 256) for j in range((i * 97) % 3000 + 1)]))
+            packet.pack_header()
+            packets.append(packet)
+        stream = "".join([p.get_header() + p.get_data() for p in packets])
+
+        for read_size in [1, 13, 4096, len(stream)]:
+            reassembler = PacketReassembler(8192)
+            sock = FakeSocket(stream, read_size)
+            received = []
+            while len(received) < len(packets):
+                packet = reassembler.next_packet()
+                if packet:
+                    received.append(packet)
+                else:
+                    reassembler.recv(sock)
+
+            self.assertIsNone(reassembler.next_packet())
+            for (got, expected) in zip(received, packets):
+                self.assertEqual(got.get_data_length(), expected.get_data_length())
+                self.assertEqual(got.calculate_checksum(), expected.calculate_checksum())
+                self.assertEqual(got.get_data_view().tobytes(), expected.get_data())
+                self.assertEqual(got.get_data(), expected.get_data())
+                self.assertEqual(got.get_header(), expected.get_header())
+
+        # The port agent closing the connection
+        self.assertRaises(SocketClosed, reassembler.recv, sock)
+
+    def test_packet_reassembler_bad_length(self):
+        """
+        A header with a length shorter than the header is skipped.
+        """
+        class FakeSocket(object):
+            def recv_into(self, buf, nbytes):
+                header = struct.pack('>BBBBHHII', 163, 157, 122, 2, 4, 0, 0, 0)
+                buf[:HEADER_SIZE] = header
+                return HEADER_SIZE
+
+        reassembler = PacketReassembler()
+        reassembler.recv(FakeSocket())
+        self.assertRaises(InstrumentConnectionException, reassembler.next_packet)
+        self.assertIsNone(reassembler.next_packet())
+
+    def test_packet_reassembler_resync(self):
+        """
+        After a corrupt header the reassembler scans forward to the next
+        sync bytes, rather than a fixed distance into what may be the
+        middle of a packet, and carries on with the packets after it.
+        """
+        class FakeSocket(object):
+            def __init__(self, data):
+                self.data = data
+
+            def recv_into(self, buf, nbytes):
+                nbytes = min(nbytes, len(self.data))
+                buf[:nbytes] = self.data[:nbytes]
+                self.data = self.data[nbytes:]
+                return nbytes
+
+        packets = []
+        for i in range(3):
+            packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+            packet.attach_data("packet %d" % i * (i + 5))
+            packet.pack_header()
+            packets.append(packet.get_header() + packet.get_data())
+
+        # a bad length, the rest of a packet without its header and part of
+        # a sync sequence, then good packets
+        bad_header = struct.pack('>BBBBHHII', 163, 157, 122, 2, 4, 0, 0, 0)
+        stream = packets[0] + bad_header + packets[2][HEADER_SIZE:] + "\xa3\x9d" + \
+                 packets[1] + packets[2]
+
+        reassembler = PacketReassembler()
+        reassembler.recv(FakeSocket(stream))
+        self.assertEqual(reassembler.next_packet().get_data(), packets[0][HEADER_SIZE:])
+        # raised once for the whole corrupt stretch
+        self.assertRaises(InstrumentConnectionException, reassembler.next_packet)
+        self.assertEqual(reassembler.next_packet().get_data(), packets[1][HEADER_SIZE:])
+        self.assertEqual(reassembler.next_packet().get_data(), packets[2][HEADER_SIZE:])
+        self.assertIsNone(reassembler.next_packet())
+
     def test_unpack_header(self):
         self.pap = PortAgentPacket()
         data_length = 32
@@ -420,6 +545,179 @@ class PAClientTestPortAgentPacket(MiUnitTest):
         #self.assertEqual(got_timestamp, 1105890970.110589)
         self.assertEqual(self.pap.get_header_recv_checksum(), 3729) 
 
+@attr('UNIT', group='mi')
+class PAClientTestReactor(MiUnitTest):
+    def setUp(self):
+        self.reactor = PortAgentReactor()
+        self.reactor.start()
+        self.addCleanup(self.reactor.stop)
+        self.raw_data = []
+        self.errors = []
+        self.error_event = threading.Event()
+
+    def callback_raw(self, paPacket):
+        self.raw_data.append(paPacket.get_data())
+
+    def callback_error(self, error_string):
+        self.errors.append(error_string)
+        self.error_event.set()
+        return False
+
+    def add_listener(self, heartbeat = 0, max_missed_heartbeats = None,
+                     callback_error = None, reactor = None):
+        """
+        Register a listener on one end of a socket pair
+        @param callback_error Local recovery callback, callback_error if None
+        @param reactor Reactor to register with, the test reactor if None
+        @retval (listener, the port agent end of the pair)
+        """
+        (sock, port_agent_sock) = socket.socketpair()
+        sock.setblocking(0)
+        self.addCleanup(sock.close)
+        self.addCleanup(port_agent_sock.close)
+
+        listener = ReactorListener(reactor or self.reactor, sock, 1, None, heartbeat,
+                                   max_missed_heartbeats, None,
+                                   self.callback_raw, None,
+                                   callback_error or self.callback_error,
+                                   self.callback_error)
+        listener.start()
+        return (listener, port_agent_sock)
+
+    def send_packet(self, sock, packet_type, data):
+        packet = PortAgentPacket(packet_type)
+        packet.attach_data(data)
+        packet.pack_header()
+        sock.sendall(packet.get_header() + packet.get_data())
+
+    def test_dispatch(self):
+        """
+        Packets sent to many connections are all delivered by the one
+        reactor thread.
+        """
+        connections = [self.add_listener() for i in range(10)]
+        for i in range(200):
+            (listener, sock) = connections[i % len(connections)]
+            self.send_packet(sock, PortAgentPacket.DATA_FROM_DRIVER, "packet %d" % i)
+
+        timeout = time.time() + 5
+        while len(self.raw_data) < 200 and time.time() < timeout:
+            time.sleep(.01)
+
+        self.assertEqual(sorted(self.raw_data), sorted(["packet %d" % i for i in range(200)]))
+        self.assertEqual(self.errors, [])
+
+        for (listener, sock) in connections:
+            self.assertTrue(listener.is_alive())
+            listener.done()
+            listener.join()
+            self.assertFalse(listener.is_alive())
+
+    def test_socket_closed(self):
+        """
+        A port agent closing the connection reports an error and detaches
+        the listener.
+        """
+        (listener, sock) = self.add_listener()
+        sock.close()
+
+        self.assertTrue(self.error_event.wait(5))
+        self.assertEqual(len(self.errors), 1)
+        self.assertFalse(listener.is_alive())
+
+    def test_heartbeat(self):
+        """
+        Heartbeats hold off the timeout; once they stop the listener reports
+        an error after the allowed number of missed heartbeats. The interval
+        is the heartbeat plus the one second fudge factor.
+        """
+        (listener, sock) = self.add_listener(heartbeat = 1, max_missed_heartbeats = 1)
+        start = time.time()
+        for i in range(3):
+            time.sleep(1)
+            self.send_packet(sock, PortAgentPacket.HEARTBEAT, "")
+            self.assertEqual(self.errors, [])
+
+        self.assertTrue(self.error_event.wait(5))
+        self.assertGreaterEqual(time.time() - start, 5)
+        self.assertFalse(listener.is_alive())
+
+    def test_recovery_off_reactor_thread(self):
+        """
+        Connection recovery runs on a worker thread, so a recovery that
+        blocks doesn't hold up packets for the other connections.
+        """
+        recovering = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def blocking_recovery(error_string):
+            recovering.set()
+            release.wait(10)
+            return True
+
+        (listener, sock) = self.add_listener(callback_error = blocking_recovery)
+        (other, other_sock) = self.add_listener()
+        # First connection, so the local recovery callback is tried
+        listener.recovery_attempt = 0
+        sock.close()
+        self.assertTrue(recovering.wait(5))
+
+        self.send_packet(other_sock, PortAgentPacket.DATA_FROM_DRIVER, "during recovery")
+        timeout = time.time() + 5
+        while not self.raw_data and time.time() < timeout:
+            time.sleep(.01)
+
+        self.assertEqual(self.raw_data, ["during recovery"])
+        self.assertFalse(listener.is_alive())
+        self.assertTrue(other.is_alive())
+
+    def test_call_later(self):
+        """
+        call_later calls on a worker thread once the delay has passed.
+        """
+        called = threading.Event()
+        calls = []
+
+        def call(value):
+            calls.append((value, time.time(), self.reactor.is_worker_thread()))
+            called.set()
+
+        start = time.time()
+        self.reactor.call_later(.2, call, 'value')
+        self.assertFalse(self.reactor.is_worker_thread())
+        self.assertTrue(called.wait(5))
+
+        (value, when, on_worker) = calls[0]
+        self.assertEqual(value, 'value')
+        self.assertGreaterEqual(when - start, .2)
+        self.assertTrue(on_worker)
+
+    def test_bad_file_descriptor(self):
+        """
+        A socket closed without leaving the reactor makes select fail with
+        EBADF; the reactor drops it and carries on servicing the rest.
+        """
+        reactor = PortAgentReactor()
+        # Use the select fallback, which reports closed descriptors as EBADF
+        reactor._poller._poller = None
+        reactor.start()
+        self.addCleanup(reactor.stop)
+
+        (listener, sock) = self.add_listener(reactor = reactor)
+        (other, other_sock) = self.add_listener(reactor = reactor)
+        listener.sock.close()
+
+        self.send_packet(other_sock, PortAgentPacket.DATA_FROM_DRIVER, "after close")
+        timeout = time.time() + 5
+        while not self.raw_data and time.time() < timeout:
+            time.sleep(.01)
+
+        self.assertEqual(self.raw_data, ["after close"])
+        self.assertTrue(reactor.is_alive())
+        self.assertFalse(listener.reactor_fd in reactor._poller.fds())
+
+
 @attr('INT', group='mi')
 class PAClientIntTestCase(InstrumentDriverTestCase):
     def initialize(cls, *args, **kwargs):
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_ring_buffer
+@file mi/core/instrument/test/test_ring_buffer.py
+@author agent
+@brief Test cases for the protocol ring buffer
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import random
+import re
+from nose.plugins.attrib import attr
+from mi.core.unit_test import MiUnitTestCase
+
+from mi.core.instrument.ring_buffer import RingBuffer
+
+@attr('UNIT', group='mi')
+class UnitTestRingBuffer(MiUnitTestCase):
+    """
+    Test the ring buffer against a plain string truncated to the same size
+    """
+    def test_append(self):
+        ring = RingBuffer(5)
+        ring.append("abc")
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.getvalue(), "abc")
+
+        ring.append("defg")
+        self.assertEqual(len(ring), 5)
+        self.assertEqual(str(ring), "cdefg")
+
+        # A size given with the append overrides the constructor's
+        ring.append("h", 3)
+        self.assertEqual(str(ring), "fgh")
+
+        ring.clear()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(str(ring), "")
+
+        ring.set("0123456789")
+        self.assertEqual(str(ring), "0123456789")
+        ring.append("a")
+        self.assertEqual(str(ring), "6789a")
+
+    def test_matches_string(self):
+        """
+        Random appends, finds, searches and slices behave as on a string
+        """
+        random.seed(9)
+        regex = re.compile(r'^(\w+)|(b+)>')
+        ring = RingBuffer(20)
+        model = ""
+
+        for i in range(2000):
+            data = "".join([random.choice("ab> \r\n") for j in range(random.randint(0, 8))])
+            ring.append(data)
+            model = (model + data)[-20:]
+
+            self.assertEqual(len(ring), len(model))
+            self.assertEqual(ring.getvalue(), model)
+
+            start = random.randint(-25, 25)
+            end = random.choice([None, random.randint(-25, 25)])
+            self.assertEqual(ring.find("b>", start, end), model.find("b>", start, end))
+            self.assertEqual(ring.find(">"), model.find(">"))
+            self.assertEqual(ring[start:end], model[start:end])
+            if model:
+                self.assertEqual(ring[-1], model[-1])
+
+            match = ring.search(regex)
+            expected = regex.search(model)
+            if expected:
+                self.assertEqual(match.groups(), expected.groups())
+                self.assertEqual(match.span(), expected.span())
+            else:
+                self.assertIsNone(match)
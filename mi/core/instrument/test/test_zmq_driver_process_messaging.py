@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_driver_process_messaging
+@file mi/core/instrument/test/test_zmq_driver_process_messaging.py
+@author agent
+@brief Test the ZmqDriverProcess messaging thread over real sockets and
+threads. test_zmq_driver_process runs under gevent's monkey patching, as
+does anything importing pyon, so this module uses plain unittest and leaves
+threading unpatched, the way a driver process runs.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+import zmq
+from nose.plugins.attrib import attr
+
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+
+# milliseconds to wait for a reply or an event
+TIMEOUT = 5000
+
+
+class EchoDriver(object):
+    """
+    Driver with a single command returning its argument
+    """
+    def echo(self, value):
+        return value
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverProcessMessaging(unittest.TestCase):
+    """
+    Unit tests for the ZMQ driver process messaging thread.
+    """
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.process = ZmqDriverProcess('mi.core.instrument.test.test_zmq_driver_process_messaging',
+                                        'EchoDriver', os.path.join(directory, 'cmd_port'),
+                                        os.path.join(directory, 'evt_port'), None)
+        self.process.driver = EchoDriver()
+        self.process.start_messaging()
+        self.addCleanup(self.stop_process)
+
+        # the messaging thread binds the ports once it is running
+        timeout = time.time() + TIMEOUT / 1000.0
+        while self.process.evt_port is None and time.time() < timeout:
+            time.sleep(.01)
+        self.assertIsNotNone(self.process.evt_port)
+
+        self.context = zmq.Context()
+        self.addCleanup(self.context.term)
+        self.cmd_sock = self.socket(zmq.REQ, self.process.cmd_port)
+        self.evt_sock = self.socket(zmq.SUB, self.process.evt_port)
+        self.evt_sock.setsockopt(zmq.SUBSCRIBE, '')
+        self.sync_events()
+
+    def socket(self, socket_type, port):
+        sock = self.context.socket(socket_type)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect('tcp://localhost:%d' % port)
+        self.addCleanup(sock.close)
+        return sock
+
+    def stop_process(self):
+        self.process.stop_messaging()
+        self.process.messaging_thread.join(TIMEOUT / 1000.0)
+
+    def sync_events(self):
+        """
+        Send events until the subscription has reached the publisher, then
+        drop them, so no later event is lost while the subscriber joins.
+        """
+        timeout = time.time() + TIMEOUT / 1000.0
+        while time.time() < timeout:
+            self.process.send_event('sync')
+            if self.evt_sock.poll(100):
+                break
+        while self.evt_sock.poll(100):
+            self.assertEqual(self.evt_sock.recv_pyobj(), 'sync')
+
+    def command(self, cmd, *args, **kwargs):
+        self.cmd_sock.send_pyobj({'cmd': cmd, 'args': args, 'kwargs': kwargs})
+        self.assertTrue(self.cmd_sock.poll(TIMEOUT))
+        return self.cmd_sock.recv_pyobj()
+
+    def receive_event(self):
+        self.assertTrue(self.evt_sock.poll(TIMEOUT))
+        return self.evt_sock.recv_pyobj()
+
+    def test_command_round_trip(self):
+        """
+        Test commands are passed to the driver and the result is returned,
+        and events queued by a command are published.
+        """
+        self.assertEqual(self.command('echo', {'value': 5}), {'value': 5})
+        self.assertEqual(self.command('test_events', events=['a', 'b']), 'test_events')
+        self.assertEqual([self.receive_event(), self.receive_event()], ['a', 'b'])
+
+    def test_event_from_thread(self):
+        """
+        Test events sent from another thread wake the messaging thread and
+        are published straight away, in order.
+        """
+        for i in range(10):
+            start = time.time()
+            thread = Thread(target=self.process.send_event, args=({'n': i},))
+            thread.start()
+            self.assertEqual(self.receive_event(), {'n': i})
+            self.assertLess(time.time() - start, .5)
+            thread.join()
+
+        for i in range(100):
+            self.process.send_event(i)
+        self.assertEqual([self.receive_event() for i in range(100)], range(100))
+
+    def test_stop_driver_process(self):
+        """
+        Test stop_driver_process replies, then ends the messaging thread.
+        """
+        self.assertEqual(self.command('stop_driver_process'), 'stop_driver_process')
+        self.process.messaging_thread.join(TIMEOUT / 1000.0)
+        self.assertFalse(self.process.messaging_thread.is_alive())
+        self.assertFalse(self.process.messaging_started)
+        self.assertIsNone(self.process.context)
+
+        # events sent after stopping are queued, not sent
+        self.process.send_event('after stop')
+        self.assertEqual(list(self.process.events), ['after stop'])
+
+
+class DrainRaceSocket(object):
+    """
+    Receiving end of the wakeup pair that queues an event from another
+    thread on the first receive, while the wakeups are being drained.
+    """
+    def __init__(self, sock, process):
+        self.sock = sock
+        self.process = process
+        self.thread = None
+
+    def recv(self, *args, **kwargs):
+        if self.thread is None:
+            self.thread = Thread(target=self.process.send_event, args=('e2',))
+            self.thread.start()
+            # give the sender time to wake the messaging thread, it waits
+            # for the drain to finish if the drain holds the wakeup lock
+            self.thread.join(.5)
+        return self.sock.recv(*args, **kwargs)
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverProcessWakeup(unittest.TestCase):
+    """
+    Unit tests for waking the ZMQ driver process messaging thread, driving
+    its event publishing directly.
+    """
+    def setUp(self):
+        self.process = ZmqDriverProcess('mi.core.instrument.test.test_zmq_driver_process_messaging',
+                                        'EchoDriver', None, None, None)
+        self.context = zmq.Context()
+        self.addCleanup(self.context.term)
+        self.recv_sock = self.socket(zmq.PAIR)
+        self.recv_sock.bind(self.process.wakeup_address)
+        self.process.wakeup_sock = self.socket(zmq.PAIR)
+        self.process.wakeup_sock.connect(self.process.wakeup_address)
+        self.evt_sock = self.socket(zmq.PUB)
+
+    def socket(self, socket_type):
+        sock = self.context.socket(socket_type)
+        sock.setsockopt(zmq.LINGER, 0)
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_event_queued_during_drain(self):
+        """
+        Test an event queued while the wakeups are drained still leaves a
+        wakeup for the next event, so the messaging thread isn't left
+        blocked with events queued.
+        """
+        self.process.send_event('e1')
+        race_sock = DrainRaceSocket(self.recv_sock, self.process)
+        self.process._send_events(self.evt_sock, race_sock)
+        race_sock.thread.join(TIMEOUT / 1000.0)
+
+        self.process.send_event('e3')
+        self.assertTrue(self.recv_sock.poll(500))
+
+        self.process._send_events(self.evt_sock, self.recv_sock)
+        self.assertEqual(list(self.process.events), [])
+        self.assertFalse(self.process.wakeup_pending)
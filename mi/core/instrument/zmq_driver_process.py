@@ -17,7 +17,7 @@ p = zdp.ZmqDriverProcess.launch_process(5556, 5557, 'ion.services.mi.drivers.sbe
 
 """
 
-from threading import Thread
+from threading import Thread, Lock
 from subprocess import Popen
 import os
 import time
@@ -46,9 +46,11 @@ def _encode_exception(reply):
 class ZmqDriverProcess(driver_process.DriverProcess):
     """
     A OS-level driver process that communicates with ZMQ sockets.
-    Command-REP and event-PUB sockets monitor and react to comms
-    needs in separate threads, which can be signaled to end
-    by setting boolean flags stop_cmd_thread and stop_evt_thread.
+    A single messaging thread polls the command-REP socket and an
+    in-process wakeup socket, answering commands and publishing queued
+    events on the event-PUB socket as soon as they are ready. Events are
+    queued from any thread with send_event, which wakes the messaging
+    thread, and the thread ends when stop_messaging is called.
     """
     
     @classmethod
@@ -118,104 +120,155 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         self.evt_port_fname = evt_port_fname
         self.cmd_host_string = 'tcp://*'
         self.event_host_string ='tcp://*'
-        self.evt_thread = None
-        self.stop_evt_thread = True
-        self.cmd_thread = None
-        self.stop_cmd_thread = True
+        self.messaging_thread = None
+        self.stop_messaging_thread = True
+        self.context = None
+        # in-process socket pair used to wake the messaging thread, the
+        # sending end is shared by every thread that queues events
+        self.wakeup_address = 'inproc://wakeup-%s' % uuid.uuid4()
+        self.wakeup_sock = None
+        self.wakeup_lock = Lock()
+        # true while a wakeup is on its way to the messaging thread
+        self.wakeup_pending = False
         
     def start_messaging(self):
         """
-        Initialize and start messaging resources for the driver, blocking
-        until messaging terminates. This ZMQ implementation starts and
-        joins command and event threads, managing nonblocking send/recv calls
-        on REP and PUB sockets, respectively. Terminate loops and close
-        sockets when stop flag is set in driver process.
+        Initialize and start messaging resources for the driver. This ZMQ
+        implementation starts a messaging thread that polls the REP command
+        socket and the event wakeup socket, and terminates and closes the
+        sockets when the stop flag is set in the driver process.
         """
-        def recv_cmd_msg(zmq_driver_process):
+        def run_messaging(zmq_driver_process):
             """
-            Await commands on a ZMQ REP socket, forwaring them to the
-            driver for processing and returning the result.
+            Await commands on a ZMQ REP socket, forwarding them to the
+            driver for processing and returning the result, and publish
+            events from the driver process event queue on a ZMQ PUB socket
+            to the driver process client.
             """
-            context = zmq.Context()
-            sock = context.socket(zmq.REP)
-            zmq_driver_process.cmd_port = sock.bind_to_random_port(zmq_driver_process.cmd_host_string)
+            context = zmq_driver_process.context
+            cmd_sock = context.socket(zmq.REP)
+            zmq_driver_process.cmd_port = cmd_sock.bind_to_random_port(zmq_driver_process.cmd_host_string)
             log.info('Driver process cmd socket bound to %i' %
                            zmq_driver_process.cmd_port)
             file(zmq_driver_process.cmd_port_fname,'w+').write(str(zmq_driver_process.cmd_port)+'\n')
 
-            zmq_driver_process.stop_cmd_thread = False
-            while not zmq_driver_process.stop_cmd_thread:
-                try:
-                    msg = sock.recv_pyobj(flags=zmq.NOBLOCK)
+            evt_sock = context.socket(zmq.PUB)
+            zmq_driver_process.evt_port = evt_sock.bind_to_random_port(zmq_driver_process.event_host_string)
+            log.info('Driver process event socket bound to %i', zmq_driver_process.evt_port)
+            file(zmq_driver_process.evt_port_fname,'w+').write(str(zmq_driver_process.evt_port)+'\n')
+
+            poller = zmq.Poller()
+            poller.register(cmd_sock, zmq.POLLIN)
+            poller.register(wakeup_recv_sock, zmq.POLLIN)
+
+            while not zmq_driver_process.stop_messaging_thread:
+                # publish the events queued so far, including any queued
+                # before messaging started or while handling a command
+                zmq_driver_process._send_events(evt_sock, wakeup_recv_sock)
+                if zmq_driver_process.stop_messaging_thread:
+                    break
+
+                # block until there is a command or a wakeup
+                socks = dict(poller.poll())
+
+                if socks.get(cmd_sock) == zmq.POLLIN:
+                    msg = cmd_sock.recv_pyobj()
                     #log.trace('Processing message %s', msg)
                     reply = zmq_driver_process.cmd_driver(msg)
                     # if operation raised exception, encode as triple
                     if isinstance(reply, Exception):
                         reply = _encode_exception(reply)
-                    # send, send, and resend
-                    while True:
-                        try:
-                            sock.send_pyobj(reply, flags=zmq.NOBLOCK)
-                            break
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_cmd_thread:
-                                break
-                except zmq.ZMQError:
-                    time.sleep(.1)
-                
-            sock.close()
-            context.term()
-            log.info('Driver process cmd socket closed.')
+                    # a REP socket can always send the reply to the request
+                    # it just received
+                    cmd_sock.send_pyobj(reply)
 
-        def send_evt_msg(zmq_driver_process):
-            """
-            Await events on the driver process event queue and publish them
-            on a ZMQ PUB socket to the driver process client.
-            """
-            context = zmq.Context()
-            sock = context.socket(zmq.PUB)
-            zmq_driver_process.evt_port = sock.bind_to_random_port(zmq_driver_process.event_host_string)
-            log.info('Driver process event socket bound to %i', zmq_driver_process.evt_port)
-            file(zmq_driver_process.evt_port_fname,'w+').write(str(zmq_driver_process.evt_port)+'\n')
+            # publish anything left over before closing up
+            zmq_driver_process._send_events(evt_sock, wakeup_recv_sock)
 
-            zmq_driver_process.stop_evt_thread = False
-            while not zmq_driver_process.stop_evt_thread:
-                try:
-                    evt = zmq_driver_process.events.pop(0)
-                    #log.trace('Event thread sending event %s',evt)
-                    while evt:
-                        try:
-                            if isinstance(evt, Exception):
-                                evt = _encode_exception(evt)
-                            sock.send_pyobj(evt, flags=zmq.NOBLOCK)
-                            evt = None
-                            log.trace('Event sent!')
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_evt_thread:
-                                break
-                except IndexError:
-                    time.sleep(.1)
-
-            sock.close()
+            with zmq_driver_process.wakeup_lock:
+                zmq_driver_process.wakeup_sock.close()
+                zmq_driver_process.wakeup_sock = None
+            wakeup_recv_sock.close()
+            cmd_sock.close()
+            evt_sock.close()
             context.term()
-            log.info('Driver process event socket closed')
+            zmq_driver_process.context = None
+            log.info('Driver process cmd and event sockets closed.')
+
+        # the inproc endpoint has to be bound before anything connects, so
+        # set up the wakeup pair before events can be queued from other threads
+        self.context = zmq.Context()
+        wakeup_recv_sock = self.context.socket(zmq.PAIR)
+        wakeup_recv_sock.bind(self.wakeup_address)
+        wakeup_sock = self.context.socket(zmq.PAIR)
+        wakeup_sock.connect(self.wakeup_address)
+        with self.wakeup_lock:
+            self.wakeup_sock = wakeup_sock
+            self.wakeup_pending = False
 
-        self.cmd_thread = Thread(target=recv_cmd_msg, args=(self, ))
-        self.evt_thread = Thread(target=send_evt_msg, args=(self, ))
-        self.cmd_thread.start()        
-        self.evt_thread.start()
+        self.stop_messaging_thread = False
+        self.messaging_thread = Thread(target=run_messaging, args=(self, ))
+        self.messaging_thread.start()
         self.messaging_started = True
-    
+
+    def _send_events(self, evt_sock, wakeup_recv_sock):
+        """
+        Publish every event in the driver process event queue. Called from
+        the messaging thread.
+        @param evt_sock The event PUB socket.
+        @param wakeup_recv_sock The receiving end of the wakeup socket pair.
+        """
+        # drain and clear the wakeup together, so a wakeup sent by an event
+        # queued after this is never drained without clearing the flag
+        with self.wakeup_lock:
+            while True:
+                try:
+                    wakeup_recv_sock.recv(flags=zmq.NOBLOCK)
+                except zmq.ZMQError as e:
+                    if e.errno != zmq.EAGAIN:
+                        raise
+                    break
+            self.wakeup_pending = False
+
+        while True:
+            try:
+                evt = self.events.popleft()
+            except IndexError:
+                break
+            if isinstance(evt, Exception):
+                evt = _encode_exception(evt)
+            # sending on a PUB socket never blocks, messages for slow
+            # subscribers are dropped at the high water mark
+            evt_sock.send_pyobj(evt)
+            log.trace('Event sent!')
+
+    def _wakeup(self):
+        """
+        Wake the messaging thread, if it isn't already being woken. Safe to
+        call from any thread.
+        """
+        with self.wakeup_lock:
+            if self.wakeup_sock is None or self.wakeup_pending:
+                return
+            self.wakeup_pending = True
+            self.wakeup_sock.send('')
+
+    def send_event(self, evt):
+        """
+        Queue an event and wake the messaging thread to publish it.
+        """
+        driver_process.DriverProcess.send_event(self, evt)
+        self._wakeup()
+
     def stop_messaging(self):
         """
-        Close messaging resource for the driver. Set flags to cause
-        command and event threads to close sockets and conclude.
+        Close messaging resource for the driver. Set the flag to cause
+        the messaging thread to close sockets and conclude, and wake it
+        up so it sees the flag.
         """
-        self.stop_cmd_thread = True
-        self.stop_evt_thread = True
+        self.stop_messaging_thread = True
         self.messaging_started = False
+        self._wakeup()
     
     def shutdown(self):
         """
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_inotify
+@file mi/core/test/test_inotify.py
+@author agent
+@brief Test the inotify binding used by the directory harvesters
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+
+from mi.core.log import get_logger ; log = get_logger()
+
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+from mi.core.unit_test import MiUnitTest
+from mi.core.inotify import Inotify, inotify_available
+from mi.core.inotify import IN_CREATE, IN_CLOSE_WRITE, IN_MOVED_TO, IN_ISDIR
+
+@attr('UNIT', group='mi')
+class TestInotify(MiUnitTest):
+    def setUp(self):
+        if not inotify_available():
+            raise SkipTest("inotify is not available")
+        self.directory = tempfile.mkdtemp()
+        self.inotify = Inotify()
+
+    def tearDown(self):
+        self.inotify.close()
+        shutil.rmtree(self.directory)
+
+    def test_events(self):
+        """
+        Verify create, close after write and move events are read with file names
+        """
+        wd = self.inotify.add_watch(self.directory, IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO)
+        self.assertEqual(self.inotify.read_events(0), [])
+
+        with open(os.path.join(self.directory, 'a.txt'), 'w') as filehandle:
+            filehandle.write('data')
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        other = tempfile.mkdtemp()
+        open(os.path.join(other, 'b.txt'), 'w').close()
+        os.rename(os.path.join(other, 'b.txt'), os.path.join(self.directory, 'b.txt'))
+        os.rmdir(other)
+
+        events = self.inotify.read_events(1)
+        log.debug("events: %s", events)
+        self.assertTrue(all([event.wd == wd for event in events]))
+        received = [(event.name, event.mask) for event in events]
+        self.assertEqual(received, [('a.txt', IN_CREATE),
+                                    ('a.txt', IN_CLOSE_WRITE),
+                                    ('sub', IN_CREATE | IN_ISDIR),
+                                    ('b.txt', IN_MOVED_TO)])
+
+    def test_add_watch_error(self):
+        """
+        Verify watching a path that does not exist raises OSError
+        """
+        self.assertRaises(OSError, self.inotify.add_watch,
+                          os.path.join(self.directory, 'missing'), IN_CREATE)
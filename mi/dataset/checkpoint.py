@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.checkpoint
+@file mi/dataset/checkpoint.py
+@author agent
+@brief Coalesce the particles and driver state a dataset driver sends to the agent
+
+A driver normally sends the whole driver state to the agent after every batch
+of particles, and the agent persists all of it, including an entry for every
+file the harvester has ever seen.  When checkpoint_particles or
+checkpoint_interval is set in the driver config, a CheckpointManager holds on
+to the particles and state updates instead, and sends them together once
+that many particles are waiting, or that many seconds after the first update
+that is waiting, whichever comes first.
+
+Particles are only sent along with a driver state saved after they were
+published by the parser, and they are sent before that state, in the same
+order as without checkpointing, so the agent never sees particles which are
+further ahead of the persisted state than they would be otherwise.  Particles
+that are still waiting for a state update when the driver stops are dropped,
+the persisted state doesn't cover them so they are parsed again on restart.
+
+The state sent to the agent is a copy taken when the state is saved, so a
+parser which changes its state in place before the checkpoint is sent can't
+get the persisted state ahead of the particles sent with it, and the copy is
+never changed afterwards, so the parser can keep going while the agent
+persists it.  Callers name the driver state entries they changed, and only
+those entries are copied, the rest of the copy is shared with the previous
+checkpoint.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import copy
+
+import gevent
+
+from mi.core.log import get_logger ; log = get_logger()
+
+# changed entry meaning the whole driver state may have changed
+ALL = None
+
+
+class CheckpointManager(object):
+    """
+    Hold particles and driver state updates until they are checkpointed. With
+    no particle count or interval everything is passed straight through.
+    @param data_callback Publish particles to the agent
+    @param state_callback Persist the driver state in the agent
+    @param event_callback Send an event to the agent
+    @param exception_callback Send an exception to the agent
+    @param particles Checkpoint once this many particles are waiting, None for no limit
+    @param interval Checkpoint this many seconds after the first waiting update, None for no limit
+    @param spawn_later Function to call a function after a number of seconds in a new greenlet
+    """
+    def __init__(self, data_callback, state_callback, event_callback, exception_callback,
+                 particles=None, interval=None, spawn_later=gevent.spawn_later):
+        self._data_callback = data_callback
+        self._state_callback = state_callback
+        self._event_callback = event_callback
+        self._exception_callback = exception_callback
+        self._max_particles = particles
+        self._interval = interval
+        self._spawn_later = spawn_later
+        self._coalesce = bool(particles or interval)
+
+        self._particles = []
+        # the number of waiting particles a state update has been saved for
+        self._saved_particles = 0
+        self._driver_state = None
+        # the last checkpoint sent, and the next one, built up as state is saved
+        self._checkpoint = None
+        self._pending = None
+        # the ids of the dicts in the pending checkpoint that aren't shared with
+        # the last one, None if none are shared
+        self._copied = None
+        self._timer = None
+
+    def publish(self, particles):
+        """
+        Publish particles, or hold them until the next checkpoint
+        @param particles A list of particles
+        """
+        if not self._coalesce:
+            self._data_callback(particles)
+            return
+        if not isinstance(particles, list):
+            particles = [particles]
+        self._particles.extend(particles)
+
+    def save(self, driver_state, *changed):
+        """
+        Persist the driver state, or hold it until the next checkpoint.  The
+        state covers all the particles published before it.
+        @param driver_state The driver state
+        @param changed The keys of the driver state entry that changed, such as
+            the data key and file name, none if the whole state may have changed
+        """
+        if not self._coalesce:
+            self._state_callback(driver_state)
+            return
+
+        if driver_state is not self._driver_state:
+            self._driver_state = driver_state
+            changed = ALL
+        self._copy_changed(changed or ALL)
+        self._saved_particles = len(self._particles)
+
+        if self._max_particles and self._saved_particles >= self._max_particles:
+            self.flush()
+        elif self._interval and self._timer is None:
+            self._timer = self._spawn_later(self._interval, self._flush_timer)
+
+    def event(self, **kwargs):
+        """
+        Send an event after checkpointing what is waiting, so it stays in order with the particles
+        """
+        self.flush()
+        self._event_callback(**kwargs)
+
+    def exception(self, exception):
+        """
+        Send an exception after checkpointing what is waiting, so it stays in order with the particles
+        """
+        self.flush()
+        self._exception_callback(exception)
+
+    def flush(self):
+        """
+        Publish the particles covered by the last saved state, then persist that state
+        """
+        if self._timer is not None:
+            self._timer.kill(block=False)
+            self._timer = None
+
+        if self._pending is None:
+            return
+
+        # take everything to send before calling out to the agent, which may let
+        # other greenlets publish and save more
+        particles = self._particles[:self._saved_particles]
+        del self._particles[:self._saved_particles]
+        self._saved_particles = 0
+        checkpoint = self._checkpoint = self._pending
+        self._pending = None
+        self._copied = None
+
+        log.debug("Checkpoint %d particles", len(particles))
+        if particles:
+            self._data_callback(particles)
+        self._state_callback(checkpoint)
+
+    def discard(self):
+        """
+        Drop the particles that don't have a saved state yet, checkpoint the rest
+        """
+        self.flush()
+        if self._particles:
+            log.debug("Dropping %d particles without a saved state", len(self._particles))
+        self._particles = []
+
+    def _flush_timer(self):
+        # this is the timer's greenlet, it doesn't need killing
+        self._timer = None
+        self.flush()
+
+    def _copy_changed(self, keys):
+        """
+        Copy a changed driver state entry into the pending checkpoint, which
+        starts out as the last checkpoint.  Only the dicts on the way to a
+        changed entry are copied, unchanged entries are shared with the last
+        checkpoint, which is never modified once it has been sent.
+        @param keys The keys of the entry, ALL if the whole state may have changed
+        """
+        if keys is ALL or self._checkpoint is None:
+            self._pending = copy.deepcopy(self._driver_state)
+            self._copied = None
+            return
+
+        if self._pending is None:
+            self._pending = dict(self._checkpoint)
+            self._copied = set([id(self._pending)])
+        self._copy_entry(keys)
+
+    def _copy_entry(self, keys):
+        """
+        Copy one driver state entry into the pending checkpoint
+        @param keys The keys of the entry
+        """
+        source = self._driver_state
+        target = self._pending
+        copied = self._copied
+        for key in keys[:-1]:
+            if key not in source:
+                # the entry is gone along with its parent
+                target.pop(key, None)
+                return
+            if not isinstance(source[key], dict) or not isinstance(target.get(key), dict):
+                target[key] = copy.deepcopy(source[key])
+                return
+            if copied is not None and id(target[key]) not in copied:
+                target[key] = dict(target[key])
+                copied.add(id(target[key]))
+            source = source[key]
+            target = target[key]
+
+        if keys[-1] in source:
+            target[keys[-1]] = copy.deepcopy(source[keys[-1]])
+        else:
+            target.pop(keys[-1], None)
@@ -13,7 +13,6 @@ __license__ = 'Apache 2.0'
 import os
 import gevent
 import shutil
-import hashlib
 import copy
 import traceback
 
@@ -35,6 +34,10 @@ from mi.core.instrument.driver_dict import DriverDict
 from mi.core.instrument.protocol_param_dict import ParameterDictType
 from mi.core.instrument.protocol_param_dict import Parameter
 from mi.core.common import BaseEnum
+from mi.dataset import fingerprint
+from mi.dataset.ingest_pool import IngestPool, IngestMessage
+from mi.dataset.publish_rate import PublishRate
+from mi.dataset.checkpoint import CheckpointManager
 
 class DataSourceConfigKey(BaseEnum):
     HARVESTER = 'harvester'
@@ -114,6 +117,11 @@ class DataSetDriverConfigKeys(BaseEnum):
     CLASS = "class"
     URI = "uri"
     CLASS_ARGS = "class_args"
+    INGEST_BATCH_SIZE = "ingest_batch_size"
+    INGEST_PROCESSES = "ingest_processes"
+    PUBLISH_BURST = "publish_burst"
+    CHECKPOINT_PARTICLES = "checkpoint_particles"
+    CHECKPOINT_INTERVAL = "checkpoint_interval"
 
 class DataSetDriver(object):
     """
@@ -144,15 +152,28 @@ class DataSetDriver(object):
             'records_per_second'
             'harvester_polling_interval'
             'batched_particle_count'
+            'ingest_batch_size'
+            'ingest_processes'
+            'publish_burst'
+            'checkpoint_particles'
+            'checkpoint_interval'
         }
     }
     """
     def __init__(self, config, memento, data_callback, state_callback, event_callback, exception_callback):
         self._config = copy.deepcopy(config)
-        self._data_callback = data_callback
-        self._state_callback = state_callback
-        self._event_callback = event_callback
-        self._exception_callback = exception_callback
+
+        # particles, state, events and exceptions go to the agent through the
+        # checkpoint manager, which holds particles and state to send together
+        # if checkpoint_particles or checkpoint_interval are set
+        driver_config = self._config.get(DataSourceConfigKey.DRIVER) or {}
+        self._checkpoint = CheckpointManager(data_callback, state_callback, event_callback, exception_callback,
+                                             driver_config.get(DataSetDriverConfigKeys.CHECKPOINT_PARTICLES),
+                                             driver_config.get(DataSetDriverConfigKeys.CHECKPOINT_INTERVAL))
+        self._data_callback = self._checkpoint.publish
+        self._state_callback = self._checkpoint.save
+        self._event_callback = self._checkpoint.event
+        self._exception_callback = self._checkpoint.exception
         self._memento = memento
         self._publisher_thread = None
 
@@ -162,6 +183,7 @@ class DataSetDriver(object):
         self._polling_interval = None
         self._generate_particle_count = None
         self._particle_count_per_second = None
+        self._publish_rates = {}
         self._resource_id = None
 
         self._param_dict = ProtocolParameterDict()
@@ -190,6 +212,7 @@ class DataSetDriver(object):
 
         self._stop_sampling()
         self._stop_publisher_thread()
+        self._checkpoint.discard()
 
     def _start_sampling(self):
         raise NotImplementedException('virtual method needs to be specialized')
@@ -294,6 +317,9 @@ class DataSetDriver(object):
         log.trace("Driver Parameters: %s, %s, %s", self._polling_interval, self._particle_count_per_second,
                   self._generate_particle_count)
 
+        # start pacing again at the new rate
+        self._publish_rates = {}
+
 
     def get_resource(self, *args, **kwargs):
         """
@@ -402,7 +428,13 @@ class DataSetDriver(object):
                 description="Number of particles to batch before sending to the agent")
         )
 
-        config = self._config.get(DataSourceConfigKey.DRIVER, {})
+        # ingest, publish and checkpoint settings are read from the config, they aren't parameters
+        config = dict((key, value) for (key, value) in (self._config.get(DataSourceConfigKey.DRIVER) or {}).iteritems()
+                      if key not in [DataSetDriverConfigKeys.INGEST_BATCH_SIZE,
+                                     DataSetDriverConfigKeys.INGEST_PROCESSES,
+                                     DataSetDriverConfigKeys.PUBLISH_BURST,
+                                     DataSetDriverConfigKeys.CHECKPOINT_PARTICLES,
+                                     DataSetDriverConfigKeys.CHECKPOINT_INTERVAL])
         log.debug("set_resource on startup with: %s", config)
         self.set_resource(config)
 
@@ -426,6 +458,8 @@ class DataSetDriver(object):
         try:
             while(not self._publisher_shutdown):
                 self._poll()
+                # send what was parsed before waiting for more
+                self._checkpoint.flush()
                 gevent.sleep(self._polling_interval)
         except Exception as e:
             log.error("Exception in publisher thread (resource id: %s): %s", self._resource_id, traceback.format_exc(e))
@@ -439,6 +473,45 @@ class DataSetDriver(object):
     def _new_file_exception(self):
         raise NotImplementedException('virtual methond needs to be specialized')
 
+    def _get_record_batch(self, data_key=None):
+        """
+        Get the number of records to request from the parser at a time and the publish rate
+        to pace them with.  By default records are requested one at a time, or in batches of
+        batched_particle_count paced at records_per_second once those parameters have been set.
+        The publish rate lets publish_burst particles, batched_particle_count by default, out
+        at once after the driver has been idle.  If ingest_batch_size is set in the driver
+        config records are requested in batches of that size as fast as they can be parsed,
+        each batch published together with one state update.
+        @param data_key The data key being parsed, each data key is paced separately
+        @retval (count, publish_rate) tuple, publish_rate is None for no pacing
+        """
+        driver_config = self._config.get(DataSourceConfigKey.DRIVER) or {}
+        batch_size = driver_config.get(DataSetDriverConfigKeys.INGEST_BATCH_SIZE)
+        if batch_size:
+            return (batch_size, None)
+
+        if not self._generate_particle_count:
+            return (1, None)
+
+        count = self._generate_particle_count
+        publish_rate = self._publish_rates.get(data_key)
+        if publish_rate is None:
+            burst = driver_config.get(DataSetDriverConfigKeys.PUBLISH_BURST) or count
+            publish_rate = PublishRate(self._particle_count_per_second, burst)
+            self._publish_rates[data_key] = publish_rate
+
+        return (count, publish_rate)
+
+    def get_publish_metrics(self):
+        """
+        @retval dict of the publish rate metrics by data key, the key is None for single key drivers
+        """
+        return dict((data_key, {'rate': publish_rate.rate,
+                                'achieved_rate': publish_rate.achieved_rate,
+                                'published': publish_rate.published,
+                                'backlog': publish_rate.backlog})
+                    for (data_key, publish_rate) in self._publish_rates.iteritems())
+
     def _sample_exception_callback(self, exception):
         """
         Publish an event when a sample exception is detected
@@ -453,8 +526,7 @@ class DataSetDriver(object):
         """
         s = os.stat(name)
         checksum = ""
-        with open(name, 'rb') as filehandle:
-            checksum = hashlib.md5(filehandle.read()).hexdigest()
+        checksum = fingerprint.md5_checksum(name)
 
         stats = {
             'name': name,
@@ -619,13 +691,7 @@ class SimpleDataSetDriver(DataSetDriver):
             # Removed this for the time being to get new driver code out.  May bring this back in the future
             #self._stage_input_file(os.path.join(directory, file_name))
 
-            count = 1
-            delay = None
-
-            if self._generate_particle_count:
-                # Calculate the delay between grabbing records to publish.
-                delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-                count = self._generate_particle_count
+            (count, publish_rate) = self._get_record_batch()
 
             self._file_in_process = file_name
 
@@ -643,9 +709,9 @@ class SimpleDataSetDriver(DataSetDriver):
             while(True):
                 result = parser.get_records(count)
                 if result:
-                    log.trace("Record parsed: %r delay: %f", result, delay)
-                    if delay:
-                        gevent.sleep(delay)
+                    log.trace("Record parsed: %r", result)
+                    if publish_rate:
+                        publish_rate.consume(len(result))
                 else:
                     break
 
@@ -669,7 +735,7 @@ class SimpleDataSetDriver(DataSetDriver):
         if file_ingested:
             log.debug("File %s fully parsed", self._file_in_process)
             self._driver_state[self._file_in_process][DriverStateKey.INGESTED] = True
-        self._state_callback(self._driver_state)
+        self._state_callback(self._driver_state, self._file_in_process)
 
     def _save_parser_state_after_error(self):
         """
@@ -709,8 +775,7 @@ class SimpleDataSetDriver(DataSetDriver):
             full_file_path = os.path.join(self._harvester_config[DataSetDriverConfigKeys.DIRECTORY], file_name)
             mod_time = os.path.getmtime(full_file_path)
             file_size = os.path.getsize(full_file_path)
-            with open(full_file_path, 'rb') as filehandle:
-                md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+            md5_checksum = fingerprint.md5_checksum(full_file_path)
             self._driver_state[file_name] = {
                 DriverStateKey.FILE_SIZE: file_size,
                 DriverStateKey.FILE_MOD_DATE: mod_time,
@@ -809,13 +874,7 @@ class SingleFileDataSetDriver(SimpleDataSetDriver):
             #shutil.copy2(os.path.join(directory, self._filename), storage_directory)
             #log.info("Copied file %s from %s to %s" % (self._filename, directory, storage_directory))
 
-            count = 1
-            delay = None
-
-            if self._generate_particle_count:
-                # Calculate the delay between grabbing records to publish.
-                delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-                count = self._generate_particle_count
+            (count, publish_rate) = self._get_record_batch()
 
             # Open the copied file in the storage directory so we know the file won't be
             # changed while we are reading it
@@ -838,9 +897,9 @@ class SingleFileDataSetDriver(SimpleDataSetDriver):
             while(True):
                 result = parser.get_records(count)
                 if result:
-                    log.trace("Record parsed: %r delay: %f", result, delay)
-                    if delay:
-                        gevent.sleep(delay)
+                    log.trace("Record parsed: %r", result)
+                    if publish_rate:
+                        publish_rate.consume(len(result))
                 else:
                     break
 
@@ -863,7 +922,7 @@ class SingleFileDataSetDriver(SimpleDataSetDriver):
         log.trace("saving parser state: %r", state)
         # this is for the single file harvester, which does not use file name keys
         self._driver_state[self._filename][DriverStateKey.PARSER_STATE] = state
-        self._state_callback(self._driver_state)
+        self._state_callback(self._driver_state, self._filename)
 
     def _file_changed_callback(self, new_state):
         """
@@ -927,6 +986,7 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
                                                              exception_callback)
         self._publisher_thread = {}
         self._publisher_shutdown = {}
+        self._ingest_pool = None
         self._init_queues()
 
     def _init_queues(self):
@@ -976,8 +1036,21 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
 
     def _start_publisher_thread(self):
         """
-        Start however many publisher threads are needed, one for each data key
-        """
+        Start however many publisher threads are needed, one for each data key.
+        If ingest_processes is set in the driver config, the publisher threads
+        parse files in a pool of that many worker processes.
+        """
+        driver_config = self._config.get(DataSourceConfigKey.DRIVER) or {}
+        processes = driver_config.get(DataSetDriverConfigKeys.INGEST_PROCESSES)
+        if processes and self._ingest_pool is None:
+            # workers parse inline, they don't start their own pool, and send
+            # everything straight back, checkpoints are made in this process
+            worker_config = copy.deepcopy(self._config)
+            for key in [DataSetDriverConfigKeys.INGEST_PROCESSES, DataSetDriverConfigKeys.CHECKPOINT_PARTICLES,
+                        DataSetDriverConfigKeys.CHECKPOINT_INTERVAL]:
+                worker_config[DataSourceConfigKey.DRIVER].pop(key, None)
+            self._ingest_pool = IngestPool(self, processes, worker_config)
+
         for key in self._data_keys:
             # no harvester type specified defaults to all single directory harvesters
             if self._harvester_type == None or \
@@ -1009,6 +1082,9 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
                    self._harvester_type[key] == HarvesterType.SINGLE_FILE:
                     log.debug('Clearing in process queue for key %s', key)
                     self._in_process_queue[key] = None
+        if self._ingest_pool:
+            self._ingest_pool.close()
+            self._ingest_pool = None
         log.debug("publisher threads shutdown complete")
 
     def _publisher_loop(self, data_key):
@@ -1021,6 +1097,8 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
         try:
             while(not self._publisher_shutdown[data_key]):
                 self._poll(data_key)
+                # send what was parsed before waiting for more
+                self._checkpoint.flush()
                 gevent.sleep(self._polling_interval)
         except Exception as e:
             log.error("Exception in publisher thread (resource id: %s): %s", self._resource_id, traceback.format_exc(e))
@@ -1039,6 +1117,8 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
             filename = self._harvester_config[data_key].get(DataSetDriverConfigKeys.PATTERN)
             while(not self._publisher_shutdown[data_key]):
                 self._poll_single_file(data_key, filename)
+                # send what was parsed before waiting for more
+                self._checkpoint.flush()
                 gevent.sleep(self._polling_interval)
         except Exception as e:
             log.error("Exception in publisher thread (resource id: %s): %s", self._resource_id, traceback.format_exc(e))
@@ -1157,15 +1237,13 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
         @param file_name name of the file to parse
         @param data_key The key to index into the harvester and parser
         """
-        count = 1
-        delay = None
+        if self._ingest_pool:
+            self._get_worker_results(file_name, data_key)
+            return
 
-        directory = self._harvester_config[data_key].get(DataSetDriverConfigKeys.DIRECTORY)
+        (count, publish_rate) = self._get_record_batch(data_key)
 
-        if self._generate_particle_count:
-            # Calculate the delay between grabbing records to publish.
-            delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-            count = self._generate_particle_count
+        directory = self._harvester_config[data_key].get(DataSetDriverConfigKeys.DIRECTORY)
 
         # Open the copied file in the storage directory so we know the file won't be
         # changed while we are reading it
@@ -1183,12 +1261,32 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
         while(True):
             result = parser.get_records(count)
             if result:
-                log.trace("Record parsed: %r delay: %f", result, delay)
-                if delay:
-                    gevent.sleep(delay)
+                log.trace("Record parsed: %r", result)
+                if publish_rate:
+                    publish_rate.consume(len(result))
             else:
                 break
 
+    def _get_worker_results(self, file_name, data_key):
+        """
+        Parse the file in the ingest pool, passing the particles, state changes,
+        events and exceptions from the worker on as they arrive
+        @param file_name name of the file to parse
+        @param data_key The key to index into the harvester and parser
+        """
+        def handle_message(message_type, content):
+            if message_type == IngestMessage.DATA:
+                self._data_callback(content)
+            elif message_type == IngestMessage.STATE:
+                self._save_parser_state(content.get(DriverStateKey.PARSER_STATE), data_key,
+                                        content.get(DriverStateKey.INGESTED))
+            elif message_type == IngestMessage.EVENT:
+                self._event_callback(**content)
+            elif message_type == IngestMessage.EXCEPTION:
+                self._exception_callback(content)
+
+        self._ingest_pool.parse(data_key, file_name, self._driver_state[data_key][file_name], handle_message)
+
     def pre_parse(self, filename=None, data_key=None):
         """
         This can be overloaded if something needs to be done just before parsing
@@ -1224,7 +1322,7 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
         if file_ingested:
             log.debug("File %s fully parsed", file_name)
             self._driver_state[data_key][file_name][DriverStateKey.INGESTED] = True
-        self._state_callback(self._driver_state)
+        self._state_callback(self._driver_state, data_key, file_name)
 
     def _file_changed_callback(self, new_state, data_key):
         """
@@ -1251,8 +1349,7 @@ class MultipleHarvesterDataSetDriver(SimpleDataSetDriver):
             full_file_path = os.path.join(self._harvester_config[data_key][DataSetDriverConfigKeys.DIRECTORY], file_name)
             mod_time = os.path.getmtime(full_file_path)
             file_size = os.path.getsize(full_file_path)
-            with open(full_file_path, 'rb') as filehandle:
-                md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+            md5_checksum = fingerprint.md5_checksum(full_file_path)
             self._driver_state[data_key][file_name] = {
                 DriverStateKey.FILE_SIZE: file_size,
                 DriverStateKey.FILE_MOD_DATE: mod_time,
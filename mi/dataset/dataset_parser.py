@@ -13,12 +13,20 @@ __license__ = 'Apache 2.0'
 
 import time
 import ntplib
+from collections import deque
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.instrument.chunker import StringChunker
 from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.exceptions import SampleException, RecoverableSampleException, SampleEncodingException
 from mi.core.exceptions import NotImplementedException, UnexpectedDataException
+from mi.dataset.file_reader import MappedFileReader
+
+# bytes BufferLoadingParser hands to the chunker at a time, unless the parser
+# config has a block_size
+DEFAULT_BLOCK_SIZE = 65536
+# largest block BufferLoadingParser will grow to when a record doesn't fit in a block
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
 
 class Parser(object):
     """ abstract class to show API needed for plugin poller objects """
@@ -145,6 +153,23 @@ class BufferLoadingParser(Parser):
     to operate this way, but it can keep memory in check and smooth out
     stream inputs if they dont all come at once.
     """
+    # set here as well as in __init__ for subclasses that skip it
+    _block_size = DEFAULT_BLOCK_SIZE
+    _reader = None
+    _records = None
+
+    def _get_record_buffer(self):
+        if self._records is None:
+            self._records = deque()
+        return self._records
+
+    def _set_record_buffer(self, records):
+        self._records = deque(records)
+
+    # the (particle, state) tuples waiting to be returned, held in a deque so
+    # records can be taken off the front without copying the rest. Subclasses
+    # may still reset it with a list.
+    _record_buffer = property(_get_record_buffer, _set_record_buffer)
 
     def __init__(self, config, stream_handle, state, sieve_fn,
                  state_callback, publish_callback, exception_callback = None):
@@ -168,6 +193,7 @@ class BufferLoadingParser(Parser):
         self._record_buffer = []
         self._timestamp = 0.0
         self.file_complete = False
+        self._block_size = config.get('block_size', DEFAULT_BLOCK_SIZE)
 
         super(BufferLoadingParser, self).__init__(config, stream_handle, state,
                                                   sieve_fn, state_callback,
@@ -222,14 +248,14 @@ class BufferLoadingParser(Parser):
                   num_records)
 
         return_list = []
-        records_to_return = self._record_buffer[:num_to_fetch]
-        self._record_buffer = self._record_buffer[num_to_fetch:]
-        if len(records_to_return) > 0:
-            self._state = records_to_return[-1][1] # state side of tuple of last entry
-            # strip the state info off of them now that we have what we need
-            for item in records_to_return:
-                log.debug("Record to return: %s", item)
-                return_list.append(item[0])
+        if num_to_fetch > 0:
+            # strip the state info off of the records as they come out of the buffer
+            popleft = self._record_buffer.popleft
+            for i in xrange(num_to_fetch):
+                (record, state) = popleft()
+                return_list.append(record)
+            self._state = state # state of the last record
+            log.trace("Records to return: %s", return_list)
             self._publish_sample(return_list)
             log.trace("Sending parser state [%s] to driver", self._state)
             file_ingested = False
@@ -242,29 +268,55 @@ class BufferLoadingParser(Parser):
 
     def _load_particle_buffer(self):
         """
-        Load up the internal record buffer with some particles based on a
-        gather from the get_block method.
+        Load up the internal record buffer with the particles from one block
+        gathered by the get_block method.  If the block did not complete a
+        record the block size is doubled, up to MAX_BLOCK_SIZE, so large
+        records are not assembled a small block at a time.
+        @throws EOFError once the last block has been parsed
         """
-        while self.get_block():
+        if self.get_block():
             result = self.parse_chunks()
             self._record_buffer.extend(result)
+            if not result and self._block_size < MAX_BLOCK_SIZE:
+                self._block_size = min(self._block_size * 2, MAX_BLOCK_SIZE)
+        if self.file_complete:
+            raise EOFError
 
-    def get_block(self, size=1024):
+    def get_block(self, size=None):
         """
         Get a block of characters for processing
-        @param size The size of the block to try to read
+        @param size The size of the block to try to read, defaults to the
+        parser block size
         @retval The length of data retreived
         @throws EOFError when the end of the file is reached
         """
+        if size is None:
+            size = self._block_size
         # read in some more data
-        data = self._stream_handle.read(size)
+        data = self._read(size)
         if data:
             self._chunker.add_chunk(data, ntplib.system_to_ntp_time(time.time()))
+            # note the end of the file now so the last records are
+            # published as ingesting the file
+            if len(data) < size or self._reader.at_eof():
+                self.file_complete = True
             return len(data)
         else: # EOF
             self.file_complete = True
             raise EOFError
 
+    def _read(self, size=None):
+        """
+        Read from the current position of the stream handle through the
+        memory mapped reader
+        @param size The maximum number of bytes to read, None to read to the
+        end of the file
+        @retval The data read, '' at the end of the file
+        """
+        if self._reader is None:
+            self._reader = MappedFileReader(self._stream_handle)
+        return self._reader.read(size)
+
     def parse_chunks(self):
         """
         Parse out any pending data chunks in the chunker. If
@@ -13,7 +13,6 @@ __license__ = 'Apache 2.0'
 
 import os
 import string
-import gevent
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import SampleException
@@ -85,13 +84,7 @@ class CtdpfCklWfpDataSetDriver(SimpleDataSetDriver):
             # Removed this for the time being to get new driver code out.  May bring this back in the future
             #self._stage_input_file(os.path.join(directory, file_name))
 
-            count = 1
-            delay = None
-
-            if self._generate_particle_count:
-                # Calculate the delay between grabbing records to publish.
-                delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-                count = self._generate_particle_count
+            (count, publish_rate) = self._get_record_batch()
 
             self._file_in_process = file_name
 
@@ -110,9 +103,9 @@ class CtdpfCklWfpDataSetDriver(SimpleDataSetDriver):
             while(True):
                 result = parser.get_records(count)
                 if result:
-                    log.trace("Record parsed: %r delay: %f", result, delay)
-                    if delay:
-                        gevent.sleep(delay)
+                    log.trace("Record parsed: %r", result)
+                    if publish_rate:
+                        publish_rate.consume(len(result))
                 else:
                     break
 
@@ -13,7 +13,6 @@ __license__ = 'Apache 2.0'
 
 import os
 import string
-import gevent
 
 from mi.core.common import BaseEnum
 from mi.core.log import get_logger ; log = get_logger()
@@ -97,16 +96,10 @@ class DofstKWfpDataSetDriver(MultipleHarvesterDataSetDriver):
         @param file_name name of the file to parse
         @param data_key The key to index into the harvester and parser
         """
-        count = 1
-        delay = None
+        (count, publish_rate) = self._get_record_batch(data_key)
 
         directory = self._harvester_config[data_key].get(DataSetDriverConfigKeys.DIRECTORY)
 
-        if self._generate_particle_count:
-            # Calculate the delay between grabbing records to publish.
-            delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-            count = self._generate_particle_count
-
         # Open the copied file in the storage directory so we know the file won't be
         # changed while we are reading it
         path = os.path.join(directory, file_name)
@@ -125,8 +118,8 @@ class DofstKWfpDataSetDriver(MultipleHarvesterDataSetDriver):
         while(True):
             result = parser.get_records(count)
             if result:
-                log.trace("Record parsed: %r delay: %f", result, delay)
-                if delay:
-                    gevent.sleep(delay)
+                log.trace("Record parsed: %r", result)
+                if publish_rate:
+                    publish_rate.consume(len(result))
             else:
                 break
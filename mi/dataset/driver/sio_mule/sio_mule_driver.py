@@ -13,7 +13,7 @@ __license__ = 'Apache 2.0'
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.dataset.dataset_driver import DriverStateKey, MultipleHarvesterDataSetDriver
-from mi.dataset.parser.sio_mule_common import StateKey
+from mi.dataset.parser.sio_mule_common import StateKey, IntervalSet
 
 
 class SioMuleDataSetDriver(MultipleHarvesterDataSetDriver):
@@ -40,27 +40,13 @@ class SioMuleDataSetDriver(MultipleHarvesterDataSetDriver):
             last_size = self._driver_state[data_key][filename][DriverStateKey.FILE_SIZE]
             next_size = self._new_file_queue[data_key][filename][DriverStateKey.FILE_SIZE]
 
-            if parser_state[StateKey.UNPROCESSED_DATA] == [] and last_size < next_size:
-                # we have processed up to the last file size, append a
-                # new block that goes from the last file size to the new file size
-                log.debug('Appending new unprocessed parser %d,%d', last_size, next_size)
-                parser_state[StateKey.UNPROCESSED_DATA].append([last_size, next_size])
-                self._save_parser_state(parser_state, data_key)
-
-            elif parser_state[StateKey.UNPROCESSED_DATA] != [] and \
-                parser_state[StateKey.UNPROCESSED_DATA][-1][1] < next_size:
-
-                if last_size > parser_state[StateKey.UNPROCESSED_DATA][-1][1]:
-                    # the previous file size is greater than the last unprocessed index so
-                    # we have processed up to the last file size, append a
-                    # new block that goes from the last file size to the new file size
-                    log.debug('Appending new unprocessed parser %d,%d', last_size, next_size)
-                    parser_state[StateKey.UNPROCESSED_DATA].append([last_size, next_size])
-                    self._save_parser_state(parser_state, data_key)
-
-                elif last_size == parser_state[StateKey.UNPROCESSED_DATA][-1][1]:
-                    # if the last unprocessed is the last file size, just increase the last index
-                    log.debug('Replacing last unprocessed parser with %d', next_size)
-                    parser_state[StateKey.UNPROCESSED_DATA][-1][1] = next_size
-                    self._save_parser_state(parser_state, data_key)
+            unprocessed = IntervalSet(parser_state[StateKey.UNPROCESSED_DATA])
 
+            if last_size < next_size and (unprocessed.end() is None or unprocessed.end() <= last_size):
+                # we have processed up to the last file size, add the section from the
+                # last file size to the new file size to the unprocessed data, if the
+                # last unprocessed section ends at the last file size it is extended
+                log.debug('Adding new unprocessed parser %d,%d', last_size, next_size)
+                unprocessed.add(last_size, next_size)
+                parser_state[StateKey.UNPROCESSED_DATA] = unprocessed
+                self._save_parser_state(parser_state, data_key)
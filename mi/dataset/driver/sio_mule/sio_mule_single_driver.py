@@ -14,7 +14,7 @@ __license__ = 'Apache 2.0'
 from mi.core.log import get_logger ; log = get_logger()
 from mi.dataset.harvester import SingleFileHarvester
 from mi.dataset.dataset_driver import DriverStateKey, SingleFileDataSetDriver
-from mi.dataset.parser.sio_mule_common import StateKey
+from mi.dataset.parser.sio_mule_common import StateKey, IntervalSet
 
 class SioMuleSingleDataSetDriver(SingleFileDataSetDriver):
 
@@ -50,23 +50,18 @@ class SioMuleSingleDataSetDriver(SingleFileDataSetDriver):
             self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE]:
 
             last_size = self._driver_state[self._filename][DriverStateKey.FILE_SIZE]
+            next_size = self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE]
             new_parser_state = parser_state
+            unprocessed = IntervalSet(new_parser_state[StateKey.UNPROCESSED_DATA])
 
             # the file is larger, need to update last unprocessed index
             # set the new parser unprocessed data state
-            if last_size == new_parser_state[StateKey.UNPROCESSED_DATA][-1][1]:
-                # if the last unprocessed is the last file size, just increase the last index
-                log.debug('Replacing last unprocessed parser with %d',
-                          self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE])
-                new_parser_state[StateKey.UNPROCESSED_DATA][-1][1] = \
-                self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE]
-
-            elif last_size  > new_parser_state[StateKey.UNPROCESSED_DATA][-1][1]:
-                # if we processed past the last file size, append a new unprocessed block
-                # that goes from the last file size to the new file size
-                log.debug('Appending new unprocessed parser %d,%d', last_size,
-                          self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE])
-                new_parser_state[StateKey.UNPROCESSED_DATA].append([last_size,
-                                                                    self._next_driver_state[self._filename][DriverStateKey.FILE_SIZE]])
+            if last_size >= unprocessed.end():
+                # if the last unprocessed is the last file size this increases the last
+                # index, if we processed past the last file size this adds a new unprocessed
+                # block that goes from the last file size to the new file size
+                log.debug('Adding new unprocessed parser %d,%d', last_size, next_size)
+                unprocessed.add(last_size, next_size)
+                new_parser_state[StateKey.UNPROCESSED_DATA] = unprocessed
 
             self._save_parser_state(new_parser_state)
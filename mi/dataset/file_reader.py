@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.file_reader
+@file mi/dataset/file_reader.py
+@author agent
+@brief Memory mapped block reads for dataset parsers
+
+Parsers read their input through a MappedFileReader.  Regular files are
+memory mapped and blocks are sliced out of the mapping, so reading a block
+is one copy out of the page cache with no system call, and only the block
+being parsed is held in memory.  Streams that can't be mapped, such as
+StringIO, are read with read().  Either way the position of the stream
+handle is used and kept up to date, so parsers can keep seeking the stream
+handle in set_state.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import mmap
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+class MappedFileReader(object):
+    """
+    Read blocks from a file through a read only memory map, falling back to
+    the stream's own read.
+    @param stream_handle - an open file-like object
+    """
+    def __init__(self, stream_handle):
+        self._stream_handle = stream_handle
+        self._map = None
+        self._mapped = True
+        try:
+            self._fileno = stream_handle.fileno()
+        except (AttributeError, IOError, ValueError):
+            self._fileno = None
+            self._mapped = False
+
+    def read(self, size=None):
+        """
+        Read bytes from the current position of the stream handle
+        @param size - maximum number of bytes to read, None to read to the end
+        @retval the bytes read, '' at the end of the file
+        """
+        if self._mapped and self._remap():
+            position = self._stream_handle.tell()
+            length = self._mapped_length()
+            if size is None:
+                end = length
+            else:
+                end = min(position + size, length)
+            if end <= position:
+                return ''
+            data = self._map[position:end]
+            self._stream_handle.seek(end)
+            return data
+
+        if size is None:
+            return self._stream_handle.read()
+        return self._stream_handle.read(size)
+
+    def at_eof(self):
+        """
+        @retval True if there is nothing left to read at the current position
+        """
+        if self._mapped and self._remap():
+            return self._stream_handle.tell() >= self._mapped_length()
+
+        # look ahead a byte and put it back
+        position = self._stream_handle.tell()
+        if self._stream_handle.read(1):
+            self._stream_handle.seek(position)
+            return False
+        return True
+
+    def close(self):
+        """
+        Release the memory map, the stream handle is left open
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _mapped_length(self):
+        """
+        @retval the number of bytes mapped, 0 for an empty file
+        """
+        if self._map is None:
+            return 0
+        return len(self._map)
+
+    def _remap(self):
+        """
+        Map the whole file the first time it is read, and again whenever it
+        has changed size.  This is checked before every read, since touching
+        a mapped page past the end of a file that has been truncated raises
+        SIGBUS.
+        @retval True if the file is mapped, False to read with the stream handle
+        """
+        try:
+            size = os.fstat(self._fileno).st_size
+            if size == self._mapped_length():
+                return True
+            if size == 0:
+                # empty files can't be mapped, they will be mapped once they have data
+                self.close()
+                return True
+            new_map = mmap.mmap(self._fileno, size, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError) as e:
+            log.debug("Unable to map file, reading with the stream handle: %s", e)
+            self.close()
+            self._mapped = False
+            return False
+
+        self.close()
+        self._map = new_map
+        return True
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.fingerprint
+@file mi/dataset/fingerprint.py
+@author agent
+@brief Streaming, cached md5 checksums of data files
+
+The harvesters and dataset drivers record the md5 checksum of every file
+they find, and recompute it whenever the size or modification time of a
+file changes.  Checksums are computed here in fixed size blocks, so memory
+use does not depend on the file size, and cached by device and inode.  A
+file whose size and modification time match the cache is not read at all.
+A file that has grown is only md5 hashed from where the cached checksum
+left off, after checking the crc32 of all the bytes hashed before is
+unchanged.  crc32 costs a fraction of md5, so a file that is being appended
+to is read in full but mostly checked at crc32 speed.  Any other change is
+hashed in full.
+
+The checksum is the same md5 hex digest of the whole file as before, so
+existing driver state is still valid.  The one exception is a rewrite of
+the hashed bytes that leaves their crc32 unchanged, which happens by
+chance about once in 2**32 rewrites.
+
+prefix_crc32 is also used to check other data computed from the start of
+a file that is appended to, like the SIO mule header indexes.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import zlib
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from mi.core.log import get_logger ; log = get_logger()
+
+# bytes read at a time while hashing
+BLOCK_SIZE = 1024 * 1024
+# number of files to keep fingerprints for
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def crc32(data, crc=0):
+    """
+    Get the crc32 of some data
+    @param data - string or buffer
+    @param crc - crc32 of the data before this, to continue from
+    @retval crc32 as an unsigned int, the same on every platform
+    """
+    return zlib.crc32(data, crc) & 0xffffffff
+
+
+def prefix_crc32(source, size, block_size=BLOCK_SIZE):
+    """
+    Get the crc32 of the first bytes of a file or string, to check data
+    hashed or scanned before has not been rewritten
+    @param source - open file or string
+    @param size - number of bytes at the start of source to check
+    @param block_size - bytes to read at a time from a file
+    @retval crc32 of the bytes, None if source holds fewer than size bytes
+    """
+    if not hasattr(source, 'read'):
+        if len(source) < size:
+            return None
+        return crc32(buffer(source, 0, size))
+
+    source.seek(0)
+    crc = 0
+    remaining = size
+    while remaining:
+        block = source.read(min(block_size, remaining))
+        if not block:
+            return None
+        crc = crc32(block, crc)
+        remaining -= len(block)
+    return crc
+
+
+class FileFingerprint(object):
+    """
+    The state of the md5 checksum of a file, with the crc32 of the hashed
+    bytes to check they have not been rewritten before continuing to hash
+    if the file is appended to.
+    """
+    __slots__ = ('size', 'mod_time', 'md5', 'checksum', 'crc')
+
+    def __init__(self, size, mod_time, md5, crc):
+        self.size = size
+        self.mod_time = mod_time
+        self.md5 = md5
+        self.checksum = md5.hexdigest()
+        self.crc = crc
+
+
+class FingerprintCache(object):
+    """
+    Compute md5 checksums of files, keeping the fingerprints of the most
+    recently checked files.
+    @param max_entries - number of files to keep fingerprints for
+    @param block_size - bytes to read at a time
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, block_size=BLOCK_SIZE):
+        self.max_entries = max_entries
+        self.block_size = block_size
+        self._fingerprints = OrderedDict()
+        self._lock = Lock()
+
+    def md5_checksum(self, path):
+        """
+        Get the md5 checksum of a file
+        @param path - path of the file
+        @retval md5 hex digest of the file contents
+        @throws IOError, OSError if the file can't be read
+        """
+        with open(path, 'rb') as filehandle:
+            stat = os.fstat(filehandle.fileno())
+            key = (stat.st_dev, stat.st_ino)
+
+            with self._lock:
+                fingerprint = self._fingerprints.get(key)
+                if fingerprint is not None:
+                    self._fingerprints[key] = self._fingerprints.pop(key)
+
+            if fingerprint is not None and fingerprint.size == stat.st_size and \
+            fingerprint.mod_time == stat.st_mtime:
+                return fingerprint.checksum
+
+            # the lock is not held while reading, cached md5 objects are copied, not updated
+            if fingerprint is not None and fingerprint.size < stat.st_size and \
+            prefix_crc32(filehandle, fingerprint.size, self.block_size) == fingerprint.crc:
+                log.trace("Hashing %d bytes appended to %s", stat.st_size - fingerprint.size, path)
+                md5 = fingerprint.md5.copy()
+                crc = fingerprint.crc
+                filehandle.seek(fingerprint.size)
+                size = fingerprint.size
+            else:
+                md5 = hashlib.md5()
+                crc = 0
+                filehandle.seek(0)
+                size = 0
+
+            while True:
+                block = filehandle.read(self.block_size)
+                if not block:
+                    break
+                md5.update(block)
+                crc = crc32(block, crc)
+                size += len(block)
+
+            if size != stat.st_size:
+                # the file changed while it was being read, don't keep a fingerprint
+                # that may not match the size and time
+                return md5.hexdigest()
+
+            fingerprint = FileFingerprint(size, stat.st_mtime, md5, crc)
+
+        with self._lock:
+            self._fingerprints[key] = fingerprint
+            while len(self._fingerprints) > self.max_entries:
+                self._fingerprints.popitem(last=False)
+        return fingerprint.checksum
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints.clear()
+
+
+# fingerprints shared by the harvesters and drivers in this process
+_cache = FingerprintCache()
+
+
+def md5_checksum(path):
+    """
+    Get the md5 checksum of a file using the shared fingerprint cache
+    @param path - path of the file
+    @retval md5 hex digest of the file contents
+    """
+    return _cache.md5_checksum(path)
@@ -14,9 +14,10 @@ __license__ = 'Apache 2.0'
 
 import os
 import glob
-import hashlib
 import time
+import math
 import re
+import fnmatch
 
 from threading import Thread
 from gevent.event import Event
@@ -24,7 +25,11 @@ from gevent.event import Event
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.poller import DirectoryPoller, ConditionPoller
 from mi.core.common import BaseEnum
+from mi.core.inotify import Inotify, InotifyUnavailable
+from mi.core.inotify import IN_CREATE, IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_ISDIR, IN_Q_OVERFLOW
+from mi.core.inotify import IN_IGNORED, IN_DELETE_SELF, IN_MOVE_SELF, IN_UNMOUNT
 from mi.dataset.dataset_driver import DriverStateKey
+from mi.dataset import fingerprint
 
 
 class Harvester(object):
@@ -51,6 +56,86 @@ class Harvester(object):
 # used to determine if we should do integer sorting of the files
 NUMBER_UNDERSCORE_MATCHER = re.compile(r'_\d')
 
+# directory events that may mean a matching file has appeared or changed
+DIRECTORY_EVENTS = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+# events that mean the directory watch is gone
+WATCH_LOST_EVENTS = IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT
+# number of one second slots in the file settle timer wheel
+TIMER_WHEEL_SIZE = 64
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel holding keys until a deadline has passed.  Deadlines are
+    rounded up to a tick of resolution seconds and each key is stored in the slot
+    for its tick modulo the wheel size, so scheduling, rescheduling and cancelling
+    are constant time, and collecting due keys only visits the slots for the ticks
+    that have passed since the last collection.
+    @param size - number of slots in the wheel
+    @param resolution - seconds per tick
+    """
+    def __init__(self, size=TIMER_WHEEL_SIZE, resolution=1.0):
+        self.resolution = resolution
+        self._slots = [dict() for i in range(size)]
+        self._ticks = {}
+        self._last_tick = None
+
+    def schedule(self, key, deadline):
+        """
+        Schedule a key, replacing any deadline it already has
+        @param key - the key to schedule
+        @param deadline - time after which pop_due will return the key
+        """
+        self.cancel(key)
+        tick = int(math.ceil(deadline / self.resolution))
+        if self._last_tick is not None and tick <= self._last_tick:
+            # already due, make sure the next pop_due visits its slot
+            tick = self._last_tick + 1
+        self._slots[tick % len(self._slots)][key] = tick
+        self._ticks[key] = tick
+
+    def cancel(self, key):
+        tick = self._ticks.pop(key, None)
+        if tick is not None:
+            del self._slots[tick % len(self._slots)][key]
+
+    def pop_due(self, now):
+        """
+        Remove and return the keys whose deadline is at or before now
+        @param now - the current time
+        @retval list of due keys
+        """
+        current = int(math.floor(now / self.resolution))
+        if self._last_tick is None or current - self._last_tick >= len(self._slots):
+            first = current - len(self._slots) + 1
+        else:
+            first = self._last_tick + 1
+        if self._last_tick is None or current > self._last_tick:
+            self._last_tick = current
+
+        due = []
+        if not self._ticks:
+            return due
+        for tick in range(first, current + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for (key, key_tick) in slot.items():
+                if key_tick <= current:
+                    del slot[key]
+                    del self._ticks[key]
+                    due.append(key)
+        return due
+
+    def time_to_next_tick(self, now):
+        """
+        @retval seconds from now until the wheel next has slots to visit
+        """
+        return self.resolution - (now % self.resolution)
+
+    def __contains__(self, key):
+        return key in self._ticks
+
+    def __len__(self):
+        return len(self._ticks)
+
 class SingleDirectoryPoller(ConditionPoller):
     """
     Monitor a single directory to see if new files have appeared or if files have changed.
@@ -74,6 +159,8 @@ class SingleDirectoryPoller(ConditionPoller):
         log.debug("Start directory poller path: %s, pattern: %s", directory, wildcard)
         self._found_file_state = memento
         # driver state is not a new instance of memento, it is the same here as in the driver
+        self._directory = directory
+        self._wildcard = wildcard
         self._path = directory + '/' + wildcard
         log.debug("Starting harvester with directory pattern: %s", self._path)
 
@@ -84,6 +171,109 @@ class SingleDirectoryPoller(ConditionPoller):
         super(SingleDirectoryPoller,self).__init__(self._check_for_files, callback,
                                                    exception_callback, interval)
 
+    def run(self):
+        """
+        Watch the directory with inotify, only looking at files that events have been
+        received for.  If inotify is not available poll the whole directory every
+        interval instead.
+        """
+        try:
+            inotify = Inotify()
+            inotify.add_watch(self._directory, DIRECTORY_EVENTS)
+        except (InotifyUnavailable, OSError) as e:
+            log.info("Unable to watch %s with inotify, polling every %s seconds: %s",
+                     self._directory, self.polling_interval, e)
+            super(SingleDirectoryPoller, self).run()
+            return
+
+        try:
+            if not self._run_inotify(inotify):
+                log.info("Lost inotify watch on %s, polling every %s seconds",
+                         self._directory, self.polling_interval)
+                self._condition = self._check_for_files
+                super(SingleDirectoryPoller, self).run()
+        except:
+            log.error('thread failed', exc_info=True)
+        finally:
+            inotify.close()
+
+    def _run_inotify(self, inotify):
+        """
+        Handle inotify events until shutdown.  Files named in events are held in a timer
+        wheel until file_mod_wait seconds after their last modification, then compared to
+        the harvester state the same way a directory poll would.  The directory is
+        scanned in full when the watch is set up and whenever the event queue overflows.
+        @param inotify - Inotify instance watching the directory
+        @retval False if the watch was lost before shutdown, True otherwise
+        """
+        self._settling_files = TimerWheel()
+        self._rescan = True
+        self._condition = self._check_watched_files
+
+        while not self._shutdown_now.is_set():
+            self._check_condition()
+
+            if self._settling_files:
+                timeout = min(self.polling_interval, self._settling_files.time_to_next_tick(time.time()))
+            else:
+                timeout = self.polling_interval
+
+            for event in inotify.read_events(timeout):
+                if event.mask & IN_Q_OVERFLOW:
+                    log.debug("inotify queue overflowed, rescanning %s", self._directory)
+                    self._rescan = True
+                elif event.mask & WATCH_LOST_EVENTS:
+                    return False
+                elif not event.mask & IN_ISDIR and self._matches(event.name) and \
+                event.name not in self._settling_files:
+                    # settle time is checked against the modification time when this is due
+                    self._settling_files.schedule(event.name, time.time() + self.file_mod_wait)
+        return True
+
+    def _matches(self, file_name):
+        """
+        Check a file name against the wildcard the same way glob does
+        """
+        if not file_name or (file_name[0] == '.' and self._wildcard[0] != '.'):
+            return False
+        return fnmatch.fnmatch(file_name, self._wildcard)
+
+    def _check_watched_files(self):
+        """
+        Check files whose settle time has passed, or all files if a rescan is needed,
+        returning the new and modified files in the same form as _check_for_files
+        """
+        now = time.time()
+        if self._rescan:
+            self._rescan = False
+            filenames = []
+            if os.path.isdir(self._directory):
+                filenames = glob.glob(self._path)
+        else:
+            filenames = [os.path.join(self._directory, file_name)
+                         for file_name in self._settling_files.pop_due(now)]
+            if not filenames:
+                return None
+
+        new_files = []
+        modified_state = {}
+        for i_file in self._sort_filenames(filenames):
+            try:
+                mod_time = os.path.getmtime(i_file)
+            except OSError:
+                # file has been removed or renamed
+                self._settling_files.cancel(os.path.basename(i_file))
+                continue
+            if (mod_time + self.file_mod_wait) < now:
+                self._settling_files.cancel(os.path.basename(i_file))
+                self._check_file(i_file, mod_time, new_files, modified_state)
+            else:
+                # still being written, check again once it has settled
+                self._settling_files.schedule(os.path.basename(i_file), mod_time + self.file_mod_wait)
+
+        log.debug('found new files: %r, modified_files: %r', new_files, modified_state)
+        return (new_files, modified_state)
+
     def _check_for_files(self):
         """
         Find any new or modified files and update the harvester state
@@ -93,64 +283,80 @@ class SingleDirectoryPoller(ConditionPoller):
         if os.path.exists(os.path.dirname(self._path)):
             filenames = glob.glob(self._path)
 
-        # if there are underscores in the filename, sort by ascii rather than 
-        if len(filenames) > 0:
-            if NUMBER_UNDERSCORE_MATCHER.search(filenames[0]):
-                filenames = self.sort_files(filenames)
-            else:
-                filenames.sort()
-
         new_files = []
         modified_state = {}
         # loop over all files in the directory and compare their state to that in the harvester state dictionary
-        for i_file in filenames:
+        for i_file in self._sort_filenames(filenames):
             mod_time = os.path.getmtime(i_file)
             # check if the file has not been modified in the last X seconds
             if (mod_time + self.file_mod_wait) < time.time():
-                file_name = os.path.basename(i_file)
-                # find if this file already exists in the found files
-                if file_name in self._found_file_state and self._found_file_state[file_name][DriverStateKey.INGESTED]:
-                    # this file has been ingested (file size and date will only be available for ingested files)
-                    file_size = os.path.getsize(i_file)
-                    if self._found_file_state[file_name][DriverStateKey.FILE_SIZE] != file_size or \
-                    self._found_file_state[file_name][DriverStateKey.FILE_MOD_DATE] != mod_time:
-                       # this file has been ingested, but the file size and times don't match, confirm that
-                       # the checksum is different
-                        with open(i_file, 'rb') as filehandle:
-                            md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
-                        if self._found_file_state[file_name][DriverStateKey.FILE_CHECKSUM] != md5_checksum:
-                            # ingested file has been modified!
-                            if DriverStateKey.MODIFIED_STATE in self._found_file_state[file_name]:
-                                # this file has been modified before
-                                old_state = self._found_file_state[file_name][DriverStateKey.MODIFIED_STATE]
-                                if old_state[DriverStateKey.FILE_SIZE] != file_size or \
-                                old_state[DriverStateKey.FILE_MOD_DATE] != mod_time or \
-                                old_state[DriverStateKey.FILE_CHECKSUM] != md5_checksum:
-                                    # this file has changed since its previous modification, update the
-                                    # modified state
-                                    modified_state[filename] = {
-                                        DriverStateKey.FILE_SIZE: file_size,
-                                        DriverStateKey.FILE_MOD_DATE: mod_time,
-                                        DriverStateKey.FILE_CHECKSUM: md5_checksum,
-                                    }
-                            else:
-                                # this is the first time this file has been modified
-                                modified_state[filename] = {
-                                    DriverStateKey.FILE_SIZE: file_size,
-                                    DriverStateKey.FILE_MOD_DATE: mod_time,
-                                    DriverStateKey.FILE_CHECKSUM: md5_checksum,
-                                }
-                else:
-                    # send all files that have not been ingested yet, but keep track in a queue so
-                    # duplicates are not sent
-                    if file_name not in self.sent_to_driver_queue:
-                        # only send this file once
-                        self.sent_to_driver_queue.append(file_name)
-                        new_files.append(file_name)
+                self._check_file(i_file, mod_time, new_files, modified_state)
 
         log.debug('found new files: %r, modified_files: %r', new_files, modified_state)
         return (new_files, modified_state)
 
+    def _sort_filenames(self, filenames):
+        """
+        Put file names in the order they should be sent to the driver
+        """
+        # if there are underscores in the filename, sort by ascii rather than 
+        if len(filenames) > 0:
+            if NUMBER_UNDERSCORE_MATCHER.search(filenames[0]):
+                filenames = self.sort_files(filenames)
+            else:
+                filenames.sort()
+        return filenames
+
+    def _check_file(self, i_file, mod_time, new_files, modified_state):
+        """
+        Compare a file that has not been modified for file_mod_wait seconds to the harvester
+        state, adding it to new_files if it has not been ingested or to modified_state if it
+        has been ingested and has since changed.
+        @param i_file - full path of the file
+        @param mod_time - modification time of the file
+        @param new_files - list of new file names to add to
+        @param modified_state - dictionary of modified file states to add to
+        """
+        file_name = os.path.basename(i_file)
+        # find if this file already exists in the found files
+        if file_name in self._found_file_state and self._found_file_state[file_name][DriverStateKey.INGESTED]:
+            # this file has been ingested (file size and date will only be available for ingested files)
+            file_size = os.path.getsize(i_file)
+            if self._found_file_state[file_name][DriverStateKey.FILE_SIZE] != file_size or \
+            self._found_file_state[file_name][DriverStateKey.FILE_MOD_DATE] != mod_time:
+               # this file has been ingested, but the file size and times don't match, confirm that
+               # the checksum is different
+                md5_checksum = fingerprint.md5_checksum(i_file)
+                if self._found_file_state[file_name][DriverStateKey.FILE_CHECKSUM] != md5_checksum:
+                    # ingested file has been modified!
+                    if DriverStateKey.MODIFIED_STATE in self._found_file_state[file_name]:
+                        # this file has been modified before
+                        old_state = self._found_file_state[file_name][DriverStateKey.MODIFIED_STATE]
+                        if old_state[DriverStateKey.FILE_SIZE] != file_size or \
+                        old_state[DriverStateKey.FILE_MOD_DATE] != mod_time or \
+                        old_state[DriverStateKey.FILE_CHECKSUM] != md5_checksum:
+                            # this file has changed since its previous modification, update the
+                            # modified state
+                            modified_state[file_name] = {
+                                DriverStateKey.FILE_SIZE: file_size,
+                                DriverStateKey.FILE_MOD_DATE: mod_time,
+                                DriverStateKey.FILE_CHECKSUM: md5_checksum,
+                            }
+                    else:
+                        # this is the first time this file has been modified
+                        modified_state[file_name] = {
+                            DriverStateKey.FILE_SIZE: file_size,
+                            DriverStateKey.FILE_MOD_DATE: mod_time,
+                            DriverStateKey.FILE_CHECKSUM: md5_checksum,
+                        }
+        else:
+            # send all files that have not been ingested yet, but keep track in a queue so
+            # duplicates are not sent
+            if file_name not in self.sent_to_driver_queue:
+                # only send this file once
+                self.sent_to_driver_queue.append(file_name)
+                new_files.append(file_name)
+
     def sort_files(self, filenames):
         """
         Sorts files which have multiple indices separated by underscores in a file name.
@@ -288,8 +494,7 @@ class SingleFilePoller(ConditionPoller):
                     if self._found_file_state[DriverStateKey.FILE_SIZE] != file_size or \
                         self._found_file_state[DriverStateKey.FILE_MOD_DATE] != mod_time:
                         # size or time is different, confirm with checksum
-                        with open(self._path, 'rb') as filehandle:
-                            md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                        md5_checksum = fingerprint.md5_checksum(self._path)
                         if self._found_file_state[DriverStateKey.FILE_CHECKSUM] != md5_checksum:
                             # file is different, update the state
                             self._found_file_state[DriverStateKey.FILE_SIZE] = file_size
@@ -305,8 +510,7 @@ class SingleFilePoller(ConditionPoller):
                             }
                 else:
                     # no driver state yet, first time opening this file
-                    with open(self._path, 'rb') as filehandle:
-                        md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                    md5_checksum = fingerprint.md5_checksum(self._path)
 
                     self._found_file_state[DriverStateKey.FILE_SIZE] = file_size
                     self._found_file_state[DriverStateKey.FILE_MOD_DATE] = mod_time
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.ingest_pool
+@file mi/dataset/ingest_pool.py
+@author agent
+@brief Parse files for a dataset driver in a pool of worker processes
+
+Parsers run in the driver's process, so a driver with several data keys
+parses all of them on one core.  When ingest_processes is set in the driver
+config, a MultipleHarvesterDataSetDriver hands each file to an IngestPool
+instead.  Each worker is a separate python interpreter which builds its own
+copy of the driver from the driver's module, class and config, then parses
+the files it is sent with the driver's own _get_parser_results.  The
+particles, parser states, events and exceptions the worker's driver produces
+are sent back over the worker's stdout as they happen, and passed to the
+driver's callbacks in the driver process in the order they were produced.
+A data key only parses one file at a time, so particles and state for a key
+stay in order while files for different keys are parsed in parallel.
+
+The driver process keeps the driver state and the harvesters, the workers
+only ever see the state of the file they are parsing.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import re
+import sys
+import copy
+import struct
+import cPickle as pickle
+from cStringIO import StringIO
+from subprocess import Popen, PIPE
+
+import gevent
+import gevent.queue
+import gevent.socket
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.exceptions import SampleException, DatasetParserException
+
+# each message is a pickle preceded by its length
+MESSAGE_HEADER = struct.Struct('>I')
+
+
+MATCH_TYPE = type(re.match('', ''))
+
+
+def _persistent_id(obj):
+    """
+    Many particles hold the regex match of their sample as their raw data.
+    Match objects can't be pickled, so they are sent as the string they
+    matched in and matched again when they are unpickled.  This is done
+    with the persistent id of the pickler used for messages, rather than
+    registering match objects with copy_reg, so pickling anywhere else in
+    the process is unchanged.
+    """
+    if type(obj) is MATCH_TYPE:
+        return (obj.re.pattern, obj.re.flags, obj.string, obj.start(), obj.endpos)
+    return None
+
+
+def _persistent_load(persistent_id):
+    (pattern, flags, string, start, endpos) = persistent_id
+    return re.compile(pattern, flags).match(string, start, endpos)
+
+
+def dumps(message):
+    """
+    Pickle a message to send to or from a worker
+    @param message The object to send
+    @retval The pickled message
+    """
+    buf = StringIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = _persistent_id
+    pickler.dump(message)
+    return buf.getvalue()
+
+
+def loads(data):
+    """
+    Unpickle a message pickled with dumps
+    @param data The pickled message
+    @retval The object sent
+    """
+    unpickler = pickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = _persistent_load
+    return unpickler.load()
+
+
+class IngestMessage(object):
+    # sent to a worker
+    START = 'start'
+    PARSE = 'parse'
+    # sent from a worker
+    DATA = 'data'
+    STATE = 'state'
+    EVENT = 'event'
+    EXCEPTION = 'exception'
+    DONE = 'done'
+
+
+def write_message(stream, message):
+    """
+    Write a message to a blocking stream
+    @param stream The file to write to
+    @param message The object to send
+    """
+    data = dumps(message)
+    stream.write(MESSAGE_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def read_message(fd, cooperative=False):
+    """
+    Read a message from a file descriptor.  The bytes are read with os.read
+    rather than a buffered file, so data for the next message is never left
+    in a buffer while waiting for the file descriptor to be readable.
+    @param fd The file descriptor to read from
+    @param cooperative True to let other greenlets run while waiting for data
+    @retval The object sent
+    @throws EOFError if the other end was closed
+    """
+    (length,) = MESSAGE_HEADER.unpack(_read_exactly(fd, MESSAGE_HEADER.size, cooperative))
+    return loads(_read_exactly(fd, length, cooperative))
+
+
+def _read_exactly(fd, size, cooperative):
+    chunks = []
+    remain = size
+    while remain > 0:
+        if cooperative:
+            gevent.socket.wait_read(fd)
+        chunk = os.read(fd, remain)
+        if not chunk:
+            raise EOFError("Ingest worker pipe closed")
+        chunks.append(chunk)
+        remain -= len(chunk)
+    return ''.join(chunks)
+
+
+class IngestWorkerProcess(object):
+    """
+    A worker interpreter, seen from the driver process
+    @param driver_module The module of the driver class
+    @param driver_class The name of the driver class
+    @param config The driver config for the worker's driver
+    """
+    def __init__(self, driver_module, driver_class, config):
+        # the worker imports the driver from the same path as this process
+        self._process = Popen([sys.executable, '-m', 'mi.dataset.ingest_pool'],
+                              stdin=PIPE, stdout=PIPE, close_fds=True,
+                              env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        log.debug("Started ingest worker %d for %s.%s", self._process.pid, driver_module, driver_class)
+        write_message(self._process.stdin, (IngestMessage.START, (driver_module, driver_class, config)))
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def parse(self, data_key, file_name, file_state, handle_message):
+        """
+        Parse a file in the worker
+        @param data_key The data key the file was found for
+        @param file_name The name of the file
+        @param file_state The driver state of the file
+        @param handle_message Called with each message from the worker until the file is parsed
+        @retval The exception raised in the worker while parsing the file, None if there wasn't one
+        @throws DatasetParserException if the worker exits
+        """
+        write_message(self._process.stdin, (IngestMessage.PARSE, (data_key, file_name, file_state)))
+        while True:
+            try:
+                (message_type, content) = read_message(self._process.stdout.fileno(), cooperative=True)
+            except EOFError:
+                raise DatasetParserException("Ingest worker %d exited while parsing %s" %
+                                             (self._process.pid, file_name))
+            if message_type == IngestMessage.DONE:
+                return content
+            handle_message(message_type, content)
+
+    def close(self):
+        """
+        Stop the worker.  A worker may be in the middle of a file whose messages
+        will no longer be read, so it is killed rather than asked to finish.
+        """
+        if self.is_alive():
+            log.debug("Stopping ingest worker %d", self._process.pid)
+            try:
+                self._process.kill()
+            except OSError:
+                pass
+        self._process.wait()
+        self._process.stdin.close()
+        self._process.stdout.close()
+
+
+class IngestPool(object):
+    """
+    A fixed number of worker processes shared by the data keys of a driver.
+    Workers are started the first time they are needed.
+    @param driver The driver the files are parsed for
+    @param processes The number of worker processes
+    @param config The driver config, without the ingest_processes setting
+    """
+    def __init__(self, driver, processes, config):
+        self._driver_module = driver.__class__.__module__
+        self._driver_class = driver.__class__.__name__
+        self._config = copy.deepcopy(config)
+        self._workers = []
+        self._idle = gevent.queue.Queue()
+        for i in xrange(processes):
+            self._idle.put(None)
+
+    def parse(self, data_key, file_name, file_state, handle_message):
+        """
+        Parse a file in the next free worker, waiting for one if they are all busy
+        @param data_key The data key the file was found for
+        @param file_name The name of the file
+        @param file_state The driver state of the file
+        @param handle_message Called with each message type and content from the worker
+        @throws Any exception raised in the worker while parsing the file
+        """
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.is_alive():
+                worker = IngestWorkerProcess(self._driver_module, self._driver_class, self._config)
+                self._workers.append(worker)
+            error = worker.parse(data_key, file_name, file_state, handle_message)
+        except BaseException:
+            # interrupted part way through a file, or the worker failed, don't reuse it
+            self._remove(worker)
+            worker = None
+            raise
+        finally:
+            self._idle.put(worker)
+
+        if error is not None:
+            raise error
+
+    def close(self):
+        """
+        Stop all the workers
+        """
+        for worker in list(self._workers):
+            self._remove(worker)
+
+    def _remove(self, worker):
+        if worker is not None and worker in self._workers:
+            self._workers.remove(worker)
+            worker.close()
+
+
+class IngestWorker(object):
+    """
+    The driver in a worker process.  Callbacks from the driver are sent to the
+    driver process as messages.
+    @param driver_module The module of the driver class
+    @param driver_class The name of the driver class
+    @param config The driver config
+    @param stream The file to send messages on
+    """
+    def __init__(self, driver_module, driver_class, config, stream):
+        self._stream = stream
+        self._data_key = None
+        self._file_name = None
+        module = __import__(driver_module, fromlist=[driver_class])
+        self._driver = getattr(module, driver_class)(config, None, self._data_callback, self._state_callback,
+                                                     self._event_callback, self._exception_callback)
+
+    def parse(self, data_key, file_name, file_state):
+        """
+        Parse a file with the driver, then send DONE with the exception that
+        stopped the parse, if any
+        """
+        self._data_key = data_key
+        self._file_name = file_name
+        self._driver._driver_state.setdefault(data_key, {})[file_name] = file_state
+        self._driver._file_in_process[data_key] = file_name
+        error = None
+        try:
+            self._driver._get_parser_results(file_name, data_key)
+        except Exception as e:
+            log.debug("Exception parsing %s in ingest worker: %s", file_name, e)
+            error = e
+        finally:
+            self._driver._file_in_process[data_key] = None
+            del self._driver._driver_state[data_key][file_name]
+        self._send(IngestMessage.DONE, error)
+
+    def _send(self, message_type, content):
+        if isinstance(content, Exception):
+            content = self._portable_exception(content)
+        write_message(self._stream, (message_type, content))
+
+    @staticmethod
+    def _portable_exception(exception):
+        """
+        Exceptions which can't be pickled and unpickled are sent as the
+        closest exception that can
+        """
+        try:
+            loads(dumps(exception))
+            return exception
+        except Exception as e:
+            log.debug("Unable to send exception %r: %s", exception, e)
+        if isinstance(exception, SampleException):
+            return SampleException(str(exception))
+        return DatasetParserException("%s: %s" % (exception.__class__.__name__, exception))
+
+    def _data_callback(self, particles):
+        self._send(IngestMessage.DATA, particles)
+
+    def _state_callback(self, driver_state):
+        """
+        Only the state of the file being parsed changes in a worker
+        """
+        self._send(IngestMessage.STATE, driver_state[self._data_key][self._file_name])
+
+    def _event_callback(self, **kwargs):
+        self._send(IngestMessage.EVENT, kwargs)
+
+    def _exception_callback(self, exception):
+        self._send(IngestMessage.EXCEPTION, exception)
+
+
+def main():
+    """
+    Run a worker, reading messages on stdin and writing them to stdout
+    """
+    # anything else written to stdout, such as log messages, goes to stderr
+    # so it isn't mixed in with the messages
+    stream = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    fd = sys.stdin.fileno()
+
+    worker = None
+    while True:
+        try:
+            (message_type, content) = read_message(fd)
+        except EOFError:
+            break
+        if message_type == IngestMessage.START:
+            worker = IngestWorker(*content, stream=stream)
+        elif message_type == IngestMessage.PARSE:
+            worker.parse(*content)
+
+
+if __name__ == '__main__':
+    main()
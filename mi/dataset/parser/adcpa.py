@@ -25,7 +25,6 @@ import datetime as dt
 import re
 from calendar import timegm
 from functools import partial
-from struct import unpack
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
@@ -33,6 +32,7 @@ from mi.core.exceptions import SampleException, DatasetParserException
 from mi.core.instrument.chunker import StringChunker
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey
 from mi.dataset.dataset_parser import BufferLoadingParser
+from mi.dataset.parser import pd0
 
 # start the logger
 log = get_logger()
@@ -281,28 +281,22 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         """
         self.final_result = []
 
-        length = unpack("<H", self.raw_data[2:4])[0]
         data = str(self.raw_data)
+        (header_id, data_source_id, num_bytes, spare, num_data_types) = \
+            pd0.read_record(data, pd0.HEADER)
 
-        # Calculate the checksum
-        total = int(0)
-        for i in range(0, length):
-            total += int(ord(data[i]))
-
-        checksum = total & 65535    # bitwise and with 65535 or mod vs 65536
+        # Calculate the checksum of the num_bytes bytes before it
+        checksum = pd0.checksum(data, num_bytes)
+        ensemble_checksum = pd0.read_record(data, pd0.CHECKSUM, num_bytes)
 
-        if checksum != unpack("<H", self.raw_data[length: length+2])[0]:
-            log.debug("Checksum mismatch " + str(checksum) + " != "
-                      + str(unpack("<H", self.raw_data[length: length+2])[0]))
+        if checksum != ensemble_checksum:
+            log.debug("Checksum mismatch " + str(checksum) + " != " + str(ensemble_checksum))
             raise SampleException("Checksum mismatch")
 
         # save the checksum and process the remainder of the ensemble
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CHECKSUM,
                                   DataParticleKey.VALUE: checksum})
 
-        (header_id, data_source_id, num_bytes, spare, num_data_types) = \
-            unpack('<BBHBB', self.raw_data[0:6])
-
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.HEADER_ID,
                                   DataParticleKey.VALUE: header_id})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.DATA_SOURCE_ID,
@@ -312,14 +306,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.NUM_DATA_TYPES,
                                   DataParticleKey.VALUE: num_data_types})
 
-        offsets = []    # create list for offsets
-        strt = 6        # offsets start at byte 6 (using 0 indexing)
-        nDT = 1         # counter for n data types
-        while nDT <= num_data_types:
-            value = unpack('<H', self.raw_data[strt:strt+2])[0]
-            offsets.append(value)
-            strt += 2
-            nDT += 1
+        # offsets to each data type follow the header
+        offsets = pd0.read_offsets(data, num_data_types)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.OFFSET_DATA_TYPES,
                                   DataParticleKey.VALUE: offsets})
@@ -327,11 +315,11 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         for offset in offsets:
             # for each offset, using the starting byte, determine the data type
             # and then parse accordingly.
-            data_type = unpack('<H', self.raw_data[offset:offset+2])[0]
+            data_type = pd0.read_data_type_id(data, offset)
 
             # fixed leader data (x00x00)
             if data_type == 0:
-                chunk = self.raw_data[offset:offset+58]
+                chunk = data[offset:offset+pd0.FIXED_LEADER.itemsize]
                 self.parse_fixed_chunk(chunk)
                 iCells = self.num_depth_cells   # grab the # of depth cells
                                                 # obtained from the fixed leader
@@ -339,7 +327,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
             # variable leader data (x80x00)
             if data_type == 128:
-                chunk = self.raw_data[offset:offset+60]
+                chunk = data[offset:offset+pd0.VARIABLE_LEADER.itemsize]
                 self.parse_variable_chunk(chunk)
 
             # velocity data (x00x01)
@@ -347,7 +335,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
                 # number of bytes is a function of the user selectable number of
                 # depth cells (WN command), calculated above
                 nBytes = 2 + 8 * iCells
-                chunk = self.raw_data[offset:offset+nBytes]
+                chunk = data[offset:offset+nBytes]
                 self.parse_velocity_chunk(chunk)
 
             # correlation magnitude data (x00x02)
@@ -355,7 +343,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
                 # number of bytes is a function of the user selectable number of
                 # depth cells (WN command), calculated above
                 nBytes = 2 + 4 * iCells
-                chunk = self.raw_data[offset:offset+nBytes]
+                chunk = data[offset:offset+nBytes]
                 self.parse_corelation_magnitude_chunk(chunk)
 
             # echo intensity data (x00x03)
@@ -363,7 +351,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
                 # number of bytes is a function of the user selectable number of
                 # depth cells (WN command), calculated above
                 nBytes = 2 + 4 * iCells
-                chunk = self.raw_data[offset:offset+nBytes]
+                chunk = data[offset:offset+nBytes]
                 self.parse_echo_intensity_chunk(chunk)
 
             # percent-good data (x00x04)
@@ -371,12 +359,12 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
                 # number of bytes is a function of the user selectable number of
                 # depth cells (WN command), calculated above
                 nBytes = 2 + 4 * iCells
-                chunk = self.raw_data[offset:offset+nBytes]
+                chunk = data[offset:offset+nBytes]
                 self.parse_percent_good_chunk(chunk)
 
             # bottom track data (x00x06)
             if data_type == 1536:
-                chunk = self.raw_data[offset:offset+81]
+                chunk = data[offset:offset+pd0.BOTTOM_TRACK.itemsize]
                 self.parse_bottom_track_chunk(chunk)
 
         return self.final_result
@@ -398,7 +386,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
          reference_layer_stop, false_target_threshold, SPARE1,
          transmit_lag_distance, SPARE2, system_bandwidth,
          SPARE3, SPARE4, serial_number) = \
-            unpack('<HBBHBBBBHHHBBBBHBBBBhhBBHHBBBBHQHBBI', chunk)
+            pd0.read_record(chunk, pd0.FIXED_LEADER)
 
         if 0 != fixed_leader_id:
             raise SampleException("fixed_leader_id was not equal to 0")
@@ -540,7 +528,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
          adc_attitiude, adc_contamination_sensor, error_status_word_1,
          error_status_word_2, error_status_word_3, error_status_word_4,
          SPARE1, pressure, pressure_variance, SPARE2) = \
-            unpack('<HHBBBBBBBBBBHHHhhHhBBBBBBBBBBBBBBBBBBHIII', chunk)
+            pd0.read_record(chunk, pd0.VARIABLE_LEADER)
 
         if 128 != variable_leader_id:
             raise SampleException("variable_leader_id was not equal to 128")
@@ -666,27 +654,15 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 2 / 4
-        offset = 0
-
-        velocity_data_id = unpack("<H", chunk[0:2])[0]
+        velocity_data_id = pd0.read_data_type_id(chunk)
         if 256 != velocity_data_id:
             raise SampleException("velocity_data_id was not equal to 256")
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.VELOCITY_DATA_ID,
                                   DataParticleKey.VALUE: velocity_data_id})
 
-        water_velocity_east = []
-        water_velocity_north = []
-        water_velocity_up = []
-        error_velocity = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<hhhh', chunk[offset + 2: offset + 10])
-            water_velocity_east.append(a)
-            water_velocity_north.append(b)
-            water_velocity_up.append(c)
-            error_velocity.append(d)
-            offset += 4 * 2
+        (water_velocity_east, water_velocity_north, water_velocity_up, error_velocity) = \
+            pd0.read_cells(chunk, pd0.VELOCITY_CELL)
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_EAST,
                                   DataParticleKey.VALUE: water_velocity_east})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_NORTH,
@@ -702,27 +678,16 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
-        correlation_magnitude_id = unpack("<H", chunk[0:2])[0]
+        correlation_magnitude_id = pd0.read_data_type_id(chunk)
         if 512 != correlation_magnitude_id:
             raise SampleException("correlation_magnitude_id was not equal to 512")
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_ID,
                                   DataParticleKey.VALUE: correlation_magnitude_id})
 
-        correlation_magnitude_beam1 = []
-        correlation_magnitude_beam2 = []
-        correlation_magnitude_beam3 = []
-        correlation_magnitude_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            correlation_magnitude_beam1.append(a)
-            correlation_magnitude_beam2.append(b)
-            correlation_magnitude_beam3.append(c)
-            correlation_magnitude_beam4.append(d)
-            offset += 4
+        (correlation_magnitude_beam1, correlation_magnitude_beam2,
+         correlation_magnitude_beam3, correlation_magnitude_beam4) = \
+            pd0.read_cells(chunk, pd0.BEAM_CELL)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_BEAM1,
                                   DataParticleKey.VALUE: correlation_magnitude_beam1})
@@ -739,26 +704,14 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
-        echo_intensity_id = unpack("<H", chunk[0:2])[0]
+        echo_intensity_id = pd0.read_data_type_id(chunk)
         if 768 != echo_intensity_id:
             raise SampleException("echo_intensity_id was not equal to 768")
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_ID,
                                   DataParticleKey.VALUE: echo_intensity_id})
 
-        echo_intesity_beam1 = []
-        echo_intesity_beam2 = []
-        echo_intesity_beam3 = []
-        echo_intesity_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            echo_intesity_beam1.append(a)
-            echo_intesity_beam2.append(b)
-            echo_intesity_beam3.append(c)
-            echo_intesity_beam4.append(d)
-            offset += 4
+        (echo_intesity_beam1, echo_intesity_beam2, echo_intesity_beam3, echo_intesity_beam4) = \
+            pd0.read_cells(chunk, pd0.BEAM_CELL)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_BEAM1,
                                   DataParticleKey.VALUE: echo_intesity_beam1})
@@ -775,27 +728,15 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
-        percent_good_id = unpack("<H", chunk[0:2])[0]
+        percent_good_id = pd0.read_data_type_id(chunk)
         if 1024 != percent_good_id:
             raise SampleException("percent_good_id was not equal to 1024")
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_ID,
                                   DataParticleKey.VALUE: percent_good_id})
 
-        percent_good_3beam = []
-        percent_transforms_reject = []
-        percent_bad_beams = []
-        percent_good_4beam = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            percent_good_3beam.append(a)
-            percent_transforms_reject.append(b)
-            percent_bad_beams.append(c)
-            percent_good_4beam.append(d)
-            offset += 4
+        (percent_good_3beam, percent_transforms_reject, percent_bad_beams, percent_good_4beam) = \
+            pd0.read_cells(chunk, pd0.BEAM_CELL)
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_3BEAM,
                                   DataParticleKey.VALUE: percent_good_3beam})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_TRANSFORMS_REJECT,
@@ -830,7 +771,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
          beam2_rssi_amplitude, beam3_rssi_amplitude, beam4_rssi_amplitude,
          bt_gain, beam1_bt_range_msb, beam2_bt_range_msb, beam3_bt_range_msb,
          beam4_bt_range_msb) = \
-            unpack('<HHHBBBBHLHHHHhhhhBBBBBBBBBBBBHHHhhhhBBBBBBBBBBBBHBBBBBBBBB', chunk)
+            pd0.read_record(chunk, pd0.BOTTOM_TRACK)
 
         if 1536 != bottom_track_id:
             raise SampleException("bottom_track_id was not equal to 1536")
@@ -1021,7 +962,7 @@ class AdcpaParser(BufferLoadingParser):
         @throws EOFError when the end of the file is reached
         """
         # read in some more data
-        data = self._stream_handle.read()
+        data = self._read()
         if data:
             self._chunker.add_chunk(data, self._timestamp)
             return len(data)
@@ -8,11 +8,18 @@
 Release notes:
 
 Initial Release
+
+Packets can be reaped in batches: each call to get_records drains up to
+batch_packets packets from the reap thread queue, or as many as arrive within
+batch_milliseconds, publishes them together and updates the state once, so
+fast seismic and hydrophone feeds don't pay for a publish and a state update
+on every packet.
 """
 
 __author__ = 'Jeff Laughlin <jeff@jefflaughlinconsulting.com>'
 __license__ = 'Apache 2.0'
 
+import time
 
 import numpy as np
 
@@ -35,6 +42,8 @@ class ParserConfigKey(BaseEnum):
     ORBNAME = "orbname"
     SELECT  = "select"
     REJECT  = "reject"
+    BATCH_PACKETS = "batch_packets" # max packets to reap per get_records call
+    BATCH_MILLISECONDS = "batch_milliseconds" # max time to spend reaping per call
 
 
 class StateKey(BaseEnum):
@@ -47,6 +56,11 @@ class DataParticleType(BaseEnum):
     ANTELOPE_ORB_PACKET = 'antelope_orb_packet'
 
 
+# Default to reaping a single packet per get_records call
+DEFAULT_BATCH_PACKETS = 1
+DEFAULT_QUEUE_SIZE = 100
+
+
 class AntelopeOrbPacketParticleKey(BaseEnum):
     ID = 'id'
     CHANNELS = 'channels'
@@ -145,7 +159,10 @@ class AntelopeOrbPacketParticle(DataParticle):
                 channel[ck.CHAN] = _pkt._PktChannel_chan_get(pktchan)
                 channel[ck.CUSER1] = _pkt._PktChannel_cuser1_get(pktchan)
                 channel[ck.CUSER2] = _pkt._PktChannel_cuser2_get(pktchan)
-                channel[ck.DATA] = np.array(_pkt._PktChannel_data_get(pktchan))
+                data = _pkt._PktChannel_data_get(pktchan)
+                # copy the samples straight into the array, without np.array
+                # working out the type and length from a list first
+                channel[ck.DATA] = np.fromiter(data, dtype=np.int_, count=len(data))
                 channel[ck.DUSER1] = _pkt._PktChannel_duser1_get(pktchan)
                 channel[ck.DUSER2] = _pkt._PktChannel_duser2_get(pktchan)
                 channel[ck.IUSER1] = _pkt._PktChannel_iuser1_get(pktchan)
@@ -207,7 +224,15 @@ class AntelopeOrbParser(Parser):
 
         tafter = state[StateKey.TAFTER]
 
-        self._orbreapthr = OrbReapThr(orbname, select, reject, float(tafter), timeout=0, queuesize=100)
+        self._batch_packets = int(config.get(ParserConfigKey.BATCH_PACKETS) or DEFAULT_BATCH_PACKETS)
+        if self._batch_packets < 1:
+            raise ValueError("%s must be at least 1" % ParserConfigKey.BATCH_PACKETS)
+        batch_milliseconds = config.get(ParserConfigKey.BATCH_MILLISECONDS)
+        self._batch_seconds = batch_milliseconds / 1000.0 if batch_milliseconds else None
+
+        # leave room in the queue for a whole batch
+        queuesize = max(DEFAULT_QUEUE_SIZE, self._batch_packets)
+        self._orbreapthr = OrbReapThr(orbname, select, reject, float(tafter), timeout=0, queuesize=queuesize)
         log.info("Connected to ORB %s %s %s %s" % (orbname, select, reject, tafter))
 
     def kill_threads(self):
@@ -216,31 +241,51 @@ class AntelopeOrbParser(Parser):
 
     def get_records(self):
         """
-        Go ahead and execute the data parsing loop up to a point. This involves
-        getting data from the file, stuffing it in to the chunker, then parsing
-        it and publishing.
-        @param num_records The number of records to gather
-        @retval Return the list of particles requested, [] if none available
+        Reap a batch of packets from the ORB, up to batch_packets packets or
+        batch_milliseconds, stopping early if the reap thread queue runs dry.
+        Publish a particle for each packet as one batch, then push the new
+        state to the driver.
+        @retval Return the list of particles published, [] if none available
         """
         log.trace("GET RECORDS")
+        if self.stop:
+            return []
+
+        deadline = None
+        if self._batch_seconds is not None:
+            deadline = time.time() + self._batch_seconds
+
+        particles = []
+        orbtimestamp = None
         try:
-            if self.stop:
-                return
-            get_r = self._orbreapthr.get()
-            pktid, srcname, orbtimestamp, raw_packet = get_r
-            log.trace("get_r: %s %s %s %s", pktid, srcname, orbtimestamp, len(raw_packet))
-            particle = AntelopeOrbPacketParticle(
-                get_r,
-                preferred_timestamp = DataParticleKey.INTERNAL_TIMESTAMP,
-                new_sequence=False,
-            )
-            self._publish_sample(particle)
-            # TODO rate limit state updates?
-            self._state[StateKey.TAFTER] = orbtimestamp
-            log.debug("State: ", self._state)
-            self._state_callback(self._state, False) # push new state to driver
+            while len(particles) < self._batch_packets:
+                get_r = self._orbreapthr.get()
+                pktid, srcname, orbtimestamp, raw_packet = get_r
+                log.trace("get_r: %s %s %s %s", pktid, srcname, orbtimestamp, len(raw_packet))
+                particles.append(AntelopeOrbPacketParticle(
+                    get_r,
+                    preferred_timestamp = DataParticleKey.INTERNAL_TIMESTAMP,
+                    new_sequence=False,
+                ))
+                if deadline is not None and time.time() >= deadline:
+                    break
         except (Timeout, NoData), e:
             log.debug("orbreapthr.get exception %r" % type(e))
-            return None
-        return get_r
+        finally:
+            # publish whatever was reaped, even if the reap thread failed part
+            # way through the batch
+            if particles:
+                self._publish_batch(particles, orbtimestamp)
+        return particles
 
+    def _publish_batch(self, particles, orbtimestamp):
+        """
+        Publish a batch of particles and update the state once for the whole batch
+        @param particles The particles to publish
+        @param orbtimestamp The ORB timestamp of the last packet in the batch
+        """
+        log.debug("Publishing %d ORB packets", len(particles))
+        self._publish_sample(particles)
+        self._state[StateKey.TAFTER] = orbtimestamp
+        log.debug("State: %s", self._state)
+        self._state_callback(self._state, False) # push new state to driver
@@ -17,11 +17,12 @@ from datetime import datetime
 
 from math import copysign
 from functools import partial
+from operator import itemgetter
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, DatasetParserException, UnexpectedDataException
-from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import StringChunker, IncrementalSieve
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey
 from mi.dataset.dataset_parser import BufferLoadingParser
 
@@ -87,9 +88,14 @@ class GliderParticle(DataParticle):
     # contain actual science data for this instrument. This flag
     # will be set to true if we have found data when parsed.
     common_parameters = GliderParticleKey.list()
+    # the data columns this particle is built from, None if it doesn't come from the data rows
+    parameters = None
 
     def _parsed_values(self, key_list):
         log.debug(" # GliderParticle._parsed_values(): Build a particle with keys: %s", key_list)
+        if isinstance(self.raw_data, GliderRow):
+            return self.raw_data.parsed_values(key_list)
+
         if not isinstance(self.raw_data, dict):
             raise SampleException(
                 "%s: Object Instance is not a Glider Parsed Data \
@@ -141,6 +147,7 @@ class CtdgvParticleKey(GliderParticleKey):
 class CtdgvDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CTDGV_M_GLIDER_INSTRUMENT
     science_parameters = CtdgvParticleKey.science_parameter_list()
+    parameters = CtdgvParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -149,7 +156,7 @@ class CtdgvDataParticle(GliderParticle):
 
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(CtdgvParticleKey.list())
+        return self._parsed_values(CtdgvDataParticle.parameters)
 
 
 class DostaTelemeteredParticleKey(GliderParticleKey):
@@ -179,6 +186,7 @@ class DostaRecoveredParticleKey(GliderParticleKey):
 class DostaTelemeteredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.DOSTA_ABCDJM_GLIDER_INSTRUMENT
     science_parameters = DostaTelemeteredParticleKey.science_parameter_list()
+    parameters = DostaTelemeteredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -188,12 +196,13 @@ class DostaTelemeteredDataParticle(GliderParticle):
         @param gpd A GliderParser class instance.
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(DostaTelemeteredParticleKey.list())
+        return self._parsed_values(DostaTelemeteredDataParticle.parameters)
 
 
 class DostaRecoveredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.DOSTA_ABCDJM_GLIDER_RECOVERED
     science_parameters = DostaRecoveredParticleKey.science_parameter_list()
+    parameters = DostaRecoveredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -203,7 +212,7 @@ class DostaRecoveredDataParticle(GliderParticle):
         @param gpd A GliderParser class instance.
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(DostaRecoveredParticleKey.list())
+        return self._parsed_values(DostaRecoveredDataParticle.parameters)
 
 
 class FlordParticleKey(GliderParticleKey):
@@ -221,6 +230,7 @@ class FlordParticleKey(GliderParticleKey):
 class FlordDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.FLORD_M_GLIDER_INSTRUMENT
     science_parameters = FlordParticleKey.science_parameter_list()
+    parameters = FlordParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -231,7 +241,7 @@ class FlordDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(FlordParticleKey.list())
+        return self._parsed_values(FlordDataParticle.parameters)
 
 
 class FlortTelemeteredParticleKey(GliderParticleKey):
@@ -256,6 +266,7 @@ class FlortRecoveredParticleKey(GliderParticleKey):
 class FlortTelemeteredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.FLORT_M_GLIDER_INSTRUMENT
     science_parameters = FlortTelemeteredParticleKey.science_parameter_list()
+    parameters = FlortTelemeteredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -266,12 +277,13 @@ class FlortTelemeteredDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(FlortTelemeteredParticleKey.list())
+        return self._parsed_values(FlortTelemeteredDataParticle.parameters)
 
 
 class FlortRecoveredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.FLORT_M_GLIDER_RECOVERED
     science_parameters = FlortRecoveredParticleKey.science_parameter_list()
+    parameters = FlortRecoveredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -282,7 +294,7 @@ class FlortRecoveredDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(FlortRecoveredParticleKey.list())
+        return self._parsed_values(FlortRecoveredDataParticle.parameters)
 
 
 class ParadTelemeteredParticleKey(GliderParticleKey):
@@ -301,6 +313,7 @@ class ParadRecoveredParticleKey(GliderParticleKey):
 class ParadTelemeteredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.PARAD_M_GLIDER_INSTRUMENT
     science_parameters = ParadTelemeteredParticleKey.science_parameter_list()
+    parameters = ParadTelemeteredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -311,12 +324,13 @@ class ParadTelemeteredDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(ParadTelemeteredParticleKey.list())
+        return self._parsed_values(ParadTelemeteredDataParticle.parameters)
 
 
 class ParadRecoveredDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.PARAD_M_GLIDER_RECOVERED
     science_parameters = ParadRecoveredParticleKey.science_parameter_list()
+    parameters = ParadRecoveredParticleKey.list()
 
     def _build_parsed_values(self):
         """
@@ -327,7 +341,7 @@ class ParadRecoveredDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(ParadRecoveredParticleKey.list())
+        return self._parsed_values(ParadRecoveredDataParticle.parameters)
 
 
 class EngineeringRecoveredParticleKey(GliderParticleKey):
@@ -669,6 +683,7 @@ class EngineeringTelemeteredDataParticle(GliderParticle):
     keys_exclude_sci_times = EngineeringTelemeteredParticleKey.list()
     keys_exclude_sci_times.remove(GliderParticleKey.SCI_M_PRESENT_TIME)
     keys_exclude_sci_times.remove(GliderParticleKey.SCI_M_PRESENT_SECS_INTO_MISSION)
+    parameters = keys_exclude_sci_times
 
     def _build_parsed_values(self):
         """
@@ -704,6 +719,7 @@ class EngineeringScienceTelemeteredDataParticle(GliderParticle):
     keys_exclude_times = EngineeringScienceTelemeteredParticleKey.list()
     keys_exclude_times.remove(GliderParticleKey.M_PRESENT_TIME)
     keys_exclude_times.remove(GliderParticleKey.M_PRESENT_SECS_INTO_MISSION)
+    parameters = keys_exclude_times
 
     def _build_parsed_values(self):
         """
@@ -724,6 +740,7 @@ class EngineeringRecoveredDataParticle(GliderParticle):
     keys_exclude_sci_times = EngineeringRecoveredParticleKey.list()
     keys_exclude_sci_times.remove(GliderParticleKey.SCI_M_PRESENT_TIME)
     keys_exclude_sci_times.remove(GliderParticleKey.SCI_M_PRESENT_SECS_INTO_MISSION)
+    parameters = keys_exclude_sci_times
 
     def _build_parsed_values(self):
         """
@@ -744,6 +761,7 @@ class EngineeringScienceRecoveredDataParticle(GliderParticle):
     keys_exclude_times = EngineeringScienceRecoveredParticleKey.list()
     keys_exclude_times.remove(GliderParticleKey.M_PRESENT_TIME)
     keys_exclude_times.remove(GliderParticleKey.M_PRESENT_SECS_INTO_MISSION)
+    parameters = keys_exclude_times
 
     def _build_parsed_values(self):
         """
@@ -756,6 +774,266 @@ class EngineeringScienceRecoveredDataParticle(GliderParticle):
         """
         return self._parsed_values(EngineeringScienceRecoveredDataParticle.keys_exclude_times)
 
+class GliderColumns(object):
+    """
+    Decodes blocks of glider ASCII data rows into columns. The type of each
+    column and which columns are latitudes and longitudes are worked out once
+    from the header, then each block of rows is converted to a 2D float array
+    by numpy in one call. Particles are built from a GliderRow view of their
+    row rather than a dictionary holding every column of the file.
+
+    Only the columns in the projection are converted, the other columns of a
+    row are checked for their count and otherwise ignored.
+    """
+    def __init__(self, labels, num_of_bytes, num_columns, string_to_ddegrees, projection=None):
+        """
+        @param labels The column labels from the header
+        @param num_of_bytes The number of bytes of each column from the header
+        @param num_columns The number of columns in each data row
+        @param string_to_ddegrees Function converting a lat/lon string to decimal degrees
+        @param projection The labels of the columns to decode, None to decode all columns
+        """
+        self.num_columns = num_columns
+        labels = labels[:num_columns]
+        if projection is None:
+            columns = range(len(labels))
+        else:
+            projection = set(projection)
+            columns = [ii for ii, label in enumerate(labels) if label in projection]
+
+        # columns are indexed by their position in the projection from here on
+        self.labels = [labels[ii] for ii in columns]
+        self.index = dict((label, ii) for ii, label in enumerate(self.labels))
+        if len(columns) == 1:
+            self._project = lambda data: (data[columns[0]],)
+        elif columns:
+            self._project = itemgetter(*columns)
+        else:
+            self._project = lambda data: ()
+        # 1 and 2 byte columns are integers, everything else is a float
+        self.int_columns = frozenset(ii for ii, column in enumerate(columns)
+                                     if column < len(num_of_bytes) and num_of_bytes[column] in (1, 2))
+        self._int_column_list = sorted(self.int_columns)
+        self._latlon_columns = [ii for ii, label in enumerate(self.labels)
+                                if '_lat' in label or '_lon' in label]
+        self._string_to_ddegrees = string_to_ddegrees
+        self._plans = {}
+        self._parameter_columns = {}
+
+    def decode(self, records):
+        """
+        Decode a list of data records.
+        @param records The data record strings, one row each
+        @retval A list with an entry for each record, a GliderRow, the
+            SampleException for a record that can't be decoded, or None for a
+            record numpy could not convert, which must be read one value at a
+            time
+        """
+        results = [None] * len(records)
+        rows = []
+        row_records = []
+
+        for ii, record in enumerate(records):
+            data = record.split()
+            if len(data) == self.num_columns:
+                rows.append(self._project(data))
+                row_records.append(ii)
+            else:
+                log.error("Num Of Columns NOT EQUAL to Num of Data items: "
+                          "Expected Columns= %s vs Actual Data= %s", self.num_columns, len(data))
+                results[ii] = SampleException('Glider data file does not have the ' +
+                                              'same number of columns as described ' +
+                                              'in the header.\n' +
+                                              'Described: %d, Actual: %d' %
+                                              (self.num_columns, len(data)))
+
+        if not rows:
+            return results
+
+        try:
+            array = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.labels))
+        except ValueError:
+            # a value in the block is not a number, only convert the rows that are
+            array = np.empty((len(rows), len(self.labels)))
+            for rr, data in enumerate(rows):
+                try:
+                    array[rr] = np.array(data, dtype=np.float64)
+                except ValueError:
+                    row_records[rr] = None
+
+        if self._int_column_list:
+            # integer columns holding fractions can't be converted to int, leave them to
+            # be read one value at a time
+            ints = array[:, self._int_column_list]
+            for rr in np.nonzero((ints != np.floor(ints)) & ~np.isnan(ints))[0]:
+                row_records[rr] = None
+
+        block = GliderBlock(self, array)
+
+        # NaN positions stay NaN, only the rest need converting to decimal degrees
+        latlon_rows = dict((column, np.nonzero(~np.isnan(array[:, column]))[0])
+                           for column in self._latlon_columns)
+
+        for rr, ii in enumerate(row_records):
+            if ii is None:
+                continue
+            results[ii] = GliderRow(block, rr)
+
+        for column in self._latlon_columns:
+            for rr in latlon_rows[column]:
+                ii = row_records[rr]
+                if ii is None or not isinstance(results[ii], GliderRow):
+                    continue
+                try:
+                    array[rr, column] = self._string_to_ddegrees(rows[rr][column])
+                except SampleException as e:
+                    results[ii] = e
+
+        return results
+
+    def plan(self, key_list):
+        """
+        Get the columns in this file holding the parameters in a particle key list
+        @param key_list The particle key list
+        @retval A list of (key, column index, is integer) in key list order
+        """
+        key_list = tuple(key_list)
+        plan = self._plans.get(key_list)
+        if plan is None:
+            plan = [(key, self.index[key], self.index[key] in self.int_columns)
+                    for key in key_list if key in self.index]
+            self._plans[key_list] = plan
+        return plan
+
+    def parameter_columns(self, parameters):
+        """
+        Get the indices of the columns holding a list of parameters
+        @param parameters The parameter names, as a tuple
+        @retval A numpy array of column indices
+        """
+        columns = self._parameter_columns.get(parameters)
+        if columns is None:
+            columns = np.array(sorted(set(self.index[key] for key in parameters if key in self.index)),
+                               dtype=np.intp)
+            self._parameter_columns[parameters] = columns
+        return columns
+
+
+class GliderBlock(object):
+    """
+    A block of decoded glider data rows, one row per record, with lat/lon
+    columns in decimal degrees and NaN for missing values.
+    """
+    def __init__(self, columns, array):
+        self.columns = columns
+        self.array = array
+        self._has_data = {}
+
+    def has_data(self, row, parameters):
+        """
+        Check if a row has a value that is not NaN for any of the parameters
+        @param row The row index in the block
+        @param parameters The parameter list
+        """
+        parameters = tuple(parameters)
+        mask = self._has_data.get(parameters)
+        if mask is None:
+            columns = self.columns.parameter_columns(parameters)
+            if len(columns):
+                mask = ~np.isnan(self.array[:, columns]).all(axis=1)
+            else:
+                mask = np.zeros(len(self.array), dtype=bool)
+            self._has_data[parameters] = mask
+        return bool(mask[row])
+
+
+class GliderRow(object):
+    """
+    One decoded row of a glider data file. Reads like the data dictionary
+    built by GliderParser._read_data, row[label]['Data'] is the value in a
+    column, but values are only converted to python types when asked for.
+    """
+    __slots__ = ('_block', '_row', '_values')
+
+    def __init__(self, block, row):
+        self._block = block
+        self._row = row
+        self._values = None
+
+    def _get_values(self):
+        if self._values is None:
+            self._values = self._block.array[self._row].tolist()
+        return self._values
+
+    def value(self, key):
+        """
+        @param key The column label
+        @retval The value in the column, an int for integer columns, NaN if missing
+        @throws KeyError if there is no such column
+        """
+        ii = self._block.columns.index[key]
+        value = self._get_values()[ii]
+        if ii in self._block.columns.int_columns and value == value:
+            value = int(value)
+        return value
+
+    def has_data(self, parameters):
+        """
+        @param parameters A particle's parameter list
+        @retval True if this row has a value that is not NaN for any of the parameters
+        """
+        return self._block.has_data(self._row, parameters)
+
+    def parsed_values(self, key_list):
+        """
+        Build particle values for the keys in key_list found in this row, with
+        NaN values as None
+        @param key_list The particle key list
+        @retval A list of value dictionaries as returned by _build_parsed_values
+        """
+        values = self._get_values()
+        result = []
+        for (key, ii, is_int) in self._block.columns.plan(key_list):
+            value = values[ii]
+            if value != value:
+                value = None
+            elif is_int:
+                value = int(value)
+            result.append({DataParticleKey.VALUE_ID: key,
+                           DataParticleKey.VALUE: value})
+        return result
+
+    def keys(self):
+        return list(self._block.columns.labels)
+
+    def to_dict(self):
+        """
+        @retval The row as the data dictionary GliderParser._read_data builds
+        """
+        return dict((key, self[key]) for key in self._block.columns.index)
+
+    def __contains__(self, key):
+        return key in self._block.columns.index
+
+    def __getitem__(self, key):
+        return {'Name': key, 'Data': self.value(key)}
+
+    def __eq__(self, other):
+        if isinstance(other, GliderRow):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "GliderRow(%r)" % self.to_dict()
+
+    def __reduce__(self):
+        # pickled as the data dictionary, rather than the whole decoded block
+        return (dict, (self.to_dict(),))
+
+
 class GliderParser(BufferLoadingParser):
     """
     GliderParser parses a Slocum Electric Glider data file that has been
@@ -763,6 +1041,8 @@ class GliderParser(BufferLoadingParser):
     science data file, and holds the self describing header data in a header
     dictionary and the data in a data dictionary using the column labels as the
     dictionary keys. These dictionaries are used to build the particles.
+    Data rows are decoded a block at a time by GliderColumns, and the
+    particles read their values from GliderRow views of the decoded block.
     """
     def __init__(self,
                  config,
@@ -781,23 +1061,60 @@ class GliderParser(BufferLoadingParser):
         # specific to the gliders with ascii data, parse the header rows of the input file
         self._read_header()
 
-        # regex for first order parsing of input data from the chunker
-        record_regex = re.compile(r'.*\n')
+        # regex for first order parsing of input data from the chunker, anchored to
+        # the start of a line so a partial row of a wide file is only scanned once
+        record_regex = re.compile(r'^.*\n', re.MULTILINE)
         self._whitespace_regex = re.compile(r'\s*$')
 
         super(GliderParser, self).__init__(config,
                                            self._stream_handle,
                                            state,
-                                           partial(StringChunker.regex_sieve_function,
-                                                   regex_list=[record_regex]),
+                                           IncrementalSieve(partial(StringChunker.regex_sieve_function,
+                                                                    regex_list=[record_regex])),
                                            state_callback,
                                            publish_callback,
                                            exception_callback,
                                            *args,
                                            **kwargs)
+
+        # only decode the columns the particles from this parser are built from
+        self._columns = GliderColumns(self._header_dict['labels'],
+                                      self._header_dict['num_of_bytes'],
+                                      self._header_dict.get('sensors_per_cycle', 0),
+                                      self._string_to_ddegrees,
+                                      self._column_projection())
         if state:
             self.set_state(state)
 
+    def _row_particle_classes(self):
+        """
+        @retval The particle classes built from data rows by this parser
+        """
+        particle_class = getattr(self, '_particle_class', None)
+        if particle_class is None:
+            return []
+        return [particle_class]
+
+    def _column_projection(self):
+        """
+        Get the labels of the columns needed to build particles and timestamps
+        @retval A list of column labels, or None if every column is needed
+        """
+        particle_classes = self._row_particle_classes()
+        if not particle_classes:
+            return None
+
+        projection = [GliderParticleKey.M_PRESENT_TIME]
+        for particle_class in particle_classes:
+            parameters = getattr(particle_class, 'parameters', None)
+            if parameters is None:
+                return None
+            projection.extend(parameters)
+            projection.extend(particle_class.science_parameters)
+
+        log.debug("Decoding %d of %d glider columns", len(set(projection)), len(self._header_dict['labels']))
+        return projection
+
     def _read_header(self):
         """
         Read the header for a glider file.
@@ -995,11 +1312,59 @@ class GliderParser(BufferLoadingParser):
 
         return data_dict
 
-    def get_block(self, size=1024):
+    def _read_records(self):
+        """
+        Take all the records out of the chunker, decoding the data records
+        together as one block.
+        @retval A list of [non_data, non_start, non_end, start, data_record,
+            end, row] in file order, ending with an entry whose data_record is
+            None. row is the decoded data record from GliderColumns.decode.
+        """
+        entries = []
+        data_entries = []
+
+        while True:
+            # collect the non-data from the file
+            (nd_timestamp, non_data, non_start, non_end) = self._chunker.get_next_non_data_with_index(clean=False)
+            # collect the data from the file
+            (chunker_timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
+
+            entry = [non_data, non_start, non_end, start, data_record, end, None]
+            entries.append(entry)
+            if data_record is None:
+                break
+            if not self._whitespace_regex.match(data_record):
+                data_entries.append(entry)
+
+        if data_entries:
+            rows = self._columns.decode([entry[4] for entry in data_entries])
+            for (entry, row) in zip(data_entries, rows):
+                entry[6] = row
+
+        return entries
+
+    def _get_data_dict(self, data_record, row):
+        """
+        Get the data for a record decoded by _read_records
+        @param data_record The data record string
+        @param row The decoded record
+        @retval A GliderRow, or a data dictionary for rows that could not be
+            decoded as a block
+        @throws SampleException if the record can't be parsed
+        """
+        if row is None:
+            return self._read_data(data_record)
+        if isinstance(row, SampleException):
+            raise row
+        return row
+
+    def get_block(self, size=None):
         """
         Need to overload the base class behavior so we can get the last
         record if it doesn't end with a newline it would be ignored.
         """
+        if size is None:
+            size = self._block_size
         len = super(GliderParser, self).get_block(size)
         log.debug("Buffer read bytes: %d", len)
 
@@ -1018,14 +1383,13 @@ class GliderParser(BufferLoadingParser):
         # set defaults
         result_particles = []
 
-        # collect the non-data from the file
-        (nd_timestamp, non_data, non_start, non_end) = self._chunker.get_next_non_data_with_index(clean=False)
-        # collect the data from the file
-        (chunker_timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
+        for (non_data, non_start, non_end, start, data_record, end, row) in self._read_records():
 
-        self.handle_non_data(non_data, non_start, non_end, start)
+            self.handle_non_data(non_data, non_start, non_end, start)
+
+            if data_record is None:
+                break
 
-        while data_record is not None:
             log.debug("data record: %s", data_record)
 
             if self._whitespace_regex.match(data_record):
@@ -1041,7 +1405,7 @@ class GliderParser(BufferLoadingParser):
                 try:
                     # create the dictionary of key/value pairs composed of the labels and the values from the
                     # record being parsed
-                    data_dict = self._read_data(data_record)
+                    data_dict = self._get_data_dict(data_record, row)
 
                 except SampleException as e:
                     exception_detected = True
@@ -1070,13 +1434,6 @@ class GliderParser(BufferLoadingParser):
                     log.debug("No science data found in particle. %s", data_dict)
                     self._increment_state(end)
 
-            # collect the non-data from the file
-            (nd_timestamp, non_data, non_start, non_end) = self._chunker.get_next_non_data_with_index(clean=False)
-            # collect the data from the file
-            (chunker_timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
-
-            self.handle_non_data(non_data, non_start, non_end, start)
-
         # publish the results
         return result_particles
 
@@ -1101,6 +1458,9 @@ class GliderParser(BufferLoadingParser):
         Examine the data_dict to see if it contains science data.
         """
         log.debug("Looking for data in science parameters: %s", self._particle_class.science_parameters)
+        if isinstance(data_dict, GliderRow):
+            return data_dict.has_data(self._particle_class.science_parameters)
+
         for key in data_dict.keys():
             if key in self._particle_class.science_parameters:
                 value = data_dict[key]['Data']
@@ -1179,6 +1539,12 @@ class GliderEngineeringParser(GliderParser):
         if not state:
             self._read_state[StateKey.SENT_METADATA] = False
 
+    def _row_particle_classes(self):
+        """
+        @retval The particle classes built from data rows by this parser
+        """
+        return [EngineeringTelemeteredDataParticle, EngineeringScienceTelemeteredDataParticle]
+
     def set_state(self, state_obj):
         """
         Set the value of the state object for this parser @param state_obj The
@@ -1228,14 +1594,13 @@ class GliderEngineeringParser(GliderParser):
                     "Unable to parse timestamp from file open time %s , not returning metadata particle" % \
                     data_dict['glider_eng_fileopen_time']['Data']))
 
-        # collect the non-data from the file
-        (nd_timestamp, non_data, none_start, none_end) = self._chunker.get_next_non_data_with_index(clean=False)
-        # collect the data from the file
-        (chunker_timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
+        for (non_data, none_start, none_end, start, data_record, end, row) in self._read_records():
+
+            self.handle_non_data(non_data, none_start, none_end, start)
 
-        self.handle_non_data(non_data, none_start, none_end, start)
+            if data_record is None:
+                break
 
-        while data_record is not None:
             log.debug("data record: %s", data_record)
 
             if self._whitespace_regex.match(data_record):
@@ -1251,7 +1616,7 @@ class GliderEngineeringParser(GliderParser):
                 try:
                     # create the dictionary of key/value pairs composed of the labels and the values from the
                     # record being parsed
-                    data_dict = self._read_data(data_record)
+                    data_dict = self._get_data_dict(data_record, row)
                 except SampleException as e:
                     exception_detected = True
                     self._exception_callback(e)
@@ -1298,13 +1663,6 @@ class GliderEngineeringParser(GliderParser):
                     log.debug("No particle data found in particle. %s", data_dict)
                     self._increment_state(end)
 
-            # collect the non-data from the file
-            (nd_timestamp, non_data, none_start, none_end) = self._chunker.get_next_non_data_with_index(clean=False)
-            # collect the data from the file
-            (chunker_timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
-
-            self.handle_non_data(non_data, none_start, none_end, start)
-
         # publish the results
         return result_particles
 
@@ -1357,6 +1715,8 @@ class GliderEngineeringParser(GliderParser):
         """
         Examine the data_dict to see if it contains data from the engineering telemetered particle being worked on
         """
+        if isinstance(data_dict, GliderRow):
+            return data_dict.has_data(particle_class.science_parameters)
 
         for key in data_dict.keys():
 
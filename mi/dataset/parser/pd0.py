@@ -0,0 +1,170 @@
+"""
+@package mi.dataset.parser.pd0
+@file marine-integrations/mi/dataset/parser/pd0.py
+@author agent
+@brief Decode the data types of Teledyne RDI PD0 formatted ensembles
+
+Release notes:
+    Each data type in a PD0 ensemble is described here by a numpy structured
+    dtype, so a leader decodes in one frombuffer call and the depth cell
+    arrays decode in one call per data type, with no python work per cell.
+    Decoded values are returned as python types, so they can be used
+    directly as particle values.
+
+    All binary data produced by Teledyne RDI ADCPs is little-endian, numpy
+    dtypes are packed, so these dtypes match the byte layout in the manuals.
+"""
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import numpy as np
+
+from mi.core.exceptions import SampleException
+
+# data type IDs, found in the first two bytes of each data type
+FIXED_LEADER_ID = 0
+VARIABLE_LEADER_ID = 128
+VELOCITY_ID = 256
+CORRELATION_MAGNITUDE_ID = 512
+ECHO_INTENSITY_ID = 768
+PERCENT_GOOD_ID = 1024
+BOTTOM_TRACK_ID = 1536
+
+HEADER = np.dtype([
+    ('header_id', 'u1'), ('data_source_id', 'u1'), ('num_bytes', '<u2'),
+    ('spare', 'u1'), ('num_data_types', 'u1')])
+
+FIXED_LEADER = np.dtype([
+    ('fixed_leader_id', '<u2'), ('firmware_version', 'u1'), ('firmware_revision', 'u1'),
+    ('sysconfig_frequency', '<u2'), ('data_flag', 'u1'), ('lag_length', 'u1'),
+    ('num_beams', 'u1'), ('num_cells', 'u1'), ('pings_per_ensemble', '<u2'),
+    ('depth_cell_length', '<u2'), ('blank_after_transmit', '<u2'),
+    ('signal_processing_mode', 'u1'), ('low_corr_threshold', 'u1'),
+    ('num_code_repetitions', 'u1'), ('percent_good_min', 'u1'),
+    ('error_vel_threshold', '<u2'), ('time_per_ping_minutes', 'u1'),
+    ('time_per_ping_seconds', 'u1'), ('time_per_ping_hundredths', 'u1'),
+    ('coord_transform_type', 'u1'), ('heading_alignment', '<i2'), ('heading_bias', '<i2'),
+    ('sensor_source', 'u1'), ('sensor_available', 'u1'), ('bin_1_distance', '<u2'),
+    ('transmit_pulse_length', '<u2'), ('reference_layer_start', 'u1'),
+    ('reference_layer_stop', 'u1'), ('false_target_threshold', 'u1'), ('spare1', 'u1'),
+    ('transmit_lag_distance', '<u2'), ('spare2', '<u8'), ('system_bandwidth', '<u2'),
+    ('spare3', 'u1'), ('spare4', 'u1'), ('serial_number', '<u4')])
+
+VARIABLE_LEADER = np.dtype([
+    ('variable_leader_id', '<u2'), ('ensemble_number', '<u2'),
+    ('rtc_year', 'u1'), ('rtc_month', 'u1'), ('rtc_day', 'u1'), ('rtc_hour', 'u1'),
+    ('rtc_minute', 'u1'), ('rtc_second', 'u1'), ('rtc_hundredths', 'u1'),
+    ('ensemble_number_increment', 'u1'), ('error_bit_field', 'u1'),
+    ('reserved_error_bit_field', 'u1'), ('speed_of_sound', '<u2'),
+    ('transducer_depth', '<u2'), ('heading', '<u2'), ('pitch', '<i2'), ('roll', '<i2'),
+    ('salinity', '<u2'), ('temperature', '<i2'), ('mpt_minutes', 'u1'),
+    ('mpt_seconds_component', 'u1'), ('mpt_hundredths_component', 'u1'),
+    ('heading_stdev', 'u1'), ('pitch_stdev', 'u1'), ('roll_stdev', 'u1'),
+    ('adc_transmit_current', 'u1'), ('adc_transmit_voltage', 'u1'),
+    ('adc_ambient_temp', 'u1'), ('adc_pressure_plus', 'u1'), ('adc_pressure_minus', 'u1'),
+    ('adc_attitude_temp', 'u1'), ('adc_attitude', 'u1'), ('adc_contamination_sensor', 'u1'),
+    ('error_status_word_1', 'u1'), ('error_status_word_2', 'u1'),
+    ('error_status_word_3', 'u1'), ('error_status_word_4', 'u1'),
+    ('spare1', '<u2'), ('pressure', '<u4'), ('pressure_variance', '<u4'), ('spare2', '<u4')])
+
+BOTTOM_TRACK = np.dtype([
+    ('bottom_track_id', '<u2'), ('bt_pings_per_ensemble', '<u2'),
+    ('bt_delay_before_reacquire', '<u2'), ('bt_corr_magnitude_min', 'u1'),
+    ('bt_eval_magnitude_min', 'u1'), ('bt_percent_good_min', 'u1'), ('bt_mode', 'u1'),
+    ('bt_error_velocity_max', '<u2'), ('reserved', '<u4'),
+    ('beam1_bt_range_lsb', '<u2'), ('beam2_bt_range_lsb', '<u2'),
+    ('beam3_bt_range_lsb', '<u2'), ('beam4_bt_range_lsb', '<u2'),
+    ('eastward_bt_velocity', '<i2'), ('northward_bt_velocity', '<i2'),
+    ('upward_bt_velocity', '<i2'), ('error_bt_velocity', '<i2'),
+    ('beam1_bt_correlation', 'u1'), ('beam2_bt_correlation', 'u1'),
+    ('beam3_bt_correlation', 'u1'), ('beam4_bt_correlation', 'u1'),
+    ('beam1_eval_amp', 'u1'), ('beam2_eval_amp', 'u1'),
+    ('beam3_eval_amp', 'u1'), ('beam4_eval_amp', 'u1'),
+    ('beam1_bt_percent_good', 'u1'), ('beam2_bt_percent_good', 'u1'),
+    ('beam3_bt_percent_good', 'u1'), ('beam4_bt_percent_good', 'u1'),
+    ('ref_layer_min', '<u2'), ('ref_layer_near', '<u2'), ('ref_layer_far', '<u2'),
+    ('beam1_ref_layer_velocity', '<i2'), ('beam2_ref_layer_velocity', '<i2'),
+    ('beam3_ref_layer_velocity', '<i2'), ('beam4_ref_layer_velocity', '<i2'),
+    ('beam1_ref_correlation', 'u1'), ('beam2_ref_correlation', 'u1'),
+    ('beam3_ref_correlation', 'u1'), ('beam4_ref_correlation', 'u1'),
+    ('beam1_ref_intensity', 'u1'), ('beam2_ref_intensity', 'u1'),
+    ('beam3_ref_intensity', 'u1'), ('beam4_ref_intensity', 'u1'),
+    ('beam1_ref_percent_good', 'u1'), ('beam2_ref_percent_good', 'u1'),
+    ('beam3_ref_percent_good', 'u1'), ('beam4_ref_percent_good', 'u1'),
+    ('bt_max_depth', '<u2'), ('beam1_rssi_amplitude', 'u1'), ('beam2_rssi_amplitude', 'u1'),
+    ('beam3_rssi_amplitude', 'u1'), ('beam4_rssi_amplitude', 'u1'), ('bt_gain', 'u1'),
+    ('beam1_bt_range_msb', 'u1'), ('beam2_bt_range_msb', 'u1'),
+    ('beam3_bt_range_msb', 'u1'), ('beam4_bt_range_msb', 'u1')])
+
+# one depth cell of each of the per cell data types, one value per beam
+VELOCITY_CELL = np.dtype('(4,)<i2')
+BEAM_CELL = np.dtype('(4,)u1')
+
+DATA_TYPE_ID = np.dtype('<u2')
+CHECKSUM = np.dtype('<u2')
+
+
+def checksum(data, length):
+    """
+    Calculate the checksum of an ensemble, the sum of its bytes modulo 65536
+    @param data The ensemble, starting with the header
+    @param length The number of bytes covered by the checksum
+    @retval The checksum
+    @throws SampleException if the ensemble is shorter than length
+    """
+    if len(data) < length:
+        raise SampleException("Ensemble of %d bytes is shorter than its length %d" % (len(data), length))
+    return int(np.frombuffer(data, np.uint8, length).sum(dtype=np.uint64)) & 65535
+
+
+def read_data_type_id(data, offset=0):
+    """
+    @param data The ensemble
+    @param offset The offset of a data type in the ensemble
+    @retval The ID of the data type at the offset
+    """
+    return read_record(data, DATA_TYPE_ID, offset)
+
+
+def read_offsets(data, num_data_types):
+    """
+    @param data The ensemble
+    @param num_data_types The number of data types from the header
+    @retval A list of the offsets of the data types, which follow the header
+    """
+    if len(data) < HEADER.itemsize + 2 * num_data_types:
+        raise SampleException("Ensemble is too short for %d data types" % num_data_types)
+    return np.frombuffer(data, DATA_TYPE_ID, num_data_types, HEADER.itemsize).tolist()
+
+
+def read_record(data, dtype, offset=0):
+    """
+    Decode a leader or other fixed size data type
+    @param data The bytes to read from
+    @param dtype The dtype of the data type
+    @param offset The offset of the data type in data
+    @retval The value, or a tuple of the values for a structured dtype
+    @throws SampleException if data is too short for the data type
+    """
+    if len(data) < offset + dtype.itemsize:
+        raise SampleException("%d bytes at %d are too short for a %d byte record" %
+                              (len(data) - offset, offset, dtype.itemsize))
+    value = np.frombuffer(data, dtype, 1, offset)[0].item()
+    if isinstance(value, tuple):
+        # numpy gives longs for unsigned 32 bit values, struct gives ints
+        return tuple([int(v) if isinstance(v, long) else v for v in value])
+    return value
+
+
+def read_cells(chunk, dtype):
+    """
+    Decode a per cell data type, the data type ID followed by a value per
+    beam for each depth cell. A chunk cut short at the end of an ensemble
+    gives the cells that are complete.
+    @param chunk The data type, starting with its ID
+    @param dtype The dtype of one depth cell
+    @retval A list of the values of each beam, with one value per depth cell
+    """
+    num_cells = max(len(chunk) - DATA_TYPE_ID.itemsize, 0) // dtype.itemsize
+    cells = np.frombuffer(chunk, dtype.base, num_cells * dtype.shape[0], DATA_TYPE_ID.itemsize)
+    return cells.reshape(num_cells, dtype.shape[0]).T.tolist()
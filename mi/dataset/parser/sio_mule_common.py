@@ -11,16 +11,22 @@ sio which contain the common sio header.
 __author__ = 'Emily Hahn'
 __license__ = 'Apache 2.0'
 
+import os
 import re
-import struct
+import json
+import bisect
+import binascii
 import gevent
 import time
 import ntplib
+from collections import OrderedDict
+from threading import Lock
 
 from mi.core.common import BaseEnum
 from mi.core.log import get_logger; log = get_logger()
 from mi.core.exceptions import DatasetParserException, NotImplementedException
 from mi.dataset.dataset_parser import Parser
+from mi.dataset.fingerprint import prefix_crc32
 
 # SIO Main controller header and data for ctdmo in binary
 # groups: ID, Number of Data Bytes, POSIX timestamp, block number, data
@@ -30,6 +36,10 @@ SIO_HEADER_REGEX = b'\x01(CT|AD|FL|DO|PH|PS|CS|WA|WC|WE|CO|PS|CS)[0-9]{7}_([0-9A
                '([0-9A-Fa-f]{8})_([0-9A-Fa-f]{2})_([0-9A-Fa-f]{4})\x02'
 SIO_HEADER_MATCHER = re.compile(SIO_HEADER_REGEX)
 
+# each byte value with its bits in reverse order, used to compute the SIO checksum
+REFLECTED_BYTE_VALUES = [int('{0:08b}'.format(byte)[::-1], 2) for byte in range(256)]
+REFLECTED_BYTES = ''.join(chr(byte) for byte in REFLECTED_BYTE_VALUES)
+
 # blocks can be uniquely identified a combination of block number and timestamp,
 # since block numbers roll over after 255
 # each block may contain multiple data samples
@@ -39,12 +49,23 @@ class StateKey(BaseEnum):
         # the number of samples in that packet, how many packets have been pulled out currently
         # being processed
 
+class SioMuleConfigKey(BaseEnum):
+    # directory to keep SIO header indexes of mule files in between runs, if not
+    # set indexes are only kept in memory
+    HEADER_INDEX_DIRECTORY = "header_index_directory"
+
 # constants for accessing unprocessed and in process data
 START_IDX = 0
 END_IDX = 1
 SAMPLES_PARSED = 2
 SAMPLES_RETURNED = 3
 
+# bytes read at a time from a mule file
+READ_BLOCK_SIZE = 1024
+# length of an SIO header matched by SIO_HEADER_MATCHER
+SIO_HEADER_SIZE = 33
+INFINITY = float('inf')
+
 class SioMuleParser(Parser):
 
     def __init__(self, config, stream_handle, state, sieve_fn,
@@ -78,6 +99,7 @@ class SioMuleParser(Parser):
         self._record_buffer = [] # holds list of records
         self._recovered_flag = recovered_flag
         self.all_data = None
+        self._header_index = None
         self._chunk_sample_count = []
         self._samples_to_throw_out = None
         self._mid_sample_packets = 0
@@ -97,6 +119,19 @@ class SioMuleParser(Parser):
         @retval list of matched start,end index found in raw_data
         """
         return_list = []
+        section_start = self._position[START_IDX]
+        # look up in process packets in a set rather than scanning the list for each packet
+        in_process = set((packet[START_IDX], packet[END_IDX])
+                         for packet in self._read_state[StateKey.IN_PROCESS_DATA])
+
+        if self._is_indexed(raw_data):
+            # the packets in this section of the file are already known
+            for (start, end) in self._header_index.packets(section_start, section_start + len(raw_data)):
+                start -= section_start
+                end -= section_start
+                self._add_in_process(in_process, start, end)
+                return_list.append((start, end))
+            return return_list
 
         for match in SIO_HEADER_MATCHER.finditer(raw_data):
             data_len = int(match.group(2), 16)
@@ -113,10 +148,7 @@ class SioMuleParser(Parser):
                     if chksum == checksum:
                         # even if this is not the right instrument, keep track that
                         # this packet was processed
-                        if not self.packet_exists(match.start(0), end_packet_idx+1):
-                            self._read_state[StateKey.IN_PROCESS_DATA].append([match.start(0),
-                                                                               end_packet_idx+1,
-                                                                               None, 0])
+                        self._add_in_process(in_process, match.start(0), end_packet_idx+1)
                         return_list.append((match.start(0), end_packet_idx+1))
                     else:
                         log.debug("Calculated checksum %s != received checksum %s for header %s and packet %d to %d",
@@ -126,39 +158,49 @@ class SioMuleParser(Parser):
                               end_packet_idx, match.group(0)[1:32])
         return return_list
 
+    def _is_indexed(self, raw_data):
+        """
+        Check if the header index can be used to sieve raw data, which must be
+        the section of the file starting at the current position
+        """
+        if self._header_index is None:
+            return False
+        section_start = self._position[START_IDX]
+        return self.all_data[section_start:section_start + len(raw_data)] == raw_data
+
     @staticmethod
     def calc_checksum(data):
         """
-        Calculate SIO header checksum of data
+        Calculate SIO header checksum of data, a CRC-16 with the reflected
+        0x8408 polynomial, 0xFFFF initial value and the result inverted.
+        The bit reflected form of this CRC is the CCITT CRC binascii.crc_hqx
+        computes, so the bytes are reflected through a translate table and
+        the CRC is computed in C rather than a bit at a time.
+        @param data The packet data string
+        @retval The checksum as 4 upper case hex digits
         """
-        crc = 65535
         if len(data) == 0:
             return '0000'
-        for iData in range(0,len(data)):
-            short = struct.unpack('H', data[iData] + '\x00')
-            point = 255 & short[0]
-            crc = crc ^ point
-            for i in range(7, -1, -1):
-                if crc & 1:
-                    crc = (crc >> 1) ^ 33800
-                else:
-                    crc >>= 1
-        crc = ~crc
-        # convert to unsigned
-        if crc < 0:
-            crc += 65536
-        # get rid of the '0x' from the hex string
-        crc = "%s" % hex(crc)[2:].upper()
-        # make sure we have the right format for comparing, must be 4 hex digits
-        if len(crc) == 3:
-            crc = '0' + crc
-        elif len(crc) == 2:
-            crc = '00' + crc
-        elif len(crc) == 1:
-            crc = '000' + crc
+        crc = binascii.crc_hqx(data.translate(REFLECTED_BYTES), 0xFFFF)
+        crc = ~((REFLECTED_BYTE_VALUES[crc & 0xFF] << 8) | REFLECTED_BYTE_VALUES[crc >> 8]) & 0xFFFF
+        crc = '%04X' % crc
         log.trace("calculated checksum %s", crc)
         return crc
 
+    def _add_in_process(self, in_process, start, end):
+        """
+        Add a packet found by the sieve to the in process data if it is not already there
+        @param in_process A set of the (start, end) of packets already in process
+        @param start The start of the packet in the current section
+        @param end The end of the packet in the current section
+        """
+        key = (start + self._position[START_IDX], end + self._position[START_IDX])
+        if key in in_process:
+            log.trace('Already added packet %s', key)
+            return
+        in_process.add(key)
+        self._read_state[StateKey.IN_PROCESS_DATA].append([start, end, None, 0])
+
     def packet_exists(self, start, end):
         """
         Determine if this packet is already in the in process data
@@ -196,6 +238,8 @@ class SioMuleParser(Parser):
         self._record_buffer = []
         self._state = state_obj
         self._read_state = state_obj
+        if state_obj[StateKey.UNPROCESSED_DATA] is not None:
+            state_obj[StateKey.UNPROCESSED_DATA] = IntervalSet(state_obj[StateKey.UNPROCESSED_DATA])
 
         # it is possible to be in the middle of processing a packet.  Since we have to
         # process a whole packet, which may contain multiple samples, we have to
@@ -233,36 +277,35 @@ class SioMuleParser(Parser):
                 self._read_state[StateKey.IN_PROCESS_DATA][packet_idx][START_IDX] += self._position[START_IDX]
                 self._read_state[StateKey.IN_PROCESS_DATA][packet_idx][END_IDX] += self._position[START_IDX]
 
-        n_removed = 0
         # need to adjust position to be relative to the entire file, not just the
         # currently read section, so add the initial position to the in process packets
         log.debug('records to be returned %d', returned_records)
         total_remain = returned_records
         adj_packets = []
-        for packet_idx in range(0, len(self._read_state[StateKey.IN_PROCESS_DATA])):
-            adj_packet_idx = packet_idx - n_removed
-            this_packet = self._read_state[StateKey.IN_PROCESS_DATA][adj_packet_idx]
+        # packets still in process, built up rather than popping finished packets
+        # out of the middle of the list
+        in_process = []
+        for this_packet in self._read_state[StateKey.IN_PROCESS_DATA]:
             if this_packet[SAMPLES_PARSED] > 0:
                 # this packet has data samples in it
                 this_packet_remain = this_packet[SAMPLES_PARSED] - this_packet[SAMPLES_RETURNED]
                 # increase the number of samples that have been pulled out
-                self._read_state[StateKey.IN_PROCESS_DATA][adj_packet_idx][SAMPLES_RETURNED] += total_remain
+                this_packet[SAMPLES_RETURNED] += total_remain
                 # find out if packet is done, if so remove it
                 if this_packet[SAMPLES_RETURNED] >= this_packet[SAMPLES_PARSED]:
                     # this packet has had all the samples pulled out from it, remove it from in process
                     adj_packets.append([this_packet[START_IDX], this_packet[END_IDX]])
-                    self._read_state[StateKey.IN_PROCESS_DATA].pop(adj_packet_idx)
-                    n_removed += 1
-                elif this_packet[SAMPLES_RETURNED] < 0:
-                    self._read_state[StateKey.IN_PROCESS_DATA][adj_packet_idx][SAMPLES_RETURNED] = 0
+                else:
+                    if this_packet[SAMPLES_RETURNED] < 0:
+                        this_packet[SAMPLES_RETURNED] = 0
+                    in_process.append(this_packet)
 
                 total_remain -= this_packet_remain
 
             else:
                 # this packet has no samples, no need to process further
                 adj_packets.append([this_packet[START_IDX], this_packet[END_IDX]])
-                self._read_state[StateKey.IN_PROCESS_DATA].pop(adj_packet_idx)
-                n_removed += 1
+        self._read_state[StateKey.IN_PROCESS_DATA][:] = in_process
 
         if len(adj_packets) > 0 and self._read_state[StateKey.IN_PROCESS_DATA] == []:
             # this is the last of the in process data, now process unprocessed data, so
@@ -276,24 +319,10 @@ class SioMuleParser(Parser):
 
         # first combine the in process data packet indicies
         combined_packets = self._combine_adjacent_packets(adj_packets)
-        # loop over combined packets and remove them from unprocessed data
+        # remove the combined packets from the unprocessed section they are in,
+        # leaving any data still unprocessed on either side
         for packet in combined_packets:
-            # find which unprocessed section this packet is in
-            for unproc in self._read_state[StateKey.UNPROCESSED_DATA]:
-                if packet[START_IDX] >= unproc[START_IDX] and packet[END_IDX] <= unproc[END_IDX]:
-                    # packet is within this unprocessed data, remove it
-                    self._read_state[StateKey.UNPROCESSED_DATA].remove(unproc)
-                    # add back any data still unprocessed on either side
-                    if packet[START_IDX] > unproc[START_IDX]:
-                        self._read_state[StateKey.UNPROCESSED_DATA].append([unproc[START_IDX], packet[START_IDX]])
-                    if packet[END_IDX] < unproc[END_IDX]:
-                        self._read_state[StateKey.UNPROCESSED_DATA].append([packet[END_IDX], unproc[END_IDX]])
-                    # once we have found which unprocessed section this packet is in,
-                    # move on to next packet
-                    break
-            self._read_state[StateKey.UNPROCESSED_DATA] = sorted(self._read_state[StateKey.UNPROCESSED_DATA])
-            self._read_state[StateKey.UNPROCESSED_DATA] = self._combine_adjacent_packets(
-                self._read_state[StateKey.UNPROCESSED_DATA])
+            self._read_state[StateKey.UNPROCESSED_DATA].subtract(packet[START_IDX], packet[END_IDX])
 
     def _combine_adjacent_packets(self, packets):
         """
@@ -327,26 +356,30 @@ class SioMuleParser(Parser):
             # need to read in the entire data file first and store it because escape sequences shift position of
             # in process and unprocessed blocks
             log.debug("Reading in all data in smaller blocks")
-            self.all_data = ''
+            blocks = []
 
             eof = False
             while not eof:
                 # read data in small blocks in order to not block processing
-                next_data = self._stream_handle.read(1024)
+                next_data = self._stream_handle.read(READ_BLOCK_SIZE)
                 if next_data:
                     if not self._recovered_flag:
                         # if this is telemetered, need to replace escape chars, recovered does not
                         next_data = next_data.replace(b'\x18\x6b', b'\x2b')
                         next_data = next_data.replace(b'\x18\x58', b'\x18')
-                    self.all_data = self.all_data + next_data
+                    blocks.append(next_data)
                     gevent.sleep(0)
                 else:
                     eof = True
+            self.all_data = ''.join(blocks)
             log.debug("length of all data %d", len(self.all_data))
 
+            self._header_index = get_header_index(self._stream_handle, self.all_data, self._recovered_flag,
+                                                  self._config.get(SioMuleConfigKey.HEADER_INDEX_DIRECTORY))
+
         # if unprocessed data has not been initialized yet, set it to the entire file
         if self._read_state[StateKey.UNPROCESSED_DATA] == None:
-            self._read_state[StateKey.UNPROCESSED_DATA] = [[0, len(self.all_data)]]
+            self._read_state[StateKey.UNPROCESSED_DATA] = IntervalSet([[0, len(self.all_data)]])
 
         while len(self._record_buffer) < num_records:
             # read unprocessed data packet from the file, starting with in process data
@@ -446,10 +479,13 @@ class SioMuleParser(Parser):
         @retval The next unprocessed data packet, or [] if no more unprocessed data
         """
         # see if there is more unprocessed data at a later file position (don't go backwards)
-        next_idx = 0
         log.trace('Getting next unprocessed from %s, last position %d', unproc, self._position[END_IDX])
-        while len(unproc) > next_idx and unproc[next_idx][END_IDX] <= self._position[END_IDX]:
-            next_idx = next_idx + 1
+        if isinstance(unproc, IntervalSet):
+            next_idx = unproc.index_after(self._position[END_IDX])
+        else:
+            next_idx = 0
+            while len(unproc) > next_idx and unproc[next_idx][END_IDX] <= self._position[END_IDX]:
+                next_idx = next_idx + 1
 
         if len(unproc) > next_idx:
             data = self.all_data[unproc[next_idx][START_IDX]:unproc[next_idx][END_IDX]]
@@ -501,3 +537,234 @@ class SioMuleParser(Parser):
         """            
         raise NotImplementedException("Must write parse_chunks()!")
 
+
+
+class IntervalSet(list):
+    """
+    Sorted, non overlapping [start, end] sections of a file, used to hold the
+    unprocessed data state.  This is a list of [start, end] lists, the same
+    as the state has always held, but sections are found by binary search
+    instead of scanning and sorting the list, and adjacent sections are joined
+    as they are added and removed.  The [start, end] lists are replaced rather
+    than changed, so they can be shared with the parser position.
+    """
+
+    def find(self, position):
+        """
+        @param position A position in the file
+        @retval The index of the last section starting at or before position, -1 if none do
+        """
+        return bisect.bisect_right(self, [position, INFINITY]) - 1
+
+    def index_after(self, position):
+        """
+        @param position A position in the file
+        @retval The index of the first section ending after position, or the
+            length of the set if none do
+        """
+        idx = self.find(position)
+        if idx >= 0 and self[idx][END_IDX] > position:
+            return idx
+        return idx + 1
+
+    def add(self, start, end):
+        """
+        Add a section, joining it with any sections it overlaps or touches
+        @param start The start of the section
+        @param end The end of the section
+        """
+        if end <= start:
+            return
+        first = self.find(start)
+        if first < 0 or self[first][END_IDX] < start:
+            first += 1
+        last = self.find(end)
+        if first > last:
+            self.insert(first, [start, end])
+        else:
+            self[first:last + 1] = [[min(start, self[first][START_IDX]), max(end, self[last][END_IDX])]]
+
+    def subtract(self, start, end):
+        """
+        Remove a section lying within one section of the set, leaving any data
+        on either side of it.  Sections which are not contained in the set are
+        ignored, since only sections read from the set are removed from it.
+        @param start The start of the section
+        @param end The end of the section
+        @retval True if the section was removed
+        """
+        idx = self.find(start)
+        if idx < 0 or self[idx][END_IDX] < end:
+            return False
+        (section_start, section_end) = self[idx]
+        remain = []
+        if start > section_start:
+            remain.append([section_start, start])
+        if end < section_end:
+            remain.append([end, section_end])
+        self[idx:idx + 1] = remain
+        return True
+
+    def end(self):
+        """
+        @retval The end of the last section, None if the set is empty
+        """
+        if not self:
+            return None
+        return self[-1][END_IDX]
+
+
+class SioHeaderIndex(object):
+    """
+    The SIO headers found in the unescaped data of a mule file, with the
+    position, length, instrument ID and validity of each packet. As the file
+    grows a new index is made by scanning only the data added since the last
+    one, and indexes can be saved to a file so later runs don't have to scan
+    the file again. An index is not changed once it has been made, so it can
+    be shared between parsers.
+    """
+    VERSION = 2
+
+    def __init__(self, size=0, crc=None, headers=None):
+        """
+        @param size The number of bytes indexed
+        @param crc crc32 of the bytes indexed, None for an empty index
+        @param headers [start, header end, packet end, instrument ID, valid] for each
+            header in file order, valid is None if the packet extends past the end
+            of the indexed data
+        """
+        self.size = size
+        self.crc = crc
+        self.headers = headers or []
+        self._starts = [header[0] for header in self.headers]
+
+    def update(self, data):
+        """
+        Index the headers in data, which may have grown since this index was made
+        @param data The unescaped data of the whole file
+        @retval This index if data has not changed, otherwise a new index of data
+        """
+        # every byte indexed is checked, any rewrite means a full scan
+        if self.crc is not None and prefix_crc32(data, self.size) == self.crc:
+            if len(data) == self.size:
+                return self
+            # rescan from the first header with an incomplete packet or the
+            # first header that could have been cut off by the end of the data
+            scan_from = max(self.size - SIO_HEADER_SIZE + 1, 0)
+            for header in self.headers:
+                if header[4] is None:
+                    scan_from = min(scan_from, header[0])
+                    break
+            log.debug("Updating SIO header index from %d, %d bytes added", scan_from, len(data) - self.size)
+        else:
+            scan_from = 0
+            log.debug("Building SIO header index of %d bytes", len(data))
+
+        headers = self.headers[:bisect.bisect_left(self._starts, scan_from)]
+
+        for match in SIO_HEADER_MATCHER.finditer(data, scan_from):
+            packet_end = match.end(0) + int(match.group(2), 16)
+            if packet_end < len(data):
+                valid = data[packet_end] == '\x03' and \
+                    SioMuleParser.calc_checksum(data[match.end(0):packet_end]) == match.group(5)
+            else:
+                valid = None
+            headers.append([match.start(0), match.end(0), packet_end, match.group(1), valid])
+
+        return SioHeaderIndex(len(data), prefix_crc32(data, len(data)), headers)
+
+    def packets(self, start, end, instrument_id=None):
+        """
+        Get the valid packets that lie completely within a section of the file
+        @param start The start of the section
+        @param end The end of the section
+        @param instrument_id Only return packets for this instrument ID, i.e. 'CT'
+        @retval A list of (start, end) of each packet including the end byte
+        """
+        result = []
+        for ii in xrange(bisect.bisect_left(self._starts, start), len(self.headers)):
+            (header_start, header_end, packet_end, header_id, valid) = self.headers[ii]
+            if header_start >= end:
+                break
+            # the byte following the data must be in the section as well
+            if valid and packet_end < end and (instrument_id is None or header_id == instrument_id):
+                result.append((header_start, packet_end + 1))
+        return result
+
+    def to_dict(self):
+        return {'version': self.VERSION,
+                'size': self.size,
+                'crc': self.crc,
+                'headers': self.headers}
+
+    @classmethod
+    def from_dict(cls, index_dict):
+        """
+        @param index_dict A dictionary from to_dict
+        @retval The index, or an empty index if index_dict is not a usable index
+        """
+        try:
+            if index_dict.get('version') == cls.VERSION:
+                return cls(index_dict['size'], index_dict['crc'],
+                           [[header[0], header[1], header[2], str(header[3]), header[4]]
+                            for header in index_dict['headers']])
+        except (KeyError, TypeError, IndexError, AttributeError) as e:
+            log.warn("Ignoring invalid SIO header index: %s", e)
+        return cls()
+
+
+# indexes of the files parsed by this process, by device, inode and recovered flag
+MAX_HEADER_INDEXES = 256
+_header_indexes = OrderedDict()
+_header_index_lock = Lock()
+
+
+def get_header_index(stream_handle, data, recovered_flag, directory=None):
+    """
+    Get the up to date SIO header index of a mule file. Indexes are kept in
+    memory for the files most recently parsed, and in directory if given.
+    @param stream_handle The open file
+    @param data The unescaped data of the whole file
+    @param recovered_flag True if the file is recovered data
+    @param directory Directory to load and save the index in, None to keep it in memory only
+    @retval The SioHeaderIndex for data
+    """
+    try:
+        stat = os.fstat(stream_handle.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        # not a file, the index only lasts as long as the parser
+        return SioHeaderIndex().update(data)
+
+    key = '%d_%d_%s' % (stat.st_dev, stat.st_ino, 'recovered' if recovered_flag else 'telemetered')
+    path = os.path.join(directory, key + '.sioidx') if directory else None
+
+    with _header_index_lock:
+        index = _header_indexes.pop(key, None)
+        if index is None and path and os.path.exists(path):
+            try:
+                with open(path, 'r') as index_file:
+                    index = SioHeaderIndex.from_dict(json.load(index_file))
+            except (IOError, ValueError) as e:
+                log.warn("Unable to read SIO header index %s: %s", path, e)
+        if index is None:
+            index = SioHeaderIndex()
+
+        updated = index.update(data)
+        changed = updated is not index
+        index = updated
+
+        _header_indexes[key] = index
+        while len(_header_indexes) > MAX_HEADER_INDEXES:
+            _header_indexes.popitem(last=False)
+
+    if changed and path:
+        try:
+            # write to a temporary file and rename so a partial index is never read
+            temp_path = path + '.tmp'
+            with open(temp_path, 'w') as index_file:
+                json.dump(index.to_dict(), index_file)
+            os.rename(temp_path, path)
+        except (IOError, OSError) as e:
+            log.warn("Unable to save SIO header index %s: %s", path, e)
+
+    return index
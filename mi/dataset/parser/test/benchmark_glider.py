@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.parser.test.benchmark_glider
+@file mi/dataset/parser/test/benchmark_glider.py
+@author agent
+@brief Benchmark for decoding glider data rows. Builds a merged glider file
+    with the engineering columns plus enough extra columns to reach the
+    requested width, then times decoding its rows one value at a time with
+    GliderParser._read_data against decoding them as a block with
+    GliderColumns, and times parsing the whole file into engineering
+    particles and into CTDGV particles, which only decode the few columns
+    the CTDGV particle is built from.
+
+Usage:
+    python -m mi.dataset.parser.test.benchmark_glider [columns] [rows]
+
+    columns  Number of columns in the generated file, default 2500
+    rows     Number of data rows in the generated file, default 500
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from mi.dataset.parser.glider import GliderParser, GliderEngineeringParser, GliderColumns
+from mi.dataset.parser.glider import CtdgvParticleKey
+from mi.dataset.parser.glider import EngineeringTelemeteredParticleKey
+from mi.dataset.parser.glider import EngineeringScienceTelemeteredParticleKey
+
+DEFAULT_COLUMNS = 2500
+DEFAULT_ROWS = 500
+RECORDS_PER_CALL = 100
+
+
+def write_file(filehandle, num_columns, num_rows):
+    """
+    Write a merged glider ASCII file with random data
+    """
+    labels = EngineeringTelemeteredParticleKey.list()
+    labels += [key for key in EngineeringScienceTelemeteredParticleKey.list() if key not in labels]
+    labels += [key for key in CtdgvParticleKey.list() if key not in labels]
+    labels += ['x_extra_%d' % ii for ii in range(num_columns - len(labels))]
+    labels = labels[:num_columns]
+    num_of_bytes = [1 if label.startswith('x_') else 8 if '_lat' in label or '_lon' in label else 4
+                    for label in labels]
+
+    filehandle.write("dbd_label: DBD_ASC(dinkum_binary_data_ascii)file\n"
+                     "encoding_ver: 2\n"
+                     "num_ascii_tags: 14\n"
+                     "all_sensors: 0\n"
+                     "filename: unit_363-2013-245-6-6\n"
+                     "the8x3_filename: 01790006\n"
+                     "filename_extension: sbd\n"
+                     "filename_label: unit_363-2013-245-6-6-sbd(01790006)\n"
+                     "mission_name: TRANS58.MI\n"
+                     "fileopen_time: Thu_Sep__5_02:46:15_2013\n"
+                     "sensors_per_cycle: %d\n"
+                     "num_label_lines: 3\n"
+                     "num_segments: 1\n"
+                     "segment_filename_0: unit_363-2013-245-6-6\n" % num_columns)
+    filehandle.write(' '.join(labels) + ' \n')
+    filehandle.write(' '.join(['nodim'] * num_columns) + ' \n')
+    filehandle.write(' '.join(str(num) for num in num_of_bytes) + ' \n')
+
+    for row in xrange(num_rows):
+        values = []
+        for (label, num) in zip(labels, num_of_bytes):
+            if label == 'm_present_time':
+                values.append('%.5f' % (1378349126.65387 + row))
+            elif random.random() < 0.5:
+                values.append('NaN')
+            elif num == 1:
+                values.append(str(random.randint(0, 100)))
+            elif num == 8:
+                values.append('%.4f' % (random.choice([-1, 1]) * random.uniform(1000, 14000)))
+            else:
+                values.append('%.6f' % random.uniform(-100, 100))
+        filehandle.write(' '.join(values) + ' \n')
+
+
+def same_data(data_dict, other):
+    """
+    Compare two data dictionaries, treating NaN values as equal
+    """
+    if sorted(data_dict.keys()) != sorted(other.keys()):
+        return False
+    for key in data_dict:
+        (value, other_value) = (data_dict[key]['Data'], other[key]['Data'])
+        if value != other_value and not (value != value and other_value != other_value):
+            return False
+        if type(value) != type(other_value):
+            return False
+    return True
+
+
+def open_parser(filehandle, parser_class=GliderEngineeringParser,
+                particle_class='EngineeringTelemeteredDataParticle'):
+    filehandle.seek(0)
+    config = {'particle_module': 'mi.dataset.parser.glider',
+              'particle_class': particle_class}
+    return parser_class(config, None, filehandle,
+                        lambda *args: None, lambda *args: None, lambda *args: None)
+
+
+def parse_rate(parser):
+    """
+    Parse a whole file
+    @retval particles per second
+    """
+    count = 0
+    start = time.time()
+    while True:
+        particles = parser.get_records(RECORDS_PER_CALL)
+        if not particles:
+            break
+        count += len(particles)
+    return count / (time.time() - start)
+
+
+def run():
+    num_columns = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COLUMNS
+    num_rows = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROWS
+
+    filehandle = tempfile.TemporaryFile()
+    write_file(filehandle, num_columns, num_rows)
+
+    parser = open_parser(filehandle)
+    records = filehandle.read().splitlines(True)
+    header = parser._header_dict
+    columns = GliderColumns(header['labels'], header['num_of_bytes'], header['sensors_per_cycle'],
+                            parser._string_to_ddegrees)
+
+    start = time.time()
+    for record in records:
+        parser._read_data(record)
+    row_time = time.time() - start
+
+    start = time.time()
+    rows = columns.decode(records)
+    block_time = time.time() - start
+
+    for (record, row) in zip(records, rows):
+        if not same_data(row.to_dict(), parser._read_data(record)):
+            print "MISMATCH: decoded row differs from _read_data"
+            sys.exit(1)
+
+    eng_rate = parse_rate(open_parser(filehandle))
+    ctdgv_rate = parse_rate(open_parser(filehandle, GliderParser, 'CtdgvDataParticle'))
+
+    print "%d columns, %d rows" % (num_columns, num_rows)
+    print "%-26s %10.0f rows/s" % ("_read_data", num_rows / row_time)
+    print "%-26s %10.0f rows/s %9.2fx" % ("GliderColumns.decode", num_rows / block_time,
+                                          row_time / block_time)
+    print "%-26s %10.0f particles/s" % ("GliderEngineeringParser", eng_rate)
+    print "%-26s %10.0f particles/s" % ("GliderParser (CTDGV)", ctdgv_rate)
+
+
+if __name__ == '__main__':
+    run()
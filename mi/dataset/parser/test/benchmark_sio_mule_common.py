@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.parser.test.benchmark_sio_mule_common
+@file mi/dataset/parser/test/benchmark_sio_mule_common.py
+@author agent
+@brief Benchmark for the SIO checksum. Finds every SIO packet in the SIO
+    driver test resources and times checksumming them with the bit at a time
+    CRC SioMuleParser.calc_checksum used to compute against the current
+    table driven one, checking both give the same checksums.
+
+Usage:
+    python -m mi.dataset.parser.test.benchmark_sio_mule_common [seconds]
+
+    seconds  Minimum time to spend on each measurement, default 1
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import glob
+import time
+import struct
+
+from mi.dataset.parser.sio_mule_common import SioMuleParser, SIO_HEADER_MATCHER
+
+DEFAULT_SECONDS = 1.0
+RESOURCE_GLOB = os.path.join('mi', 'dataset', 'driver', '*', '*', 'resource', '*.dat')
+
+
+def bitwise_checksum(data):
+    """
+    SioMuleParser.calc_checksum before the table driven CRC
+    """
+    crc = 65535
+    if len(data) == 0:
+        return '0000'
+    for iData in range(0, len(data)):
+        short = struct.unpack('H', data[iData] + '\x00')
+        point = 255 & short[0]
+        crc = crc ^ point
+        for i in range(7, -1, -1):
+            if crc & 1:
+                crc = (crc >> 1) ^ 33800
+            else:
+                crc >>= 1
+    crc = ~crc
+    # convert to unsigned
+    if crc < 0:
+        crc += 65536
+    return '%04X' % crc
+
+
+def find_packets(paths):
+    """
+    Find the data of every SIO packet in a list of files
+    @retval list of (packet data, checksum from the header)
+    """
+    packets = []
+    for path in paths:
+        with open(path, 'rb') as filehandle:
+            raw_data = filehandle.read()
+        for match in SIO_HEADER_MATCHER.finditer(raw_data):
+            end_packet_idx = match.end(0) + int(match.group(2), 16)
+            if end_packet_idx < len(raw_data) and raw_data[end_packet_idx] == '\x03':
+                packets.append((raw_data[match.end(0):end_packet_idx], match.group(5)))
+    return packets
+
+
+def measure(function, packets, seconds):
+    """
+    Checksum all the packets repeatedly for at least the given time
+    @retval bytes per second
+    """
+    total = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < seconds:
+        for (data, checksum) in packets:
+            function(data)
+            total += len(data)
+        elapsed = time.time() - start
+    return total / elapsed
+
+
+def run():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SECONDS
+
+    paths = sorted(glob.glob(RESOURCE_GLOB))
+    packets = find_packets(paths)
+    if not packets:
+        print "No SIO packets found under %s, run from the repository root" % RESOURCE_GLOB
+        sys.exit(1)
+
+    matched = 0
+    for (data, checksum) in packets:
+        calculated = SioMuleParser.calc_checksum(data)
+        if calculated != bitwise_checksum(data):
+            print "MISMATCH: checksums differ for a %d byte packet" % len(data)
+            sys.exit(1)
+        if calculated == checksum:
+            matched += 1
+
+    print "%d files, %d packets, %d bytes, %d checksums match their header" % (
+        len(paths), len(packets), sum(len(data) for (data, checksum) in packets), matched)
+
+    bitwise_rate = measure(bitwise_checksum, packets, seconds)
+    table_rate = measure(SioMuleParser.calc_checksum, packets, seconds)
+
+    print "%-12s %14s" % ("checksum", "bytes/s")
+    print "%-12s %14.0f" % ("bitwise", bitwise_rate)
+    print "%-12s %14.0f %9.2fx" % ("table", table_rate, table_rate / bitwise_rate)
+
+
+if __name__ == '__main__':
+    run()
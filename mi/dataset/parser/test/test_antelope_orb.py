@@ -93,7 +93,8 @@ class AntelopeOrbParserUnitTestCase(ParserUnitTestCase):
             self.parser = AntelopeOrbParser(self.parser_config, self.parser_state,
                             self.state_callback, self.pub_callback,
                             self.error_callback)
-        self.parser._orbreapthr.get = MagicMock(return_value=(PKT_ID, srcname, time, packet))
+        self.packet = (PKT_ID, srcname, time, packet)
+        self.parser._orbreapthr.get = MagicMock(return_value=self.packet)
 
     def test_get_records(self):
         r = self.parser.get_records()
@@ -158,3 +159,68 @@ class AntelopeOrbParserUnitTestCase(ParserUnitTestCase):
         self.assertRaises(SampleException, self.publish_callback_values[0][0]._build_parsed_values)
 
 
+    def build_parser(self, **config):
+        """
+        Build a parser with extra config whose orb has five packets, each a
+        second after the last, then no more data
+        """
+        self.parser_config.update(config)
+        with patch('mi.dataset.parser.antelope_orb.OrbReapThr'):
+            parser = AntelopeOrbParser(self.parser_config, self.parser_state,
+                            self.state_callback, self.pub_callback,
+                            self.error_callback)
+        packets = [self.packet[:2] + (self.PKT_TIME + i,) + self.packet[3:] for i in range(5)]
+        def f(*args, **kwargs):
+            if not packets:
+                raise NoData()
+            return packets.pop(0)
+        parser._orbreapthr.get.side_effect = f
+        return parser
+
+    def test_batch_packets(self):
+        """
+        Test packets are published batch_packets at a time with one state
+        update per batch, and a short batch when the orb runs dry
+        """
+        parser = self.build_parser(**{ParserConfigKey.BATCH_PACKETS: 3})
+        self.assertEqual(len(parser.get_records()), 3)
+        # the queue runs dry part way through the second batch
+        self.assertEqual(len(parser.get_records()), 2)
+        self.assertEqual(parser.get_records(), [])
+        self.assertEqual([len(p) for p in self.publish_callback_values], [3, 2])
+        # one state update per batch, with the time of the last packet
+        self.assertEqual(len(self.state_callback_values), 2)
+        self.assertEqual(parser._state[StateKey.TAFTER], self.PKT_TIME + 4)
+
+    def test_batch_milliseconds(self):
+        """
+        Test a batch is cut short once batch_milliseconds have passed
+        """
+        parser = self.build_parser(**{ParserConfigKey.BATCH_PACKETS: 10,
+                                      ParserConfigKey.BATCH_MILLISECONDS: 50})
+        with patch('mi.dataset.parser.antelope_orb.time') as mock_time:
+            # the deadline passes after the second packet
+            mock_time.time.side_effect = [0.0, 0.01, 0.06]
+            self.assertEqual(len(parser.get_records()), 2)
+        self.assertEqual(len(self.state_callback_values), 1)
+        self.assertEqual(parser._state[StateKey.TAFTER], self.PKT_TIME + 1)
+
+    def test_get_error_mid_batch(self):
+        """
+        Test the packets reaped before an error part way through a batch are
+        published before the error is raised
+        """
+        parser = self.build_parser(**{ParserConfigKey.BATCH_PACKETS: 10})
+        from mi.core.kudu.brttpkt import GetError
+        get = parser._orbreapthr.get.side_effect
+        calls = []
+        def f(*args, **kwargs):
+            calls.append(1)
+            if len(calls) > 2:
+                raise GetError()
+            return get()
+        parser._orbreapthr.get.side_effect = f
+        self.assertRaises(GetError, parser.get_records)
+        # the packets reaped before the error are still published
+        self.assertEqual([len(p) for p in self.publish_callback_values], [2])
+        self.assertEqual(parser._state[StateKey.TAFTER], self.PKT_TIME + 1)
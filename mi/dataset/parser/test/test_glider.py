@@ -20,6 +20,7 @@ log = get_logger()
 from nose.plugins.attrib import attr
 
 from mi.core.exceptions import SampleException
+from mi.core.instrument.data_particle import DataParticleKey
 from mi.dataset.test.test_parser import ParserUnitTestCase
 from mi.dataset.dataset_driver import DataSetDriverConfigKeys
 from mi.dataset.parser.glider import GliderParser, GliderEngineeringParser, StateKey
@@ -37,7 +38,7 @@ from mi.dataset.parser.glider import EngineeringScienceTelemeteredDataParticle
 from mi.dataset.parser.glider import EngineeringTelemeteredDataParticle
 from mi.dataset.parser.glider import EngineeringMetadataDataParticle
 from mi.dataset.parser.glider import EngineeringMetadataParticleKey
-from mi.dataset.parser.glider import DataParticleType, GliderParticle
+from mi.dataset.parser.glider import DataParticleType, GliderParticle, GliderColumns
 from mi.dataset.parser.test.glider_test_results import positions, glider_test_data
 
 
@@ -331,6 +332,99 @@ class GliderParserUnitTestCase(ParserUnitTestCase):
         (timestamp, data_record, start, end) = self.parser._chunker.get_next_data_with_index()
         self.assertEqual(records[1]+"\n", data_record)
 
+    def test_decode_columns(self):
+        """
+        Verify rows decoded as a block match the rows read one value at a time
+        """
+        self.set_data(HEADER)
+        self.reset_parser()
+
+        # the first chunker test record is one column short
+        (short_record, record) = CHUNKER_TEST.strip("\n").split("\n")
+        records = [record, INT_GPS_VALUE.strip("\n"), ZERO_GPS_VALUE.strip("\n"), short_record]
+        header = self.parser._header_dict
+        columns = GliderColumns(header['labels'], header['num_of_bytes'], header['sensors_per_cycle'],
+                                self.parser._string_to_ddegrees)
+        rows = columns.decode(records)
+        self.assertEqual(len(rows), 4)
+
+        for (record, row) in zip(records[:3], rows[:3]):
+            expected = self.parser._read_data(record)
+            self.assertEqual(sorted(row.keys()), sorted(expected.keys()))
+            for key in expected:
+                value = row[key]['Data']
+                if np.isnan(expected[key]['Data']):
+                    self.assertTrue(np.isnan(value))
+                else:
+                    self.assertEqual(value, expected[key]['Data'])
+                    self.assertEqual(type(value), type(expected[key]['Data']))
+
+        self.assertAlmostEqual(rows[0]['m_present_time']['Data'], 1378349475.09927)
+        self.assertAlmostEqual(rows[1]['c_wpt_lat']['Data'], 20.2)
+        self.assertTrue(rows[1].has_data(['m_lat', 'c_wpt_lat']))
+        self.assertFalse(rows[0].has_data(['m_lat', 'c_wpt_lat']))
+        self.assertIsInstance(rows[3], SampleException)
+
+    def test_column_projection(self):
+        """
+        Verify only the projected columns are decoded
+        """
+        self.set_data(HEADER)
+        self.reset_parser()
+
+        header = self.parser._header_dict
+        columns = GliderColumns(header['labels'], header['num_of_bytes'], header['sensors_per_cycle'],
+                                self.parser._string_to_ddegrees, ['m_present_time', 'c_wpt_lat', 'not_a_column'])
+        self.assertEqual(columns.labels, ['c_wpt_lat', 'm_present_time'])
+
+        (short_record, record) = CHUNKER_TEST.strip("\n").split("\n")
+        rows = columns.decode([record, INT_GPS_VALUE.strip("\n"), short_record])
+
+        self.assertEqual(sorted(rows[0].keys()), ['c_wpt_lat', 'm_present_time'])
+        self.assertAlmostEqual(rows[0]['m_present_time']['Data'], 1378349475.09927)
+        self.assertAlmostEqual(rows[1]['c_wpt_lat']['Data'], 20.2)
+        self.assertNotIn('m_lat', rows[0])
+        with self.assertRaises(KeyError):
+            rows[0]['m_lat']
+        # the column count is still checked against the whole row
+        self.assertIsInstance(rows[2], SampleException)
+
+        # the parser projection holds the particle parameters and the timestamp
+        self.set_data(HEADER)
+        parser = GliderParser({DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.glider',
+                               DataSetDriverConfigKeys.PARTICLE_CLASS: 'CtdgvDataParticle'},
+                              {}, self.test_data, self.state_callback, self.pub_callback, self.error_callback)
+        projection = parser._column_projection()
+        self.assertIn('m_present_time', projection)
+        self.assertTrue(set(CtdgvDataParticle.parameters) <= set(projection))
+
+    def test_int_column_float_value(self):
+        """
+        Verify an integer column holding a whole number written as a float
+        decodes to an int, where int("1.0") used to raise ValueError, and a
+        fraction is left to be read one value at a time
+        """
+        self.set_data(HEADER)
+        self.reset_parser()
+
+        header = self.parser._header_dict
+        # the test header has no integer columns, make the first one 1 byte
+        num_of_bytes = list(header['num_of_bytes'])
+        num_of_bytes[0] = 1
+        label = header['labels'][0]
+        columns = GliderColumns(header['labels'], num_of_bytes, header['sensors_per_cycle'],
+                                self.parser._string_to_ddegrees)
+
+        data = CHUNKER_TEST.strip("\n").split("\n")[1].split()
+        rows = columns.decode([' '.join(['1.0'] + data[1:]), ' '.join(['1.5'] + data[1:])])
+
+        value = rows[0].value(label)
+        self.assertEqual(value, 1)
+        self.assertIsInstance(value, int)
+        self.assertEqual(rows[0].parsed_values([label]),
+                         [{DataParticleKey.VALUE_ID: label, DataParticleKey.VALUE: 1}])
+        self.assertIsNone(rows[1])
+
 
 @attr('UNIT', group='mi')
 class CTDGVGliderTest(GliderParserUnitTestCase):
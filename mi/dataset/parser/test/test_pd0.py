@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.parser.test.test_pd0
+@file mi/dataset/parser/test/test_pd0.py
+@author agent
+@brief Test code for decoding PD0 ensembles with numpy dtypes
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+from struct import pack, unpack
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.exceptions import SampleException
+from mi.dataset.parser import pd0
+from mi.dataset.parser.adcpa import ADCPA_PD0_PARSED_MATCHER
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'LA101636.PD0')
+
+
+@attr('UNIT', group='mi')
+class Pd0UnitTestCase(MiUnitTestCase):
+
+    def setUp(self):
+        with open(TEST_DATA, 'rb') as stream:
+            self.ensembles = [match.group(0) for match in ADCPA_PD0_PARSED_MATCHER.finditer(stream.read())]
+
+    def test_sizes(self):
+        """
+        Test the dtypes have the sizes of the data types in the manual
+        """
+        self.assertEqual(pd0.HEADER.itemsize, 6)
+        self.assertEqual(pd0.FIXED_LEADER.itemsize, 58)
+        self.assertEqual(pd0.VARIABLE_LEADER.itemsize, 60)
+        self.assertEqual(pd0.BOTTOM_TRACK.itemsize, 81)
+        self.assertEqual(pd0.VELOCITY_CELL.itemsize, 8)
+        self.assertEqual(pd0.BEAM_CELL.itemsize, 4)
+
+    def test_ensemble(self):
+        """
+        Test decoding an ensemble gives the same values as unpacking it with struct
+        """
+        ensemble = self.ensembles[0]
+        (header_id, data_source_id, num_bytes, spare, num_data_types) = pd0.read_record(ensemble, pd0.HEADER)
+        self.assertEqual((header_id, data_source_id, num_bytes, spare, num_data_types),
+                         unpack('<BBHBB', ensemble[0:6]))
+        self.assertEqual(pd0.checksum(ensemble, num_bytes), sum(map(ord, ensemble[:num_bytes])) & 65535)
+        self.assertEqual(pd0.checksum(ensemble, num_bytes), pd0.read_record(ensemble, pd0.CHECKSUM, num_bytes))
+
+        offsets = pd0.read_offsets(ensemble, num_data_types)
+        self.assertEqual(offsets, list(unpack('<%dH' % num_data_types, ensemble[6:6 + 2 * num_data_types])))
+        self.assertEqual(pd0.read_data_type_id(ensemble, offsets[0]), pd0.FIXED_LEADER_ID)
+
+        fixed = pd0.read_record(ensemble, pd0.FIXED_LEADER, offsets[0])
+        self.assertEqual(fixed, unpack('<HBBHBBBBHHHBBBBHBBBBhhBBHHBBBBHQHBBI', ensemble[offsets[0]:offsets[0] + 58]))
+        self.assertEqual([type(value) for value in fixed][-1], int)
+
+        self.assertRaises(SampleException, pd0.read_record, ensemble, pd0.FIXED_LEADER, len(ensemble) - 10)
+
+    def test_cells(self):
+        """
+        Test decoding the depth cells of a data type, including a data type
+        cut short part way through a cell
+        """
+        values = [[1, -2, 3], [-4, 5, -6], [7, 8, 9], [-10, 11, -12]]
+        chunk = pack('<H', pd0.VELOCITY_ID) + ''.join(pack('<hhhh', *cell) for cell in zip(*values))
+        self.assertEqual(pd0.read_cells(chunk, pd0.VELOCITY_CELL), values)
+        self.assertEqual(pd0.read_cells(chunk[:-3], pd0.VELOCITY_CELL), [beam[:2] for beam in values])
+        self.assertEqual(pd0.read_cells(chunk[:2], pd0.VELOCITY_CELL), [[], [], [], []])
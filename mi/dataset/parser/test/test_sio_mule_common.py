@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.parser.test.test_sio_mule_common
+@file mi/dataset/parser/test/test_sio_mule_common.py
+@author agent
+@brief Test code for the SIO checksum, header index and unprocessed data state
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import json
+import shutil
+import tempfile
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+
+from mi.dataset.test.test_parser import ParserUnitTestCase
+from mi.dataset.parser.sio_mule_common import SioMuleParser, SioHeaderIndex, IntervalSet, get_header_index
+
+
+def sio_packet(instrument_id, data, checksum=None):
+    """
+    Build an SIO packet around data
+    """
+    if checksum is None:
+        checksum = SioMuleParser.calc_checksum(data)
+    return '\x01%s1236501_%04Xu51EC763C_04_%s\x02%s\x03' % (instrument_id, len(data), checksum, data)
+
+
+@attr('UNIT', group='mi')
+class SioHeaderIndexUnitTestCase(ParserUnitTestCase):
+
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        self.ct_packet = sio_packet('CT', 'ctd data\n' * 10)
+        self.do_packet = sio_packet('DO', 'dosta data\n' * 5)
+        self.bad_packet = sio_packet('FL', 'flort data\n', '0000')
+
+    def test_checksum(self):
+        """
+        Test the checksum of known data
+        """
+        self.assertEqual(SioMuleParser.calc_checksum(''), '0000')
+        self.assertEqual(SioMuleParser.calc_checksum('123456789'), '906E')
+        self.assertEqual(SioMuleParser.calc_checksum('\x00'), 'F078')
+
+    def test_packets(self):
+        """
+        Test finding packets in a section of the file
+        """
+        data = 'junk' + self.ct_packet + self.bad_packet + self.do_packet
+        index = SioHeaderIndex().update(data)
+
+        self.assertEqual(len(index.headers), 3)
+        ct_end = 4 + len(self.ct_packet)
+        do_start = ct_end + len(self.bad_packet)
+        # the bad checksum packet is not returned
+        self.assertEqual(index.packets(0, len(data)), [(4, ct_end), (do_start, len(data))])
+        self.assertEqual(index.packets(0, len(data), 'DO'), [(do_start, len(data))])
+        # packets must be entirely in the section
+        self.assertEqual(index.packets(5, len(data)), [(do_start, len(data))])
+        self.assertEqual(index.packets(0, len(data) - 1), [(4, ct_end)])
+
+    def test_growing_file(self):
+        """
+        Test the index is updated as data is added without rescanning
+        """
+        data = self.ct_packet + self.do_packet[:40]
+        index = SioHeaderIndex().update(data)
+        self.assertEqual(index.packets(0, len(data)), [(0, len(self.ct_packet))])
+        self.assertEqual(index.headers[-1][4], None)
+        self.assertIs(index.update(data), index)
+
+        data = self.ct_packet + self.do_packet
+        grown = index.update(data)
+        self.assertEqual(grown.packets(0, len(data)), [(0, len(self.ct_packet)), (len(self.ct_packet), len(data))])
+        # the earlier index is not changed
+        self.assertEqual(index.size, len(self.ct_packet) + 40)
+
+        # rewriting the start of the file rebuilds the index
+        data = self.do_packet + self.ct_packet
+        rebuilt = grown.update(data)
+        self.assertEqual(rebuilt.packets(0, len(data), 'DO'), [(0, len(self.do_packet))])
+
+    def test_rewritten_middle(self):
+        """
+        Test rewriting the middle of a large file then adding to it rebuilds the index
+        """
+        filler = self.ct_packet * 100
+        data = filler + self.do_packet + filler
+        index = SioHeaderIndex().update(data)
+        do_packet = (len(filler), len(filler) + len(self.do_packet))
+        self.assertEqual(index.packets(0, len(data), 'DO'), [do_packet])
+
+        # the same length of data, but the packet no longer has a valid checksum
+        bad_do_packet = sio_packet('DO', 'dosta data\n' * 5, '0000')
+        self.assertEqual(len(bad_do_packet), len(self.do_packet))
+        data = filler + bad_do_packet + filler + self.ct_packet
+        rebuilt = index.update(data)
+        self.assertEqual(rebuilt.packets(0, len(data), 'DO'), [])
+        self.assertEqual(len(rebuilt.packets(0, len(data), 'CT')), 201)
+
+    def test_saved_index(self):
+        """
+        Test indexes are saved to and read from the index directory
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            data = self.ct_packet + self.do_packet
+            with tempfile.NamedTemporaryFile() as mule_file:
+                mule_file.write(data)
+                mule_file.flush()
+
+                index = get_header_index(mule_file, data, False, directory)
+                files = os.listdir(directory)
+                self.assertEqual(len(files), 1)
+                self.assertTrue(files[0].endswith('_telemetered.sioidx'))
+
+                saved = SioHeaderIndex.from_dict(index.to_dict())
+                self.assertEqual(saved.headers, index.headers)
+                self.assertIs(saved.update(data).headers, saved.headers)
+                self.assertEqual(saved.packets(0, len(data)), index.packets(0, len(data)))
+
+                # indexes saved by another version are not used
+                old_version = dict(index.to_dict(), version=SioHeaderIndex.VERSION - 1)
+                self.assertEqual(SioHeaderIndex.from_dict(old_version).headers, [])
+        finally:
+            shutil.rmtree(directory)
+
+
+@attr('UNIT', group='mi')
+class IntervalSetUnitTestCase(ParserUnitTestCase):
+
+    def test_add(self):
+        """
+        Test adding sections joins overlapping and adjacent sections
+        """
+        unprocessed = IntervalSet()
+        self.assertEqual(unprocessed.end(), None)
+        unprocessed.add(10, 20)
+        unprocessed.add(30, 40)
+        unprocessed.add(0, 5)
+        unprocessed.add(50, 50)
+        self.assertEqual(unprocessed, [[0, 5], [10, 20], [30, 40]])
+
+        unprocessed.add(20, 25)
+        self.assertEqual(unprocessed, [[0, 5], [10, 25], [30, 40]])
+        unprocessed.add(3, 35)
+        self.assertEqual(unprocessed, [[0, 40]])
+        unprocessed.add(45, 60)
+        self.assertEqual(unprocessed.end(), 60)
+
+    def test_subtract(self):
+        """
+        Test removing packets from the unprocessed sections
+        """
+        unprocessed = IntervalSet([[0, 100], [200, 300]])
+        self.assertTrue(unprocessed.subtract(10, 20))
+        self.assertTrue(unprocessed.subtract(200, 250))
+        self.assertTrue(unprocessed.subtract(280, 300))
+        self.assertEqual(unprocessed, [[0, 10], [20, 100], [250, 280]])
+
+        # sections that are not within one unprocessed section are left alone
+        self.assertFalse(unprocessed.subtract(15, 30))
+        self.assertFalse(unprocessed.subtract(100, 110))
+        self.assertTrue(unprocessed.subtract(0, 10))
+        self.assertEqual(unprocessed, [[20, 100], [250, 280]])
+        # the state is still saved as a list of lists
+        self.assertEqual(json.loads(json.dumps(unprocessed)), [[20, 100], [250, 280]])
+
+    def test_index_after(self):
+        """
+        Test finding the next unprocessed section after a position
+        """
+        unprocessed = IntervalSet([[0, 10], [20, 30], [40, 50]])
+        self.assertEqual(unprocessed.index_after(0), 0)
+        self.assertEqual(unprocessed.index_after(10), 1)
+        self.assertEqual(unprocessed.index_after(25), 1)
+        self.assertEqual(unprocessed.index_after(30), 2)
+        self.assertEqual(unprocessed.index_after(50), 3)
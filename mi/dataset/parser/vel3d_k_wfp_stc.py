@@ -299,16 +299,16 @@ class Vel3dKWfpStcParser(BufferLoadingParser):
         An EOFError is raised when the end of the file is reached.
         """
         # Read in data in blocks so as to not tie up the CPU.
-        BLOCK_SIZE = 1024
+        blocks = []
         eof = False
-        data = ''
         while not eof:
-            next_block = self._stream_handle.read(BLOCK_SIZE)
+            next_block = self._read(self._block_size)
             if next_block:
-                data = data + next_block
+                blocks.append(next_block)
                 gevent.sleep(0)
             else:
                 eof = True
+        data = ''.join(blocks)
 
         if data != '':
             self._chunker.add_chunk(data, self._timestamp)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.publish_rate
+@file mi/dataset/publish_rate.py
+@author agent
+@brief Pace the particles a dataset driver publishes with a token bucket
+
+Drivers used to sleep for batched_particle_count / records_per_second after
+every batch, on top of the time it took to parse the batch, so they always
+published slower than records_per_second and the rate moved with the cost of
+the parser.  A PublishRate is a token bucket which fills at records_per_second
+up to a burst allowance.  Each published particle takes a token, and the
+driver only waits when the bucket is overdrawn, so time spent parsing counts
+towards the wait and the rate over time is records_per_second.
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import time
+
+import gevent
+
+from mi.core.log import get_logger ; log = get_logger()
+
+# a gap of longer than this between batches, not counting waiting for the
+# bucket, ends a run of publishing for the metrics
+IDLE_SECONDS = 1.0
+
+
+class PublishRate(object):
+    """
+    Token bucket for the particles published by a driver
+    @param rate The number of particles to publish per second
+    @param burst The number of particles that can be published at once after
+        the driver has been idle, at least one
+    @param clock Function returning the current time in seconds
+    @param sleep Function to wait a number of seconds
+    """
+    def __init__(self, rate, burst=1, clock=time.time, sleep=gevent.sleep):
+        if rate <= 0:
+            raise ValueError("publish rate must be > 0")
+        self._rate = float(rate)
+        self._burst = float(max(burst, 1))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self._burst
+        self._last = clock()
+        # metrics for the current run of publishing
+        self._start = None
+        self._published = 0
+        self._ready = None
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def published(self):
+        """
+        The number of particles published in the current run
+        """
+        return self._published
+
+    @property
+    def achieved_rate(self):
+        """
+        The particles per second published in the current run, None before any are published
+        """
+        if self._start is None:
+            return None
+        elapsed = self._clock() - self._start
+        if elapsed <= 0:
+            return None
+        return self._published / elapsed
+
+    @property
+    def backlog(self):
+        """
+        The number of particles published ahead of the rate, which the driver
+        still has to wait for
+        """
+        self._refill()
+        return max(0.0, -self._tokens)
+
+    def consume(self, count):
+        """
+        Take a token for each particle published, waiting until the bucket is
+        no longer overdrawn
+        @param count The number of particles published
+        """
+        self._refill()
+        if self._ready is None or self._last - self._ready > IDLE_SECONDS:
+            self._start = self._last
+            self._published = 0
+        self._tokens -= count
+        self._published += count
+
+        delay = 0.0
+        if self._tokens < 0:
+            delay = -self._tokens / self._rate
+            log.trace("Published %d particles, %.0f ahead of %.1f/s, waiting %f", count, -self._tokens,
+                      self._rate, delay)
+        self._ready = self._last + delay
+        if delay:
+            self._sleep(delay)
+
+    def _refill(self):
+        """
+        Add the tokens earned since the last refill
+        """
+        now = self._clock()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_checkpoint
+@file mi/dataset/test/test_checkpoint.py
+@author agent
+@brief Test coalescing the particles and state a driver sends to the agent
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+from nose.plugins.attrib import attr
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.checkpoint import CheckpointManager
+
+
+class FakeTimer(object):
+    killed = False
+
+    def __init__(self, seconds, function):
+        self.seconds = seconds
+        self.function = function
+
+    def kill(self, block=True):
+        self.killed = True
+
+
+@attr('UNIT', group='mi')
+class TestCheckpointManager(MiUnitTest):
+    def setUp(self):
+        # everything sent to the agent, in order
+        self.sent = []
+        self.timers = []
+        self.driver_state = {'key_a': {'file_1': {'position': 0}, 'file_2': {'position': 50}},
+                             'key_b': {'file_3': {'position': 0}}}
+
+    def manager(self, particles=None, interval=None):
+        def spawn_later(seconds, function):
+            self.timers.append(FakeTimer(seconds, function))
+            return self.timers[-1]
+        return CheckpointManager(lambda particles: self.sent.append(('data', list(particles))),
+                                 lambda state: self.sent.append(('state', state)),
+                                 lambda **kwargs: self.sent.append(('event', kwargs)),
+                                 lambda exception: self.sent.append(('exception', exception)),
+                                 particles, interval, spawn_later)
+
+    def parse(self, manager, particles, data_key, file_name, position):
+        manager.publish(particles)
+        self.driver_state[data_key][file_name]['position'] = position
+        manager.save(self.driver_state, data_key, file_name)
+
+    def test_pass_through(self):
+        """
+        Test everything is sent straight on without a particle count or interval
+        """
+        manager = self.manager()
+        self.parse(manager, ['p1'], 'key_a', 'file_1', 10)
+        self.assertEqual(self.sent, [('data', ['p1']), ('state', self.driver_state)])
+        self.assertIs(self.sent[1][1], self.driver_state)
+
+    def test_particles(self):
+        """
+        Test particles and state are sent together once enough particles are
+        waiting, and particles published after the last state are held back
+        """
+        manager = self.manager(particles=4)
+        self.parse(manager, ['p1', 'p2'], 'key_a', 'file_1', 10)
+        self.assertEqual(self.sent, [])
+        manager.publish(['p3'])
+        self.parse(manager, ['p4'], 'key_a', 'file_1', 20)
+        self.assertEqual(self.sent, [('data', ['p1', 'p2', 'p3', 'p4']), ('state', self.driver_state)])
+        # the state sent is a copy
+        self.assertIsNot(self.sent[1][1], self.driver_state)
+
+        # an event sends what has a state first, particles without one wait
+        self.parse(manager, ['p5'], 'key_a', 'file_1', 30)
+        manager.publish(['p6'])
+        manager.event(event_type='test')
+        self.assertEqual(self.sent[2:], [('data', ['p5']), ('state', self.driver_state),
+                                         ('event', {'event_type': 'test'})])
+        self.assertEqual(self.sent[3][1]['key_a']['file_1']['position'], 30)
+
+        # stopping drops particles which don't have a state yet
+        manager.discard()
+        self.assertEqual(len(self.sent), 5)
+        self.parse(manager, ['p7', 'p8', 'p9', 'p10'], 'key_a', 'file_1', 40)
+        self.assertEqual(self.sent[5], ('data', ['p7', 'p8', 'p9', 'p10']))
+
+    def test_interval(self):
+        """
+        Test a checkpoint is made once the interval after the first update has passed
+        """
+        manager = self.manager(interval=5)
+        self.parse(manager, ['p1'], 'key_a', 'file_1', 10)
+        self.parse(manager, ['p2'], 'key_b', 'file_3', 10)
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.timers[0].seconds, 5)
+        self.assertEqual(self.sent, [])
+
+        self.timers[0].function()
+        self.assertEqual(self.sent, [('data', ['p1', 'p2']), ('state', self.driver_state)])
+
+        # a flush before the timer goes off stops it
+        self.parse(manager, ['p3'], 'key_a', 'file_1', 20)
+        manager.flush()
+        self.assertTrue(self.timers[1].killed)
+        self.assertEqual(len(self.sent), 4)
+
+    def test_state_copied_on_save(self):
+        """
+        Test the state sent is the state when it was saved, not a state the
+        parser has changed in place since, which the particles sent with it
+        don't cover
+        """
+        manager = self.manager(interval=5)
+        self.parse(manager, ['p1'], 'key_a', 'file_1', 10)
+        manager.publish(['p2'])
+        self.driver_state['key_a']['file_1']['position'] = 20
+
+        self.timers[0].function()
+        self.assertEqual(self.sent, [('data', ['p1']),
+                                     ('state', {'key_a': {'file_1': {'position': 10}, 'file_2': {'position': 50}},
+                                                'key_b': {'file_3': {'position': 0}}})])
+
+        # the same once only changed entries are copied
+        self.parse(manager, ['p3'], 'key_b', 'file_3', 30)
+        self.driver_state['key_b']['file_3']['position'] = 40
+        manager.flush()
+        self.assertEqual(self.sent[2], ('data', ['p2', 'p3']))
+        self.assertEqual(self.sent[3][1]['key_b']['file_3']['position'], 30)
+        self.assertEqual(self.sent[3][1]['key_a']['file_1']['position'], 10)
+
+    def test_changed_entries(self):
+        """
+        Test only the changed entries are copied, and sent checkpoints never change
+        """
+        manager = self.manager(particles=1)
+        self.parse(manager, ['p1'], 'key_a', 'file_1', 10)
+        first = self.sent[-1][1]
+        self.parse(manager, ['p2'], 'key_a', 'file_1', 20)
+        second = self.sent[-1][1]
+
+        self.assertEqual(first['key_a']['file_1']['position'], 10)
+        self.assertEqual(second, self.driver_state)
+        self.assertIs(second['key_b'], first['key_b'])
+        self.assertIs(second['key_a']['file_2'], first['key_a']['file_2'])
+        self.assertIsNot(second['key_a']['file_1'], self.driver_state['key_a']['file_1'])
+
+        # new and removed entries
+        self.driver_state['key_b']['file_4'] = {'position': 0}
+        del self.driver_state['key_a']['file_2']
+        manager.publish(['p3'])
+        manager.save(self.driver_state, 'key_b', 'file_4')
+        self.assertEqual(self.sent[-1][1]['key_b']['file_4'], {'position': 0})
+        self.assertIn('file_2', self.sent[-1][1]['key_a'])
+        manager.publish(['p4'])
+        manager.save(self.driver_state, 'key_a', 'file_2')
+        self.assertEqual(self.sent[-1][1], self.driver_state)
+        self.assertIn('file_2', second['key_a'])
+
+        # a save without keys copies everything
+        self.driver_state['key_c'] = {}
+        manager.publish(['p5'])
+        manager.save(self.driver_state)
+        self.assertEqual(self.sent[-1][1], self.driver_state)
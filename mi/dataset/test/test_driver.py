@@ -7,11 +7,18 @@
 @brief Test code for the dataset driver base classes
 """
 
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
 from nose.plugins.attrib import attr
 
 from mi.core.unit_test import MiUnitTestCase
 from mi.core.exceptions import DataSourceLocationException
-from mi.dataset.dataset_driver import DataSourceLocation
+from mi.dataset.dataset_driver import DataSourceLocation, SimpleDataSetDriver
+from mi.dataset.dataset_driver import DataSourceConfigKey, DataSetDriverConfigKeys, DriverStateKey
+from mi.dataset.test.test_file_reader import LineParser
 
 @attr('UNIT', group='mi')
 class DataSourceLocationUnitTestCase(MiUnitTestCase):
@@ -55,6 +62,95 @@ class DataSourceLocationUnitTestCase(MiUnitTestCase):
         dsl = DataSourceLocation(parser_position=parser_pos1)
         self.assertEqual(dsl.harvester_position, None)
         self.assertEqual(dsl.parser_position, parser_pos1)
-        
-        
-                
\ No newline at end of file
+
+
+class LineDataSetDriver(SimpleDataSetDriver):
+    """
+    Driver parsing files with LineParser, with no harvester
+    """
+    def _build_parser(self, parser_state, infile):
+        return LineParser(self._parser_config, infile, self._save_parser_state, self._data_callback)
+
+    def _build_harvester(self, driver_state):
+        return None
+
+
+@attr('UNIT', group='mi')
+class BatchedIngestUnitTestCase(MiUnitTestCase):
+    """
+    Test records requested in batches are published in batches
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.published = []
+        self.states = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def state_callback(self, state):
+        self.states.append(state)
+
+    def test_parser_batches(self):
+        """
+        Verify records requested together are published in one batch with one
+        state update, and a subclass can reset the record buffer with a list
+        """
+        lines = ['line %d\n' % i for i in range(10)]
+        parser = LineParser({}, StringIO(''.join(lines)),
+                            lambda state, file_ingested: self.states.append((state, file_ingested)),
+                            self.published.append)
+
+        self.assertEqual(parser.get_records(4), lines[:4])
+        self.assertEqual(self.published, [lines[:4]])
+        self.assertEqual(self.states, [(len(''.join(lines[:4])), False)])
+
+        self.assertEqual(parser.get_records(100), lines[4:])
+        self.assertEqual(self.published[-1], lines[4:])
+        self.assertEqual(self.states[-1], (len(''.join(lines)), True))
+
+        parser._record_buffer = [('a', 1), ('b', 2)]
+        self.assertEqual(parser.get_records(1), ['a'])
+        self.assertEqual(len(parser._record_buffer), 1)
+
+    def build_driver(self, driver_config):
+        config = {
+            DataSourceConfigKey.HARVESTER: {
+                DataSetDriverConfigKeys.DIRECTORY: self.directory,
+                DataSetDriverConfigKeys.PATTERN: '*.txt'
+            },
+            DataSourceConfigKey.PARSER: {},
+            DataSourceConfigKey.DRIVER: driver_config
+        }
+        return LineDataSetDriver(config, None, self.published.append, self.state_callback,
+                                 lambda **kwargs: None, self.fail)
+
+    def ingest(self, driver, lines):
+        with open(os.path.join(self.directory, 'data.txt'), 'wb') as filehandle:
+            filehandle.write(''.join(lines))
+        driver._new_file_callback('data.txt')
+        self.states = []
+        driver._poll()
+
+    def test_ingest_batch_size(self):
+        """
+        Verify a driver configured with ingest_batch_size publishes the
+        particles of each batch together, with one state update per batch
+        """
+        lines = ['line %d\n' % i for i in range(10)]
+        driver = self.build_driver({DataSetDriverConfigKeys.INGEST_BATCH_SIZE: 4})
+        self.ingest(driver, lines)
+
+        self.assertEqual(self.published, [lines[:4], lines[4:8], lines[8:]])
+        self.assertEqual(len(self.states), 3)
+        self.assertTrue(self.states[-1]['data.txt'][DriverStateKey.INGESTED])
+
+    def test_default_batch_size(self):
+        """
+        Verify records are published one at a time without ingest_batch_size
+        """
+        lines = ['line %d\n' % i for i in range(3)]
+        driver = self.build_driver({})
+        self.ingest(driver, lines)
+
+        self.assertEqual(self.published, [[line] for line in lines])
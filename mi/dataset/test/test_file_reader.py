@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_file_reader
+@file mi/dataset/test/test_file_reader.py
+@author agent
+@brief Test the memory mapped parser file reader and block loading in
+BufferLoadingParser
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import mmap
+import re
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.plugins.attrib import attr
+from mi.core.unit_test import MiUnitTestCase
+from mi.dataset.file_reader import MappedFileReader
+from mi.dataset.dataset_parser import BufferLoadingParser
+
+LINE_REGEX = re.compile(r'[^\n]*\n')
+
+def line_sieve(raw_data):
+    return [match.span() for match in LINE_REGEX.finditer(raw_data)]
+
+class LineParser(BufferLoadingParser):
+    """
+    Parser with the line as the particle and the end of the line as the state
+    """
+    def __init__(self, config, stream_handle, state_callback, publish_callback):
+        self._position = 0
+        super(LineParser, self).__init__(config, stream_handle, None, line_sieve,
+                                         state_callback, publish_callback)
+
+    def parse_chunks(self):
+        result = []
+        (timestamp, chunk, start, end) = self._chunker.get_next_data_with_index()
+        while chunk is not None:
+            self._position += len(chunk)
+            result.append((chunk, self._position))
+            (timestamp, chunk, start, end) = self._chunker.get_next_data_with_index()
+        return result
+
+@attr('UNIT', group='mi')
+class TestMappedFileReader(MiUnitTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data.txt')
+        self.state = []
+        self.published = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode='wb'):
+        with open(self.path, mode) as filehandle:
+            filehandle.write(data)
+
+    def check_reads(self, stream_handle, mapped):
+        reader = MappedFileReader(stream_handle)
+        self.assertEqual(reader.read(4), '0123')
+        self.assertEqual(stream_handle.tell(), 4)
+        self.assertFalse(reader.at_eof())
+        self.assertEqual(reader._map is not None, mapped)
+
+        # seeks on the stream handle move the reader
+        stream_handle.seek(8)
+        self.assertEqual(reader.read(100), '89')
+        self.assertTrue(reader.at_eof())
+        self.assertEqual(reader.read(1), '')
+
+        stream_handle.seek(2)
+        self.assertEqual(reader.read(), '23456789')
+        reader.close()
+
+    def test_read(self):
+        """
+        Verify regular files are mapped and other streams are read the same way
+        """
+        self.write('0123456789')
+        with open(self.path, 'rb') as stream_handle:
+            self.check_reads(stream_handle, True)
+        self.check_reads(StringIO('0123456789'), False)
+
+    def test_growing_file(self):
+        """
+        Verify data appended to the file after it was mapped is read, including
+        a file that was empty when first read
+        """
+        self.write('')
+        with open(self.path, 'rb') as stream_handle:
+            reader = MappedFileReader(stream_handle)
+            self.assertTrue(reader.at_eof())
+            self.assertEqual(reader.read(10), '')
+
+            self.write('abc', 'ab')
+            self.assertFalse(reader.at_eof())
+            self.assertEqual(reader.read(10), 'abc')
+
+            self.write('def', 'ab')
+            self.assertEqual(reader.read(10), 'def')
+            self.assertIsNotNone(reader._map)
+            reader.close()
+
+    def test_truncated_file(self):
+        """
+        Verify a file truncated while it is being parsed is read up to its new
+        end instead of touching mapped pages past it, which raises SIGBUS
+        """
+        lines = ['line %05d\n' % i for i in range(3 * mmap.PAGESIZE / 10)]
+        self.write(''.join(lines))
+        with open(self.path, 'rb') as stream_handle:
+            parser = LineParser({'block_size': 64}, stream_handle, self.state_callback, self.publish_callback)
+            self.assertEqual(parser.get_records(2), lines[:2])
+            self.assertIsNotNone(parser._reader._map)
+
+            with open(self.path, 'r+b') as filehandle:
+                filehandle.truncate(len(''.join(lines[:10])))
+            records = parser.get_records(len(lines))
+            self.assertEqual(lines[2:2 + len(records)], records)
+            self.assertLessEqual(len(records), 8)
+            self.assertEqual(parser.get_records(1), [])
+
+            # truncated to nothing, then written again
+            with open(self.path, 'r+b') as filehandle:
+                filehandle.truncate(0)
+            stream_handle.seek(0)
+            reader = MappedFileReader(stream_handle)
+            self.assertEqual(reader.read(10), '')
+            self.assertTrue(reader.at_eof())
+            self.write('abc')
+            self.assertEqual(reader.read(10), 'abc')
+            reader.close()
+
+    def state_callback(self, state, file_ingested):
+        self.state.append((state, file_ingested))
+
+    def publish_callback(self, particles):
+        self.published.extend(particles)
+
+    def test_parser_blocks(self):
+        """
+        Verify BufferLoadingParser only reads enough blocks for the records
+        requested, grows the block for records longer than a block, and marks
+        the file ingested with the last records
+        """
+        lines = ['line %d\n' % i for i in range(10)] + ['%s\n' % ('x' * 40)] + ['end\n']
+        self.write(''.join(lines))
+        with open(self.path, 'rb') as stream_handle:
+            parser = LineParser({'block_size': 8}, stream_handle, self.state_callback, self.publish_callback)
+
+            self.assertEqual(parser.get_records(2), lines[:2])
+            self.assertLess(stream_handle.tell(), len(''.join(lines)))
+            self.assertEqual(self.state[-1], (len(''.join(lines[:2])), False))
+
+            self.assertEqual(parser.get_records(9), lines[2:11])
+            self.assertGreater(parser._block_size, 8)
+            self.assertEqual(parser.get_records(5), lines[11:])
+            self.assertEqual(self.state[-1], (len(''.join(lines)), True))
+            self.assertEqual(parser.get_records(1), [])
+
+        # the same records when the whole file fits in the first block
+        self.state = []
+        parser = LineParser({}, StringIO(''.join(lines)), self.state_callback, self.publish_callback)
+        self.assertEqual(parser.get_records(20), lines)
+        self.assertEqual(self.state, [(len(''.join(lines)), True)])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_fingerprint
+@file mi/dataset/test/test_fingerprint.py
+@author agent
+@brief Test the streaming, cached file checksums
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+from mock import patch
+from nose.plugins.attrib import attr
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.fingerprint import FingerprintCache
+
+# the md5 constructor, which the tests patch
+new_md5 = hashlib.md5
+
+class CountingMd5(object):
+    """
+    md5 which counts the bytes hashed through it
+    """
+    bytes_hashed = 0
+
+    def __init__(self, md5=None):
+        self._md5 = md5 or new_md5()
+
+    def update(self, data):
+        CountingMd5.bytes_hashed += len(data)
+        self._md5.update(data)
+
+    def copy(self):
+        return CountingMd5(self._md5.copy())
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+@attr('UNIT', group='mi')
+class TestFingerprintCache(MiUnitTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data.bin')
+        self.cache = FingerprintCache(max_entries=2, block_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode='ab', mod_time=None):
+        with open(self.path, mode) as filehandle:
+            filehandle.write(data)
+        if mod_time is not None:
+            os.utime(self.path, (mod_time, mod_time))
+
+    def checksum(self):
+        """
+        Get the checksum from the cache, verifying it matches the md5 of the whole file
+        @retval number of bytes md5 hashed to compute the checksum
+        """
+        CountingMd5.bytes_hashed = 0
+        with patch('mi.dataset.fingerprint.hashlib.md5', CountingMd5):
+            checksum = self.cache.md5_checksum(self.path)
+        with open(self.path, 'rb') as filehandle:
+            self.assertEqual(checksum, hashlib.md5(filehandle.read()).hexdigest())
+        return CountingMd5.bytes_hashed
+
+    def test_checksum(self):
+        """
+        Verify unchanged files are not hashed again, appended files only have the new
+        bytes hashed, and rewritten files are hashed in full
+        """
+        self.write(os.urandom(200000), 'wb', 1000)
+        self.assertGreaterEqual(self.checksum(), 200000)
+        self.assertEqual(self.checksum(), 0)
+
+        # append, only the new data is hashed
+        self.write(os.urandom(5000), mod_time=1001)
+        self.assertEqual(self.checksum(), 5000)
+
+        # rewrite the start of the file, the cached checksum is used while the
+        # size and time are the same, as the harvesters only compare checksums
+        # after the size or time changes
+        previous = self.cache.md5_checksum(self.path)
+        with open(self.path, 'r+b') as filehandle:
+            filehandle.write('rewritten')
+        os.utime(self.path, (1001, 1001))
+        self.assertEqual(self.cache.md5_checksum(self.path), previous)
+        # a new time finds the rewrite
+        os.utime(self.path, (1002, 1002))
+        self.assertGreaterEqual(self.checksum(), 205000)
+
+        # rewrite the end of the file then append
+        with open(self.path, 'r+b') as filehandle:
+            filehandle.seek(204990)
+            filehandle.write('rewritten')
+        self.write('more data', mod_time=1003)
+        self.assertGreaterEqual(self.checksum(), 205000)
+
+        # rewrite the middle of the file then append
+        with open(self.path, 'r+b') as filehandle:
+            filehandle.seek(100000)
+            filehandle.write('rewritten')
+        self.write('more data', mod_time=1004)
+        self.assertGreaterEqual(self.checksum(), 205000)
+
+        # a file that was truncated and refilled to a larger size
+        self.write(os.urandom(300000), 'wb', 1005)
+        self.assertGreaterEqual(self.checksum(), 300000)
+
+        # empty and small files can be appended to
+        self.write('', 'wb', 1006)
+        self.checksum()
+        self.write('a', mod_time=1007)
+        self.checksum()
+        self.write('b', mod_time=1008)
+        self.checksum()
+
+    def test_max_entries(self):
+        """
+        Verify the least recently used fingerprints are dropped
+        """
+        paths = [os.path.join(self.directory, name) for name in ['a', 'b', 'c']]
+        for path in paths:
+            with open(path, 'wb') as filehandle:
+                filehandle.write(path)
+            self.cache.md5_checksum(path)
+
+        self.assertEqual(len(self.cache._fingerprints), 2)
+        stat = os.stat(paths[0])
+        self.assertNotIn((stat.st_dev, stat.st_ino), self.cache._fingerprints)
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache._fingerprints), 0)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_ingest_pool
+@file mi/dataset/test/test_ingest_pool.py
+@author agent
+@brief Test code for parsing files in ingest worker processes
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+import os
+import re
+import json
+import cPickle
+import shutil
+import tempfile
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTestCase
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.dataset.dataset_driver import DataSourceConfigKey, DataSetDriverConfigKeys, DriverStateKey
+from mi.dataset.ingest_pool import IngestPool, write_message, read_message
+from mi.dataset.driver.mflm.flort.driver import MflmFLORTDDataSetDriver, DataSourceKey
+
+RESOURCE_PATH = os.path.join('mi', 'dataset', 'driver', 'mflm', 'flort', 'resource')
+TELEMETERED = DataSourceKey.FLORT_DJ_SIO_TELEMETERED
+
+
+@attr('UNIT', group='mi')
+class IngestPoolUnitTestCase(MiUnitTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(RESOURCE_PATH, 'node59p1_all_good.dat'),
+                    os.path.join(self.directory, 'node59p1.dat'))
+        self.config = {
+            DataSourceConfigKey.HARVESTER: {
+                TELEMETERED: {
+                    DataSetDriverConfigKeys.DIRECTORY: self.directory,
+                    DataSetDriverConfigKeys.PATTERN: 'node59p1.dat',
+                }
+            },
+            DataSourceConfigKey.PARSER: {TELEMETERED: {}},
+            DataSourceConfigKey.DRIVER: {DataSetDriverConfigKeys.INGEST_BATCH_SIZE: 2}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, pool_processes=None):
+        """
+        Parse the test file with the flort driver
+        @retval The particles, parser states and events from the driver
+        """
+        particles = []
+        states = []
+        events = []
+        driver = MflmFLORTDDataSetDriver(self.config, None, particles.extend,
+                                         lambda state: states.append(json.dumps(state[TELEMETERED]['node59p1.dat'])),
+                                         lambda **kwargs: events.append(kwargs['event_type']),
+                                         events.append)
+        if pool_processes:
+            driver._ingest_pool = IngestPool(driver, pool_processes, self.config)
+        try:
+            driver._driver_state[TELEMETERED]['node59p1.dat'] = {DriverStateKey.PARSER_STATE: None}
+            driver._file_in_process[TELEMETERED] = 'node59p1.dat'
+            driver._get_parser_results('node59p1.dat', TELEMETERED)
+        finally:
+            if driver._ingest_pool:
+                driver._ingest_pool.close()
+        return (particles, states, events)
+
+    def test_messages(self):
+        """
+        Test messages, including regex matches held by particles, are read back
+        """
+        match = re.compile(r'(\d+),(\d+)').search('abc 12,34 def')
+        (read_fd, write_fd) = os.pipe()
+        with os.fdopen(write_fd, 'wb') as stream:
+            write_message(stream, ('data', [match, {'a': 1}]))
+        try:
+            (message_type, (sent_match, value)) = read_message(read_fd)
+        finally:
+            os.close(read_fd)
+        self.assertEqual(message_type, 'data')
+        self.assertEqual(sent_match.groups(), ('12', '34'))
+        self.assertEqual(sent_match.span(), (4, 9))
+        self.assertEqual(value, {'a': 1})
+
+        # only messages pickle matches, pickling elsewhere in the process is unchanged
+        self.assertRaises(TypeError, cPickle.dumps, match, cPickle.HIGHEST_PROTOCOL)
+
+    def test_parse(self):
+        """
+        Test a file parsed in a worker gives the same particles and state as parsing it in the driver
+        """
+        (particles, states, events) = self.parse()
+        (pool_particles, pool_states, pool_events) = self.parse(2)
+
+        self.assertEqual(len(particles), 3)
+        self.assertEqual([particle.generate_dict()[DataParticleKey.VALUES] for particle in pool_particles],
+                         [particle.generate_dict()[DataParticleKey.VALUES] for particle in particles])
+        self.assertEqual(pool_states, states)
+        self.assertEqual(pool_events, events)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_publish_rate
+@file mi/dataset/test/test_publish_rate.py
+@author agent
+@brief Test the token bucket used to pace published particles
+"""
+
+__author__ = 'agent'
+__license__ = 'Apache 2.0'
+
+from nose.plugins.attrib import attr
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.publish_rate import PublishRate
+
+
+class FakeClock(object):
+    """
+    Clock which only moves when told to, or when sleeping
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@attr('UNIT', group='mi')
+class TestPublishRate(MiUnitTest):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def publish_rate(self, rate, burst=1):
+        return PublishRate(rate, burst, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_rate(self):
+        """
+        Test the rate over time is the configured rate, with the time spent
+        parsing counted towards the wait
+        """
+        publish_rate = self.publish_rate(60)
+        start = self.clock.now
+        for i in xrange(600):
+            # parsing a record takes 10ms
+            self.clock.now += 0.01
+            publish_rate.consume(1)
+        # the first record is published from the full bucket
+        self.assertAlmostEqual(self.clock.now - start, 0.01 + 599 / 60.0)
+        self.assertAlmostEqual(publish_rate.achieved_rate, 60.0, delta=0.2)
+        self.assertEqual(publish_rate.published, 600)
+        self.assertAlmostEqual(publish_rate.backlog, 0.0)
+
+    def test_slow_parser(self):
+        """
+        Test a parser slower than the rate is never made to wait
+        """
+        publish_rate = self.publish_rate(10, burst=3)
+        for i in xrange(20):
+            self.clock.now += 0.5
+            publish_rate.consume(3)
+        self.assertEqual(self.clock.slept, [])
+        self.assertAlmostEqual(publish_rate.achieved_rate, 60 / 9.5)
+
+    def test_burst(self):
+        """
+        Test a burst is published without waiting after the driver is idle,
+        then the driver waits for anything over the burst
+        """
+        publish_rate = self.publish_rate(10, burst=5)
+        publish_rate.consume(5)
+        self.assertEqual(self.clock.slept, [])
+        publish_rate.consume(5)
+        self.assertEqual(len(self.clock.slept), 1)
+        self.assertAlmostEqual(self.clock.slept[0], 0.5)
+
+        # idle long enough to refill the bucket and start a new run
+        self.clock.now += 10
+        publish_rate.consume(5)
+        self.assertEqual(len(self.clock.slept), 1)
+        self.assertEqual(publish_rate.published, 5)
+
+    def test_backlog(self):
+        """
+        Test the backlog is the number of particles published ahead of the rate
+        """
+        publish_rate = PublishRate(4, clock=self.clock.time, sleep=lambda seconds: None)
+        publish_rate.consume(9)
+        self.assertAlmostEqual(publish_rate.backlog, 8.0)
+        self.clock.now += 1
+        self.assertAlmostEqual(publish_rate.backlog, 4.0)
+        self.clock.now += 2
+        self.assertAlmostEqual(publish_rate.backlog, 0.0)
+
+        self.assertRaises(ValueError, PublishRate, 0)
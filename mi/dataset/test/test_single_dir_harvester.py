@@ -15,8 +15,10 @@ import hashlib
 
 from mi.core.log import get_logger ; log = get_logger()
 from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
 from mi.core.unit_test import MiUnitTest
-from mi.dataset.harvester import SingleDirectoryHarvester
+from mi.dataset.harvester import SingleDirectoryHarvester, TimerWheel
+from mi.core.inotify import inotify_available
 from mi.dataset.dataset_driver import DriverStateKey, DataSetDriverConfigKeys
 
 TESTDIR = '/tmp/dsatest'
@@ -34,6 +36,43 @@ INDICIES = ['363_2013_0245_6_8', '363_2013_0245_6_9', '363_2013_0245_6_10', '363
             '363_2013_0245_7_0', '363_2013_0245_7_1', '363_2013_0245_7_10', '363_2013_0246_0_0',
             '363_2013_0246_7_0', '363_2013_0246_7_1', '363_2014_0012_0_0', '363_2014_0012_0_1', ]
 
+@attr('UNIT', group='mi')
+class TestTimerWheel(MiUnitTest):
+    def test_pop_due(self):
+        """
+        Keys come out of the wheel once their deadline has passed, including deadlines
+        more than a revolution away and deadlines already passed when scheduled
+        """
+        wheel = TimerWheel(size=8)
+        self.assertEqual(wheel.pop_due(100.0), [])
+
+        wheel.schedule('a', 101.5)
+        wheel.schedule('b', 103.0)
+        wheel.schedule('c', 120.0)
+        self.assertEqual(len(wheel), 3)
+        self.assertIn('a', wheel)
+
+        self.assertEqual(wheel.pop_due(101.9), [])
+        self.assertEqual(wheel.pop_due(102.0), ['a'])
+        self.assertEqual(wheel.pop_due(103.0), ['b'])
+
+        # rescheduling replaces the old deadline
+        wheel.schedule('b', 104.0)
+        wheel.schedule('b', 106.0)
+        self.assertEqual(wheel.pop_due(105.0), [])
+        # deadline already passed is due at the next collection
+        wheel.schedule('d', 90.0)
+        self.assertEqual(sorted(wheel.pop_due(106.0)), ['b', 'd'])
+
+        wheel.schedule('e', 110.0)
+        wheel.cancel('e')
+        self.assertNotIn('e', wheel)
+
+        # 'c' is more than a revolution past 'a', skip ahead past it
+        self.assertEqual(wheel.pop_due(119.0), [])
+        self.assertEqual(wheel.pop_due(150.0), ['c'])
+        self.assertEqual(len(wheel), 0)
+
 @attr('INT', group='eoi')
 class TestSingleDirHarvester(MiUnitTest):
     found_file_count = 0
@@ -386,6 +425,35 @@ class TestSingleDirHarvester(MiUnitTest):
                                                          self.modified_files_found_callback,
                                                          self.file_exception_callback))
 
+    def test_harvester_inotify_settle(self):
+        """
+        Verify that with inotify a file still being written is not found until it has
+        not been modified for the file mod wait time
+        """
+        if not inotify_available():
+            raise SkipTest("inotify is not available")
+
+        config = CONFIG.copy()
+        config[DataSetDriverConfigKeys.FREQUENCY] = 1
+        config[DataSetDriverConfigKeys.FILE_MOD_WAIT_TIME] = 3
+        file_harvester = SingleDirectoryHarvester(config, None,
+                                                  self.new_file_found_callback,
+                                                  self.modified_files_found_callback,
+                                                  self.file_exception_callback)
+        file_harvester.start()
+
+        # keep appending to the file for longer than the mod wait time
+        next_file = TESTDIR + '/unit_' + INDICIES[0] + CONFIG[DataSetDriverConfigKeys.PATTERN].replace('*', '')
+        for i in range(0, 6):
+            with open(next_file, 'a') as filehandle:
+                filehandle.write('data %d\n' % i)
+            time.sleep(1)
+            self.assertEqual(self.found_file_count, 0)
+
+        self.wait_for_file(0, 1, 10)
+        self.assertEqual(self.found_file_count, 1)
+        file_harvester.shutdown()
+
     def test_harvester_1000(self):
         """
         The harvester is taking a really long time to run, find out how long for 1000 files
@@ -422,7 +490,7 @@ class TestSingleDirHarvester(MiUnitTest):
         """
         self.found_file_count += 1
 
-    def modified_files_found_callback(self):
+    def modified_files_found_callback(self, modified_state):
         """
         Callback when a new file is found by the harvester.  This should pass the file
         to the parser, but from this test we don't have the parser, so just close the file. 
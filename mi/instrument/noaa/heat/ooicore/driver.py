@@ -452,6 +452,7 @@ class Protocol(CommandResponseInstrumentProtocol):
         self._linebuf += data
         self._promptbuf += data
         self._last_data_timestamp = time.time()
+        self._buffer_updated(data)
 
     def _got_chunk(self, chunk, timestamp):
         """
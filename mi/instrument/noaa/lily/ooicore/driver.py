@@ -960,6 +960,7 @@ class Protocol(CommandResponseInstrumentProtocol):
         promptbuf_mutex.release()
 
         self._last_data_timestamp = time.time()
+        self._buffer_updated(data)
 
     ########################################################################
     # Incomming data (for parsing) callback.